@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+''' Websocket de-duplication under a long stream of unique MessageIds: time per message and
+    resident memory, for RecentIds and for the unbounded set it replaced.
+
+    python benchmarks/recent_ids.py [--messages 10000000] [--set]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from jellyfin_apiclient_python.ws_client import RecentIds  # noqa: E402
+
+
+def rss_mb():
+
+    ''' Current (not peak) resident set size, Linux only.
+    '''
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024.0
+
+
+class UnboundedIds(object):
+
+    def __init__(self):
+        self.ids = set()
+
+    def seen(self, message_id):
+
+        if message_id in self.ids:
+            return True
+
+        self.ids.add(message_id)
+
+        return False
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=10000000)
+    parser.add_argument('--capacity', type=int, default=4096)
+    parser.add_argument('--window', type=float, default=600)
+    parser.add_argument('--set', action='store_true', help="measure the unbounded set instead")
+    args = parser.parse_args()
+
+    ids = UnboundedIds() if args.set else RecentIds(args.capacity, args.window)
+    step = max(1, args.messages // 10)
+    started = time.time()
+    print("%12s %10s %10s" % ("messages", "us/msg", "rss MB"))
+
+    for count in range(1, args.messages + 1):
+        ids.seen("%032x" % count)
+
+        if count % step == 0:
+            print("%12d %10.2f %10.1f" % (count, (time.time() - started) * 1e6 / count, rss_mb()))
+
+
+if __name__ == '__main__':
+    main()
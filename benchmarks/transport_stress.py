@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+''' Throughput of the shared HTTP transport against a local server answering after --delay seconds,
+    for growing thread counts in both session modes, then stop_session() called repeatedly while
+    requests are running. --max-in-flight and --rate-limit put the per server limiter in the path.
+
+    python benchmarks/transport_stress.py [--delay 0.02] [--pool-maxsize 8] [--max-in-flight 0]
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from jellyfin_apiclient_python import JellyfinClient  # noqa: E402
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+
+        time.sleep(self.server.delay)
+        body = json.dumps({'Id': self.path.rsplit('/', 1)[-1], 'Name': "Item"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_client(url, args, mode):
+
+    client = JellyfinClient(allow_multiple_clients=True)
+    client.config.app('benchmark', '1.0', 'benchmark', 'benchmark-device')
+    client.config.auth(url, 'u1', 't1', False)
+    client.config.data['auth.server-id'] = 's1'
+    client.config.data['http.session_mode'] = mode
+    client.config.data['http.pool_maxsize'] = args.pool_maxsize
+    client.config.data['http.max_in_flight'] = args.max_in_flight
+    client.config.data['http.rate_limit'] = args.rate_limit
+
+    return client
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delay', type=float, default=0.02)
+    parser.add_argument('--pool-maxsize', type=int, default=8)
+    parser.add_argument('--max-in-flight', type=int, default=0)
+    parser.add_argument('--rate-limit', type=float, default=0)
+    parser.add_argument('--requests', type=int, default=20, help="requests per thread")
+    parser.add_argument('--threads', default="1,2,4,8,16")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.delay = args.delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    for mode in ("shared", "thread"):
+        client = make_client(url, args, mode)
+
+        for threads in [int(x) for x in args.threads.split(',')]:
+            count = threads * args.requests
+            started = time.time()
+
+            with ThreadPoolExecutor(threads) as executor:
+                list(executor.map(lambda x: client.jellyfin.get_item('%032x' % x), range(count)))
+
+            print("%-6s %3d threads %8.0f req/s" % (mode, threads, count / (time.time() - started)))
+
+        errors = []
+
+        def work(index):
+            try:
+                client.jellyfin.get_item('%032x' % index)
+            except Exception as error:
+                errors.append(error)
+
+        with ThreadPoolExecutor(8) as executor:
+            futures = [executor.submit(work, index) for index in range(400)]
+
+            for _ in range(20):
+                time.sleep(0.01)
+                client.http.stop_session()
+
+            for future in futures:
+                future.result()
+
+        print("%-6s %d errors while stop_session() ran 20 times under load" % (mode, len(errors)))
+        client.http.stop_session()
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,19 @@
 from __future__ import division, absolute_import, print_function, unicode_literals
 from datetime import datetime
 import re
-import requests
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .artwork import ArtworkCache
+from .batching import DEFAULT_WINDOW, MAX_IDS_LENGTH, ItemLoader
+from .downloader import Download
+from .exceptions import HTTPException
+from .streaming import map_file
+from .request_log import LazyJSON
 
 LOG = logging.getLogger('JELLYFIN.' + __name__)
+DEFAULT_PAGE_SIZE = 200
 
 
 def jellyfin_url(client, handler):
@@ -40,6 +48,9 @@ class API(object):
 
     ''' All the api calls to the server.
     '''
+    item_loader = None
+    artwork_cache = None
+
     def __init__(self, client, *args, **kwargs):
         self.client = client
         self.config = client.config
@@ -53,10 +64,10 @@ class API(object):
     def _http_stream(self, action, url, dest_file, request={}):
         request.update({'type': action, 'handler': url})
 
-        self.client.request(request, dest_file=dest_file)
+        return self.client.request(request, dest_file=dest_file)
 
-    def _get(self, handler, params=None):
-        return self._http("GET", handler, {'params': params})
+    def _get(self, handler, params=None, cache=False):
+        return self._http("GET", handler, {'params': params, 'cache': cache})
 
     def _post(self, handler, json=None, params=None):
         return self._http("POST", handler, {'params': params, 'json': json})
@@ -65,7 +76,7 @@ class API(object):
         return self._http("DELETE", handler, {'params': params})
 
     def _get_stream(self, handler, dest_file, params=None):
-        self._http_stream("GET", handler, dest_file, {'params': params})
+        return self._http_stream("GET", handler, dest_file, {'params': params})
 
     #################################################################################################
 
@@ -84,30 +95,30 @@ class API(object):
         else:
             return self._get("Sessions%s" % handler, params)
 
-    def users(self, handler="", action="GET", params=None, json=None):
+    def users(self, handler="", action="GET", params=None, json=None, cache=False):
         if action == "POST":
             return self._post("Users/{UserId}%s" % handler, json, params)
         elif action == "DELETE":
             return self._delete("Users/{UserId}%s" % handler, params)
         else:
-            return self._get("Users/{UserId}%s" % handler, params)
+            return self._get("Users/{UserId}%s" % handler, params, cache)
 
-    def items(self, handler="", action="GET", params=None, json=None):
+    def items(self, handler="", action="GET", params=None, json=None, cache=False):
         if action == "POST":
             return self._post("Items%s" % handler, json, params)
         elif action == "DELETE":
             return self._delete("Items%s" % handler, params)
         else:
-            return self._get("Items%s" % handler, params)
+            return self._get("Items%s" % handler, params, cache)
 
-    def user_items(self, handler="", params=None):
-        return self.users("/Items%s" % handler, params=params)
+    def user_items(self, handler="", params=None, cache=False):
+        return self.users("/Items%s" % handler, params=params, cache=cache)
 
-    def shows(self, handler, params):
-        return self._get("Shows%s" % handler, params)
+    def shows(self, handler, params, cache=False):
+        return self._get("Shows%s" % handler, params, cache)
 
-    def videos(self, handler):
-        return self._get("Videos%s" % handler)
+    def videos(self, handler, cache=False):
+        return self._get("Videos%s" % handler, cache=cache)
 
     def artwork(self, item_id, art, max_width, ext="jpg", index=None):
         if index is None:
@@ -115,6 +126,28 @@ class API(object):
 
         return jellyfin_url(self.client, "Items/%s/Images/%s/%s?MaxWidth=%s&format=%s" % (item_id, art, index, max_width, ext))
 
+    def enable_artwork_cache(self, path, max_bytes=None, workers=None):
+        ''' Keep fetched images on disk under path, see artwork.ArtworkCache.
+        '''
+        options = dict((key, value) for key, value in (('max_bytes', max_bytes), ('workers', workers)) if value)
+        self.artwork_cache = ArtworkCache(self, path, **options)
+
+        return self.artwork_cache
+
+    def get_artwork(self, item_id, art, max_width, ext="jpg", index=None, tag=None):
+        ''' Local path of the image, through the artwork cache.
+        '''
+        if self.artwork_cache is None:
+            raise ValueError("Artwork cache is not enabled, call enable_artwork_cache first.")
+
+        return self.artwork_cache.get(item_id, art, max_width, ext, index, tag)
+
+    def prefetch_artwork(self, items, art="Primary", max_width=None, ext="jpg"):
+        if self.artwork_cache is None:
+            raise ValueError("Artwork cache is not enabled, call enable_artwork_cache first.")
+
+        return self.artwork_cache.prefetch(items, art, max_width, ext)
+
     #################################################################################################
 
     # More granular api
@@ -128,7 +161,7 @@ class API(object):
         return self._get("Users/Public")
 
     def get_user(self, user_id=None):
-        return self.users() if user_id is None else self._get("Users/%s" % user_id)
+        return self.users(cache=True) if user_id is None else self._get("Users/%s" % user_id, cache=True)
 
     def get_user_settings(self, client="emby"):
         return self._get("DisplayPreferences/usersettings", params={
@@ -137,19 +170,116 @@ class API(object):
         })
 
     def get_views(self):
-        return self.users("/Views")
+        return self.users("/Views", cache=True)
 
     def get_media_folders(self):
         return self.users("/Items")
 
     def get_item(self, item_id):
-        return self.users("/Items/%s" % item_id)
+        if self.item_loader is not None:
+            return self.item_loader.get(item_id)
+
+        return self.users("/Items/%s" % item_id, cache=True)
+
+    def enable_item_batching(self, window=DEFAULT_WINDOW, max_ids_length=MAX_IDS_LENGTH):
+        ''' Merge get_item calls made within window seconds into get_items requests.
+        '''
+        self.item_loader = ItemLoader(self, window, max_ids_length)
+
+        return self.item_loader
+
+    def disable_item_batching(self):
+        if self.item_loader is not None:
+            self.item_loader.dispatch()
+
+        self.item_loader = None
 
     def get_items(self, item_ids):
         return self.users("/Items", params={
             'Ids': ','.join(str(x) for x in item_ids),
             'Fields': info()
-        })
+        }, cache=True)
+
+    def _item_pages(self, params):
+        # Split Users/{UserId}/Items params into the query, first index and overall limit.
+        params = dict(params or {})
+        start = int(params.pop('StartIndex', None) or 0)
+        limit = params.pop('Limit', None)
+
+        return params, start, limit
+
+    def _page_result(self, result, start, strict):
+
+        if result is None and strict:
+            raise HTTPException("IncompletePage", "The items page starting at %s failed" % start)
+
+        return result or {}
+
+    def _more_pages(self, items, size, start, total, limit):
+        # Servers may answer a short page before the end (capped page size, filtered items),
+        # so a known total is trusted over the page length; an empty page always ends it.
+        if not items or limit == 0:
+            return False
+
+        if total is None:
+            return len(items) == size
+
+        return start < total
+
+    def _page_request(self, params, start, limit, page_size):
+        if limit is not None:
+            page_size = min(page_size, limit)
+
+        return dict(params, StartIndex=start, Limit=page_size), page_size
+
+    def iter_items(self, params=None, page_size=DEFAULT_PAGE_SIZE, handler="", strict=False):
+        ''' Yield the items of a Users/{UserId}/Items query one at a time, requesting page_size
+            items per call. Page N+1 is fetched in the background while page N is consumed,
+            so at most two pages are held in memory. A Limit in params caps the total.
+            strict: raise when a page request fails (HTTP returns None on a 500) instead of ending early.
+
+            for item in api.iter_items({'ParentId': view_id, 'Recursive': True, 'Fields': info()}):
+        '''
+        params, start, limit = self._item_pages(params)
+
+        def fetch(start, limit):
+            page, size = self._page_request(params, start, limit, page_size)
+            return self._page_result(self.user_items(handler, page), start, strict), size
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(fetch, start, limit)
+
+            while pending is not None:
+                result, size = pending.result()
+                items = result.get('Items') or []
+                start += len(items)
+
+                if limit is not None:
+                    limit -= len(items)
+
+                total = result.get('TotalRecordCount')
+                more = self._more_pages(items, size, start, total, limit)
+                pending = executor.submit(fetch, start, limit) if more else None
+                result = None
+
+                for item in items:
+                    yield item
+
+    def stream_items(self, params=None, handler=""):
+        ''' Users/{UserId}/Items query decoded from the socket one item at a time.
+            Returns an ItemStream; TotalRecordCount is in its metadata once iteration is done.
+        '''
+        return self._http("GET", "Users/{UserId}/Items%s" % handler, {'params': params, 'stream_items': True})
+
+    def crawl(self, roots=None, workers=None, progress=None, page_size=DEFAULT_PAGE_SIZE):
+        ''' Breadth first walk of the libraries below roots (the user views by default) on a pool of
+            workers, yielding items as they arrive. See crawler.Crawler.
+        '''
+        from .crawler import Crawler  # crawler reads DEFAULT_PAGE_SIZE from this module
+
+        options = dict((key, value) for key, value in (('workers', workers),) if value)
+
+        return Crawler(self, progress=progress, fields=info(), page_size=page_size, **options).crawl(roots)
 
     def get_sessions(self):
         return self.sessions(params={'ControllableByUserId': "{UserId}"})
@@ -161,7 +291,7 @@ class API(object):
         return self.sessions("/%s/%s" % (session_id, url), "POST", params, data)
 
     def get_images(self, item_id):
-        return self.items("/%s/Images" % item_id)
+        return self.items("/%s/Images" % item_id, cache=True)
 
     def get_suggestion(self, media="Movie,Episode", limit=1):
         return self.users("/Suggestions", params={
@@ -190,20 +320,20 @@ class API(object):
             'UserId': "{UserId}",
             'AdjacentTo': item_id,
             'Fields': "Overview"
-        })
+        }, cache=True)
 
     def get_season(self, show_id, season_id):
         return self.shows("/%s/Episodes" % show_id, {
             'UserId': "{UserId}",
             'SeasonId': season_id
-        })
+        }, cache=True)
 
     def get_genres(self, parent_id=None):
         return self._get("Genres", {
             'ParentId': parent_id,
             'UserId': "{UserId}",
             'Fields': info()
-        })
+        }, cache=True)
 
     def get_recommendation(self, parent_id=None, limit=20):
         return self._get("Movies/Recommendations", {
@@ -238,16 +368,16 @@ class API(object):
         })
 
     def get_intros(self, item_id):
-        return self.user_items("/%s/Intros" % item_id)
+        return self.user_items("/%s/Intros" % item_id, cache=True)
 
     def get_additional_parts(self, item_id):
-        return self.videos("/%s/AdditionalParts" % item_id)
+        return self.videos("/%s/AdditionalParts" % item_id, cache=True)
 
     def delete_item(self, item_id):
         return self.items("/%s" % item_id, "DELETE")
 
     def get_local_trailers(self, item_id):
-        return self.user_items("/%s/LocalTrailers" % item_id)
+        return self.user_items("/%s/LocalTrailers" % item_id, cache=True)
 
     def get_transcode_settings(self):
         return self._get('System/Configuration/encoding')
@@ -255,7 +385,7 @@ class API(object):
     def get_ancestors(self, item_id):
         return self.items("/%s/Ancestors" % item_id, params={
             'UserId': "{UserId}"
-        })
+        }, cache=True)
 
     def get_items_theme_video(self, parent_id):
         return self.users("/Items", params={
@@ -267,7 +397,7 @@ class API(object):
         return self.items("/%s/ThemeMedia" % item_id, params={
             'UserId': "{UserId}",
             'InheritFromParent': True
-        })
+        }, cache=True)
 
     def get_items_theme_song(self, parent_id):
         return self.users("/Items", params={
@@ -290,7 +420,7 @@ class API(object):
             'UserId': "{UserId}",
             'EnableImages': True,
             'Fields': info()
-        })
+        }, cache=True)
 
     def get_date_modified(self, date, parent_id, media=None):
         return self.users("/Items", params={
@@ -314,6 +444,16 @@ class API(object):
             'Fields': info()
         })
 
+    def get_recursive_date_modified(self, date, parent_id=None, media=None):
+        return self.users("/Items", params={
+            'ParentId': parent_id,
+            'Recursive': True,
+            'IncludeItemTypes': media or None,
+            'MinDateLastSaved': date,
+            'EnableImages': False,
+            'EnableUserData': False
+        })
+
     def refresh_item(self, item_id):
         return self.items("/%s/Refresh" % item_id, "POST", json={
             'Recursive': True,
@@ -391,7 +531,7 @@ class API(object):
         })
 
     def get_audio_stream(self, dest_file, item_id, play_id, container, max_streaming_bitrate=140000000, audio_codec=None):
-        self._get_stream("Audio/%s/universal" % item_id, dest_file, params={
+        return self._get_stream("Audio/%s/universal" % item_id, dest_file, params={
             'UserId': "{UserId}",
             'DeviceId': "{DeviceId}",
             'PlaySessionId': play_id,
@@ -399,6 +539,44 @@ class API(object):
             'AudioCodec': audio_codec
         })
 
+    def download(self, handler, path, params=None, **options):
+
+        ''' Resumable parallel download of handler into path, see downloader.Download for the options:
+            workers, chunk_size, rate_limit (bytes per second), progress, retries.
+        '''
+        return Download(self, handler, path, params, **options).run()
+
+    def download_item(self, item_id, path, **options):
+        return self.download("Items/%s/Download" % item_id, path, **options)
+
+    def iter_stream(self, handler, params=None):
+
+        ''' Generator of memoryviews over the response body, all sharing one buffer
+            (Config.http(stream_buffer_size=)). Consume each view before asking for the next.
+        '''
+        return self._http("GET", handler, {'params': params, 'stream_views': True})
+
+    def download_mapped(self, handler, path, params=None):
+
+        ''' Read the body straight into a memory mapped file of the announced size.
+            Content encoded bodies have no known decoded size and are written to the file instead.
+        '''
+        headers = self._http("HEAD", handler, {'params': params}) or {}
+        size = int(headers.get('Content-Length') or 0)
+        encoding = headers.get('Content-Encoding', "identity").strip().lower()
+
+        if not size or encoding not in ("", "identity"):
+            with open(path, 'wb') as dest_file:
+                return self._get_stream(handler, dest_file, params)
+
+        target = map_file(path, size)
+
+        try:
+            self._get_stream(handler, target, params)
+            target.flush()
+        finally:
+            target.close()
+
     def get_default_headers(self):
         auth = "MediaBrowser "
         auth += "Client=%s, " % self.config.data['app.name']
@@ -416,8 +594,14 @@ class API(object):
             "x-emby-authorization": auth
         }
 
+    def _session(self):
+        # The API is built on either the HTTP object or the JellyfinClient that owns it.
+        http = getattr(self.client, 'http', self.client)
+
+        return http.get_session()
+
     def send_request(self, url, path, method="get", timeout=None, headers=None, data=None, session=None):
-        request_method = getattr(session or requests, method.lower())
+        request_method = getattr(session or self._session(), method.lower())
         url = "%s/%s" % (url, path)
         request_settings = {
             "timeout": timeout or self.default_timeout,
@@ -431,7 +615,7 @@ class API(object):
 
         LOG.info("Sending %s request to %s" % (method, path))
         LOG.debug(request_settings['timeout'])
-        LOG.debug(request_settings['headers'])
+        LOG.debug("%s", LazyJSON(request_settings['headers']))
 
         return request_method(url, **request_settings)
 
@@ -456,7 +640,7 @@ class API(object):
             else:
                 LOG.error("Failed to login to server with status code: " + str(response.status_code))
                 LOG.error("Server Response:\n" + str(response.content))
-                LOG.debug(headers)
+                LOG.debug("%s", LazyJSON(headers))
 
                 return {}
         except Exception as e: # Find exceptions for likely cases i.e, server timeout, etc
@@ -501,9 +685,8 @@ class API(object):
     def utc_time(self):
         # Measure time as close to the call as is possible.
         server_address = self.config.data.get("auth.server")
-        session = self.client.session
-        
-        response = self.send_request(server_address, "GetUTCTime", session=session)
+
+        response = self.send_request(server_address, "GetUTCTime")
         response_received = datetime.utcnow()
         request_sent = response_received - response.elapsed
 
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Artwork fetched once and kept on disk: content addressed blobs, LRU bounded in bytes.
+'''
+
+#################################################################################################
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .exceptions import HTTPException
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_WORKERS = 4
+INDEX = "index.json"
+SAVE_DELAY = 1.0
+
+#################################################################################################
+
+
+def image_key(item_id, art, index, max_width, ext, tag):
+    return "%s/%s/%s/%s/%s/%s" % (item_id, art, index if index is not None else "", max_width or "", ext, tag or "")
+
+
+class ArtworkCache(object):
+
+    ''' Images of Items/{id}/Images/{type} stored under path/<sha256[:2]>/<sha256>.
+
+        With the image tag (item['ImageTags'][art]) the url is immutable and a cached file is used as is,
+        without it the file is revalidated with the ETag. Concurrent requests for the same image share
+        one fetch, at most `workers` fetches run at a time and the least recently used images are
+        removed beyond max_bytes. The index is written to path/index.json SAVE_DELAY seconds after a
+        change, once for all the changes made meanwhile; close() or flush() write it right away.
+
+        poster = client.jellyfin.get_artwork(item['Id'], "Primary", 400, tag=item['ImageTags']['Primary'])
+        client.jellyfin.prefetch_artwork(row_of_items, "Primary", 400)
+    '''
+    def __init__(self, api, path, max_bytes=DEFAULT_MAX_BYTES, workers=DEFAULT_WORKERS):
+
+        self.api = api
+        self.path = path
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.save_timer = None
+        self.dirty = False
+        self.slots = threading.BoundedSemaphore(workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.entries = OrderedDict()  # key -> {'digest', 'validator', 'size'}, least recently used first
+        self.blobs = {}  # digest -> number of keys pointing at it
+        self.size = 0
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.deduped = 0
+        self.evictions = 0
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._load()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    def _load(self):
+
+        try:
+            with open(os.path.join(self.path, INDEX)) as index:
+                entries = json.load(index)
+        except (IOError, OSError, ValueError):
+            return
+
+        for key, entry in sorted(entries.items(), key=lambda x: x[1].get('used', 0)):
+            if os.path.exists(self._blob_path(entry['digest'])):
+                self._add(key, entry)
+
+    def _save(self, entries):
+
+        entries = dict((key, dict(entry, used=position)) for position, (key, entry) in enumerate(entries))
+        temp = os.path.join(self.path, INDEX + ".tmp")
+
+        with open(temp, 'w') as index:
+            json.dump(entries, index)
+
+        os.replace(temp, os.path.join(self.path, INDEX))
+
+    def _changed(self):
+
+        # Called with the lock held.
+        self.dirty = True
+
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(SAVE_DELAY, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+
+        ''' Write the index now if it changed. The entries are serialized outside of the lock.
+        '''
+        with self.save_lock:
+            with self.lock:
+                if self.save_timer is not None:
+                    self.save_timer.cancel()
+                    self.save_timer = None
+
+                if not self.dirty:
+                    return
+
+                self.dirty = False
+                entries = list(self.entries.items())
+
+            self._save(entries)
+
+    def _add(self, key, entry):
+
+        self.entries[key] = entry
+
+        if entry['digest'] not in self.blobs:
+            self.blobs[entry['digest']] = 0
+            self.size += entry['size']
+
+        self.blobs[entry['digest']] += 1
+
+    def _remove(self, key):
+
+        entry = self.entries.pop(key)
+        self.blobs[entry['digest']] -= 1
+
+        if not self.blobs[entry['digest']]:
+            del self.blobs[entry['digest']]
+            self.size -= entry['size']
+
+            try:
+                os.remove(self._blob_path(entry['digest']))
+            except OSError as error:
+                LOG.warning("Unable to remove cached image %s: %s", entry['digest'], error)
+
+    def _evict(self):
+
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _store(self, key, body, validator):
+
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+
+        with self.lock:
+            # Dropped first, it may be the last reference to the very blob written below.
+            if key in self.entries:
+                self._remove(key)
+
+            if not os.path.exists(path):
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+
+                with open(path + ".tmp", 'wb') as blob:
+                    blob.write(body)
+
+                os.replace(path + ".tmp", path)
+
+            self._add(key, {'digest': digest, 'validator': validator, 'size': len(body)})
+            self._evict()
+            self._changed()
+
+        return path
+
+    def _image_request(self, handler, params, entry):
+
+        request = {'type': "GET", 'handler': handler, 'params': params, 'raw': True}
+
+        if entry is not None and entry.get('validator'):
+            request['headers'] = {'If-None-Match': entry['validator']}
+
+        return request
+
+    def _revalidated(self, entry):
+
+        ''' Path of the blob a 304 confirmed, None if it is gone from the disk.
+        '''
+        path = self._blob_path(entry['digest'])
+
+        if not os.path.exists(path):
+            LOG.warning("Cached image %s is gone, fetching it again", entry['digest'])
+
+            return None
+
+        with self.lock:
+            self.revalidations += 1
+
+        return path
+
+    def _fetch(self, key, handler, params, entry):
+
+        try:
+            with self.slots:
+                r = self.api.client.request(self._image_request(handler, params, entry))
+        except HTTPException as error:
+            if error.status == 404:
+                return None
+
+            raise
+
+        if r is None:
+            return None
+
+        if r.status_code == 304 and entry is not None:
+            return self._revalidated(entry) or self._fetch(key, handler, params, None)
+
+        return self._store(key, r.content, r.headers.get('ETag'))
+
+    def _lookup(self, key, tag, new_future):
+
+        ''' (path, entry, future, owner): path of a cached image used as is, else the future of the
+            fetch of key, owned by the caller when it was not in flight yet.
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+                if tag:
+                    self.hits += 1
+
+                    return self._blob_path(entry['digest']), entry, None, False
+
+            if key in self.inflight:
+                self.deduped += 1
+
+                return None, entry, self.inflight[key], False
+
+            if entry is None:
+                self.misses += 1
+
+            future = self.inflight[key] = new_future()
+
+            return None, entry, future, True
+
+    def _landed(self, key):
+
+        with self.lock:
+            self.inflight.pop(key, None)
+
+    @staticmethod
+    def _image(item_id, art, max_width, ext, index, tag):
+
+        handler = "Items/%s/Images/%s" % (item_id, art) if index is None else "Items/%s/Images/%s/%s" % (item_id, art, index)
+
+        return handler, {'MaxWidth': max_width, 'format': ext, 'tag': tag}
+
+    def get(self, item_id, art="Primary", max_width=None, ext="jpg", index=None, tag=None):
+
+        ''' Path of the cached image file, fetched if needed. None if the server has no such image.
+        '''
+        key = image_key(item_id, art, index, max_width, ext, tag)
+        path, entry, future, owner = self._lookup(key, tag, Future)
+
+        if future is None:
+            return path
+
+        if not owner:
+            return future.result()
+
+        handler, params = self._image(item_id, art, max_width, ext, index, tag)
+
+        try:
+            path = self._fetch(key, handler, params, entry)
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(path)
+        finally:
+            self._landed(key)
+
+        return path
+
+    @staticmethod
+    def _prefetched(items, art, max_width, ext):
+
+        # get() arguments for a list of items (dicts with ImageTags, or ids).
+        for item in items:
+            if isinstance(item, dict):
+                yield item['Id'], art, max_width, ext, None, (item.get('ImageTags') or {}).get(art)
+            else:
+                yield item, art, max_width, ext, None, None
+
+    def prefetch(self, items, art="Primary", max_width=None, ext="jpg"):
+
+        ''' Fetch the artwork of a list of items (dicts with ImageTags, or ids) in the background.
+            Returns the futures, resolving to the file paths.
+        '''
+        return [self.executor.submit(self.get, *args) for args in self._prefetched(items, art, max_width, ext)]
+
+    def clear(self):
+
+        with self.lock:
+            for key in list(self.entries):
+                self._remove(key)
+
+            self._changed()
+
+    def close(self):
+
+        self.executor.shutdown(wait=True)
+        self.flush()
+
+    def stats(self):
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'deduped': self.deduped,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size
+            }
+
+
+class AsyncArtworkCache(ArtworkCache):
+
+    ''' ArtworkCache for AsyncAPI, used from the event loop: get() is awaited and prefetch() returns
+        tasks. Images are hashed and written to the disk in the default executor.
+
+        poster = await client.jellyfin.get_artwork(item['Id'], "Primary", 400, tag=item['ImageTags']['Primary'])
+    '''
+    fetches = None
+
+    async def _fetch(self, key, handler, params, entry):
+
+        if self.fetches is None:
+            self.fetches = asyncio.Semaphore(self.workers)
+
+        try:
+            async with self.fetches:
+                r = await self.api.client.request(self._image_request(handler, params, entry))
+        except HTTPException as error:
+            if error.status == 404:
+                return None
+
+            raise
+
+        if r is None:
+            return None
+
+        if r.status == 304 and entry is not None:
+            return self._revalidated(entry) or await self._fetch(key, handler, params, None)
+
+        body = await r.read()
+
+        return await asyncio.get_running_loop().run_in_executor(None, self._store, key, body, r.headers.get('ETag'))
+
+    async def get(self, item_id, art="Primary", max_width=None, ext="jpg", index=None, tag=None):
+
+        key = image_key(item_id, art, index, max_width, ext, tag)
+        path, entry, future, owner = self._lookup(key, tag, asyncio.get_running_loop().create_future)
+
+        if future is None:
+            return path
+
+        if not owner:
+            return await asyncio.shield(future)
+
+        handler, params = self._image(item_id, art, max_width, ext, index, tag)
+
+        try:
+            path = await self._fetch(key, handler, params, entry)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            future.exception()  # marked as retrieved, there may be no other caller waiting
+            raise
+        else:
+            future.set_result(path)
+        finally:
+            self._landed(key)
+
+        return path
+
+    def prefetch(self, items, art="Primary", max_width=None, ext="jpg"):
+
+        ''' Tasks fetching the artwork of a list of items, resolving to the file paths.
+        '''
+        return [asyncio.ensure_future(self.get(*args)) for args in self._prefetched(items, art, max_width, ext)]
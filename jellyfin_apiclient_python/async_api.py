@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Every API call as a coroutine. Calls that only build a request return the AsyncHTTP coroutine
+    untouched, so only the methods that inspect responses, and the helpers built on threads, are
+    redefined here.
+'''
+
+#################################################################################################
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from .api import API, DEFAULT_PAGE_SIZE, info
+from .artwork import AsyncArtworkCache
+from .async_http import to_timeout
+from .batching import DEFAULT_WINDOW, MAX_IDS_LENGTH, AsyncItemLoader
+from .crawler import AsyncCrawler
+from .downloader import AsyncDownload
+from .request_log import LazyJSON
+from .streaming import map_file
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+
+#################################################################################################
+
+
+class AsyncAPI(API):
+
+    async def _json_or_empty(self, response):
+        if response.status != 200:
+            response.release()
+            return {}
+
+        return await response.json(content_type=None)
+
+    async def iter_items(self, params=None, page_size=DEFAULT_PAGE_SIZE, handler="", strict=False):
+        ''' Async generator counterpart of API.iter_items, prefetching the next page as a task.
+
+            async for item in api.iter_items({'ParentId': view_id, 'Recursive': True}):
+        '''
+        params, start, limit = self._item_pages(params)
+
+        async def fetch(start, limit):
+            page, size = self._page_request(params, start, limit, page_size)
+            return self._page_result(await self.user_items(handler, page), start, strict), size
+
+        pending = asyncio.ensure_future(fetch(start, limit))
+
+        try:
+            while pending is not None:
+                result, size = await pending
+                items = result.get('Items') or []
+                start += len(items)
+
+                if limit is not None:
+                    limit -= len(items)
+
+                total = result.get('TotalRecordCount')
+                more = self._more_pages(items, size, start, total, limit)
+                pending = asyncio.ensure_future(fetch(start, limit)) if more else None
+                result = None
+
+                for item in items:
+                    yield item
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    def crawl(self, roots=None, workers=None, progress=None, page_size=DEFAULT_PAGE_SIZE):
+        ''' Async generator counterpart of API.crawl, see crawler.AsyncCrawler.
+        '''
+        options = dict((key, value) for key, value in (('workers', workers),) if value)
+
+        return AsyncCrawler(self, progress=progress, fields=info(), page_size=page_size, **options).crawl(roots)
+
+    async def download(self, handler, path, params=None, **options):
+        ''' API.download with the ranges requested from the event loop, see downloader.AsyncDownload.
+        '''
+        return await AsyncDownload(self, handler, path, params, **options).run()
+
+    async def download_mapped(self, handler, path, params=None):
+        ''' API.download_mapped, the mapped file written chunk by chunk from the event loop.
+        '''
+        headers = await self._http("HEAD", handler, {'params': params}) or {}
+        size = int(headers.get('Content-Length') or 0)
+        encoding = headers.get('Content-Encoding', "identity").strip().lower()
+
+        if not size or encoding not in ("", "identity"):
+            with open(path, 'wb') as dest_file:
+                return await self._get_stream(handler, dest_file, params)
+
+        target = map_file(path, size)
+
+        try:
+            await self._get_stream(handler, target, params)
+            target.flush()
+        finally:
+            target.close()
+
+    def enable_artwork_cache(self, path, max_bytes=None, workers=None):
+        ''' API.enable_artwork_cache: get_artwork is then awaited and prefetch_artwork returns tasks.
+        '''
+        options = dict((key, value) for key, value in (('max_bytes', max_bytes), ('workers', workers)) if value)
+        self.artwork_cache = AsyncArtworkCache(self, path, **options)
+
+        return self.artwork_cache
+
+    def enable_item_batching(self, window=DEFAULT_WINDOW, max_ids_length=MAX_IDS_LENGTH):
+        ''' API.enable_item_batching, get_item calls are then merged on the event loop.
+        '''
+        self.item_loader = AsyncItemLoader(self, window, max_ids_length)
+
+        return self.item_loader
+
+    async def check_companion_installed(self):
+        try:
+            await self._get("/Jellyfin.Plugin.KodiSyncQueue/GetServerDateTime")
+            return True
+        except Exception:
+            return False
+
+    async def send_request(self, url, path, method="get", timeout=None, headers=None, data=None, session=None):
+        session = session or self._session()
+        url = "%s/%s" % (url, path)
+        request_settings = {
+            "timeout": to_timeout(timeout or self.default_timeout),
+            "headers": headers or self.get_default_headers(),
+            "data": data
+        }
+
+        if self.config.data.get('auth.ssl') == False:
+            request_settings["ssl"] = False
+
+        LOG.info("Sending %s request to %s" % (method, path))
+        LOG.debug("%s", LazyJSON(request_settings['headers']))
+
+        return await session.request(method.upper(), url, **request_settings)
+
+    async def login(self, server_url, username, password=""):
+        path = "Users/AuthenticateByName"
+        authData = {
+                    "username": username,
+                    "Pw": password
+                }
+
+        headers = self.get_default_headers()
+        headers.update({'Content-type': "application/json"})
+
+        try:
+            LOG.info("Trying to login to %s/%s as %s" % (server_url, path, username))
+            response = await self.send_request(server_url, path, method="post", headers=headers,
+                                               data=json.dumps(authData), timeout=(5, 30))
+
+            if response.status == 200:
+                return await response.json(content_type=None)
+            else:
+                LOG.error("Failed to login to server with status code: " + str(response.status))
+                LOG.error("Server Response:\n" + str(await response.read()))
+                LOG.debug("%s", LazyJSON(headers))
+
+                return {}
+        except Exception as e:
+            LOG.error(e)
+
+        return {}
+
+    async def validate_authentication_token(self, server):
+        headers = self.get_default_headers()
+        headers.update({'X-MediaBrowser-Token': server['AccessToken']})
+
+        response = await self.send_request(server['address'], "system/info", headers=headers)
+        return await self._json_or_empty(response)
+
+    async def get_public_info(self, server_address):
+        response = await self.send_request(server_address, "system/info/public")
+        return await self._json_or_empty(response)
+
+    async def check_redirect(self, server_address):
+        response = await self.send_request(server_address, "system/info/public")
+        response.release()
+        return str(response.url).replace('/system/info/public', '')
+
+    async def utc_time(self):
+        server_address = self.config.data.get("auth.server")
+
+        request_sent = datetime.utcnow()
+        response = await self.send_request(server_address, "GetUTCTime")
+        response_obj = await response.json(content_type=None)
+        response_received = datetime.utcnow()
+
+        return {
+            "request_sent": request_sent,
+            "request_received": self._parse_precise_time(response_obj["RequestReceptionTime"]),
+            "response_sent": self._parse_precise_time(response_obj["ResponseTransmissionTime"]),
+            "response_received": response_received
+        }
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+#################################################################################################
+
+import asyncio
+import logging
+
+from .async_api import AsyncAPI
+from .async_http import AsyncHTTP
+from .client import JellyfinClient
+from .timesync_manager import TimeSyncManager
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+
+#################################################################################################
+
+
+class AsyncJellyfinClient(JellyfinClient):
+
+    ''' JellyfinClient whose jellyfin attribute is an AsyncAPI, so every call is awaited:
+
+        client = AsyncJellyfinClient()
+        await client.authenticate(credentials)
+        await client.start()
+        items = await asyncio.gather(*(client.jellyfin.get_item(x) for x in ids))
+        await client.stop()
+
+        Authentication runs once, through the blocking ConnectionManager in the default executor.
+        The websocket keeps its own thread; its catch up requests run on the loop start() was awaited in.
+    '''
+    loop = None
+
+    def __init__(self, allow_multiple_clients=False):
+        super(AsyncJellyfinClient, self).__init__(allow_multiple_clients)
+
+        self.async_http = AsyncHTTP(self)
+        self.jellyfin = AsyncAPI(self.async_http)
+        self.timesync = TimeSyncManager(self, self.auth.API)
+
+    async def authenticate(self, credentials=None, options=None, discover=True):
+
+        loop = asyncio.get_running_loop()
+        authenticate = super(AsyncJellyfinClient, self).authenticate
+
+        return await loop.run_in_executor(None, authenticate, credentials, options, discover)
+
+    async def start(self, websocket=False, keep_alive=True):
+
+        self.loop = asyncio.get_running_loop()
+        super(AsyncJellyfinClient, self).start(websocket, keep_alive)
+        self.async_http.start_session()
+
+    async def stop(self):
+
+        super(AsyncJellyfinClient, self).stop()
+        await self.async_http.stop_session()
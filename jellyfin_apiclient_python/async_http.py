@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' asyncio counterpart of http.HTTP, requires aiohttp (pip install jellyfin-apiclient-python[async]).
+    Header, url and params preparation, the response cache, the circuit breakers and the per server
+    limiters are shared with the blocking client.
+'''
+
+#################################################################################################
+
+import asyncio
+import inspect
+import json
+import logging
+import time
+
+import aiohttp
+
+from .breaker import CLOSED, OPEN
+from .cache import referenced_ids
+from .exceptions import HTTPException
+from .http import GATEWAY_ERRORS, HTTP
+from .json_stream import Feed, ItemStream, NeedMore
+from .request_log import log_request, log_response
+from .retry import RetryPolicies
+
+#################################################################################################
+
+LOG = logging.getLogger('Jellyfin.' + __name__)
+
+#################################################################################################
+
+
+def to_query(params):
+
+    ''' aiohttp refuses None and bool values that requests silently drops or stringifies.
+    '''
+    query = []
+
+    for key, value in (params or {}).items():
+        if value is None:
+            continue
+
+        for value in (value if isinstance(value, (list, tuple)) else [value]):
+            query.append((key, str(value) if isinstance(value, (bool, float)) else value))
+
+    return query
+
+
+def to_timeout(timeout):
+
+    ''' requests timeouts bound the connection and each read, never the whole transfer.
+    '''
+    if isinstance(timeout, (list, tuple)):
+        return aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+
+    return aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+
+
+async def iter_views(response, size):
+
+    ''' streaming.iter_views for an aiohttp response: memoryviews of at most size bytes, each one
+        valid until the next is requested. The connection is released at the end.
+    '''
+    try:
+        async for chunk in response.content.iter_chunked(size):
+            yield memoryview(chunk)
+    finally:
+        response.release()
+
+
+class AsyncItemStream(ItemStream):
+
+    ''' ItemStream reading an aiohttp response as it is iterated:
+
+        stream = await api.stream_items({'ParentId': view_id, 'Fields': info()})
+        async for item in stream:
+            ...
+    '''
+    def __init__(self, response, key='Items'):
+
+        self.response = response
+        self.feed = Feed()
+        ItemStream.__init__(self, self.feed, key, on_close=response.release)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+
+        while True:
+            try:
+                return self._next_item()
+            except NeedMore:
+                self.feed.push(await self.response.content.readany())
+            except StopIteration:
+                self.close()
+
+                raise StopAsyncIteration
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+
+class AsyncHTTP(HTTP):
+
+    session = None
+
+    def __init__(self, client):
+
+        self.client = client
+        self.config = client.config
+        self.retry = RetryPolicies()
+        self.cache = client.http.cache  # invalidated by the websocket along with the blocking client's
+        self.flights = {}
+
+    def get_session(self):
+
+        ''' Must be called from within the running event loop.
+        '''
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+                limit=self.config.data['http.pool_connections'] * self.config.data['http.pool_maxsize'],
+                limit_per_host=self.config.data['http.pool_maxsize'],
+                keepalive_timeout=self.config.data['http.pool_idle_timeout']
+            ))
+            LOG.info("-->[ session/%s ]", id(self.session))
+
+        return self.session
+
+    def start_session(self):
+        return self.get_session()
+
+    async def stop_session(self):
+
+        if self.session is None:
+            return
+
+        try:
+            LOG.info("--<[ session/%s ]", id(self.session))
+            await self.session.close()
+        except Exception as error:
+            LOG.warning("The aiohttp session could not be terminated: %s", error)
+
+        self.session = None
+
+        if self.breaker is not None:
+            self.breaker.unsubscribe(self._circuit_changed)
+            self.breaker = None
+
+    def pool_stats(self):
+        return {}
+
+    async def request(self, data, session=None, dest_file=None):
+
+        ''' Same contract as HTTP.request: retries following the retry policy, honors cache, raw,
+            the circuit breaker, the per server limiter and http.singleflight, raises HTTPException
+            and fires the client callbacks on 401. raw returns the aiohttp response, body read and
+            connection returned to the pool. stream_items returns an AsyncItemStream and stream_views an async
+            generator, both iterated with async for. dest_file.write may be a coroutine function.
+        '''
+        if not data:
+            raise AttributeError("Request cannot be empty")
+
+        sample = self.client.metrics.start(data)
+        key = self._flight_key(data, dest_file) if self.config.data.get('http.singleflight') else None
+
+        try:
+            if key is None:
+                response = await self._send(data, session, dest_file, sample)
+            else:
+                response, shared = await self._shared_send(key, data, session, dest_file, sample)
+
+                if shared:
+                    sample.status = "shared"
+        except Exception as error:
+            self.client.metrics.observe(sample, error)
+            raise
+
+        self.client.metrics.observe(sample)
+
+        return response
+
+    async def _shared_send(self, key, data, session, dest_file, sample):
+
+        ''' SingleFlight.do for coroutines: callers of a key already in flight await the same task.
+            The task is shielded, a cancelled caller does not cancel the request of the others.
+        '''
+        task = self.flights.get(key)
+
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        def landed(task):
+            if self.flights.get(key) is task:
+                del self.flights[key]
+
+        task = self.flights[key] = asyncio.ensure_future(self._send(data, session, dest_file, sample))
+        task.add_done_callback(landed)
+
+        return await asyncio.shield(task), False
+
+    async def _send(self, data, session, dest_file, sample):
+
+        data = self._request(data)
+        log_request(LOG, data, self.config)
+        retries = data.pop('retry', None)
+        action = data.pop('type', "GET")
+        policy = self.retry.policy_for(data['url'])
+        started = time.time()
+        attempt = 0
+        sent_bytes = len(json.dumps(data['json'])) if data.get('json') is not None else 0
+        stream_items = data.pop('stream_items', False)
+        stream_views = data.pop('stream_views', False)
+        raw = data.pop('raw', False)
+        cache_key = entry = None
+        breaker = self._get_breaker()
+        limiter = self._get_limiter()
+
+        if data.pop('cache', False) and self.cache.enabled and action == "GET":
+            cache_key = self.cache.key(data)
+            entry = self.cache.get(cache_key)
+
+            if entry is not None:
+                if self.cache.is_fresh(entry):
+                    sample.status = "cached"
+
+                    return self.cache.hit(entry)
+
+                if entry.etag:
+                    data['headers'] = dict(data['headers'])
+                    data['headers']['If-None-Match'] = entry.etag
+
+        while True:
+
+            await self._check_circuit(breaker, session, data)
+            written = 0  # a request that wrote part of its body into dest_file is not sent again
+            keep = False  # streams release the response themselves once read
+
+            try:
+                await self._acquire(limiter, sample)
+
+                try:
+                    sent = time.time()
+                    r = await (session or self.get_session()).request(
+                        action, data['url'],
+                        params=to_query(data.get('params')),
+                        json=data.get('json'),
+                        headers=data['headers'],
+                        timeout=to_timeout(data['timeout']),
+                        ssl=None if data['verify'] else False
+                    )
+                    sample.response(r)
+                    sample.bytes_out += sent_bytes
+
+                    # Gateway errors are counted once the retries are exhausted, below.
+                    if breaker is not None and r.status not in GATEWAY_ERRORS:
+                        breaker.success()
+
+                    try:
+                        if r.status >= 400:
+                            await r.read()
+                            r.raise_for_status()
+
+                        if dest_file is not None:
+                            begin = getattr(dest_file, 'begin', None)
+
+                            if begin is not None:
+                                begin(r.status, r.headers)
+
+                            async for chunk in r.content.iter_chunked(self.config.data['http.stream_buffer_size']):
+                                result = dest_file.write(chunk)
+
+                                if inspect.isawaitable(result):
+                                    await result
+
+                                written += len(chunk)
+                                sample.bytes_in += len(chunk)
+
+                            return
+
+                        self.config.data['server-time'] = r.headers.get('Date')
+
+                        if stream_items or stream_views:
+                            keep = True
+                            sample.bytes_in += int(r.headers.get('Content-Length') or 0)
+                        else:
+                            body = await r.read()
+                            sample.bytes_in += len(body)
+                            keep = raw  # the connection is back in the pool, release() would make read() raise
+                    finally:
+                        if not keep:
+                            r.release()
+                finally:
+                    if limiter is not None:
+                        limiter.release()
+
+            except asyncio.TimeoutError as error:
+                delay = None if written else self._next_delay(policy, attempt, started, retries, "ReadTimeout",
+                                                              sample=sample)
+
+                if delay is not None:
+
+                    attempt += 1
+                    await asyncio.sleep(delay)
+
+                    continue
+
+                LOG.error(error)
+
+                if breaker is not None:
+                    breaker.failure()
+
+                raise HTTPException("ReadTimeout", error)
+
+            except aiohttp.ClientResponseError as error:
+                LOG.error(error)
+
+                if r.status == 401:
+
+                    if 'X-Application-Error-Code' in r.headers:
+                        self.client.callback("AccessRestricted", {'ServerId': self.config.data['auth.server-id']})
+
+                        raise HTTPException("AccessRestricted", error)
+                    else:
+                        self.client.callback("Unauthorized", {'ServerId': self.config.data['auth.server-id']})
+                        self.client.auth.revoke_token()
+
+                        raise HTTPException("Unauthorized", error)
+
+                elif r.status == 500:  # log and ignore.
+                    LOG.error("--[ 500 response ] %s", error)
+
+                    return
+
+                elif r.status in policy.statuses:
+                    delay = self._next_delay(policy, attempt, started, retries, r.status,
+                                             r.status, r.headers.get('Retry-After'), sample)
+
+                    if delay is not None:
+
+                        attempt += 1
+                        await asyncio.sleep(delay)
+
+                        continue
+
+                if breaker is not None and r.status in GATEWAY_ERRORS:
+                    breaker.failure()
+
+                raise HTTPException(r.status, error)
+
+            except aiohttp.InvalidURL as error:
+                LOG.error("Request missing Schema. " + str(error))
+                raise HTTPException("MissingSchema", {'Id': self.config.data.get('auth.server', "None")})
+
+            except aiohttp.ClientConnectionError as error:
+                delay = None if written else self._next_delay(policy, attempt, started, retries, "ConnectionError",
+                                                              sample=sample)
+
+                if delay is not None:
+
+                    attempt += 1
+                    await asyncio.sleep(delay)
+
+                    continue
+
+                LOG.error(error)
+
+                if breaker is not None:
+                    breaker.failure()
+
+                if breaker is None:  # otherwise the callback fires when the circuit opens
+                    self.client.callback("ServerUnreachable", {'ServerId': self.config.data['auth.server-id']})
+
+                raise HTTPException("ServerUnreachable", error)
+
+            else:
+                if action == "HEAD":
+                    return r.headers
+                if raw:
+                    return r
+                if stream_items:
+                    return AsyncItemStream(r)
+                if stream_views:
+                    return iter_views(r, self.config.data['http.stream_buffer_size'])
+                if entry is not None and r.status == 304:
+                    return self.cache.hit(entry, revalidated=True)
+
+                try:
+                    response = json.loads(body.decode('utf-8'))
+                except ValueError:
+                    return
+
+                if cache_key is not None:
+                    item_ids = referenced_ids(data['url'], data.get('params'), response)
+                    self.cache.store(cache_key, body, r.headers.get('ETag'), item_ids)
+
+                log_response(LOG, response, int((time.time() - sent) * 1000), self.config)
+
+                return response
+
+    async def _acquire(self, limiter, sample):
+
+        ''' A slot of the per server limiter shared with the blocking clients. When it has to wait,
+            ServerLimiter.acquire runs in the default executor; a caller cancelled meanwhile gives
+            the slot back as soon as it is granted.
+        '''
+        if limiter is None or limiter.acquire(blocking=False) is not None:
+            return
+
+        granted = asyncio.get_running_loop().run_in_executor(None, limiter.acquire)
+
+        try:
+            sample.queue_wait += await asyncio.shield(granted)
+        except asyncio.CancelledError:
+            granted.add_done_callback(lambda future: future.cancelled() or future.exception() or limiter.release())
+            raise
+
+    async def _check_circuit(self, breaker, session, data):
+
+        ''' HTTP._check_circuit with the half open probe sent through aiohttp.
+        '''
+        if breaker is None:
+            return
+
+        state = breaker.acquire()
+
+        if state == CLOSED:
+            return
+
+        if state == OPEN:
+            raise HTTPException("ServerUnreachable", "Circuit open for %s" % breaker.server)
+
+        try:
+            probe = await (session or self.get_session()).get(
+                "%s/System/Info/Public" % breaker.server,
+                timeout=to_timeout(data['timeout']),
+                ssl=None if data['verify'] else False
+            )
+            probe.release()
+            probe.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            breaker.failure()
+            raise HTTPException("ServerUnreachable", error)
+        except BaseException:
+            breaker.failure()  # cancelled, release the probe so another caller can take it
+            raise
+
+        breaker.success()
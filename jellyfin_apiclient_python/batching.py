@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Coalesce single item lookups into Users/{UserId}/Items?Ids=... requests.
+'''
+
+#################################################################################################
+
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from .cache import normalize_id
+from .exceptions import HTTPException
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+DEFAULT_WINDOW = 0.005
+MAX_IDS_LENGTH = 1800  # url encoded length of the Ids parameter, keeps urls under ~2k characters
+
+#################################################################################################
+
+
+class ItemLoader(object):
+
+    ''' Requests made within `window` seconds of each other, or inside batch(), are merged
+        into chunked get_items calls and the results split back out per caller.
+
+        loader = api.enable_item_batching()
+
+        with loader.batch():
+            futures = [loader.load(item_id) for item_id in ids]
+
+        items = [future.result() for future in futures]
+
+        Merged results carry the fields of get_items (info()), and callers asking for the
+        same id share the same dict. Every future is resolved once its batch is sent, with the
+        error of the batch if the request or the parsing of its result failed; only ids absent
+        from a successful result get a 404.
+    '''
+    def __init__(self, api, window=DEFAULT_WINDOW, max_ids_length=MAX_IDS_LENGTH):
+
+        self.api = api
+        self.window = window
+        self.max_ids_length = max_ids_length
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()
+        self.timer = None
+        self.held = 0
+        self.local = threading.local()
+
+    def load(self, item_id):
+
+        ''' Queue an item id, returns a Future resolved with the item dict.
+        '''
+        future = Future()
+
+        with self.lock:
+            self.pending.setdefault(item_id, []).append(future)
+
+            if not self.held and self.timer is None:
+                self.timer = threading.Timer(self.window, self.dispatch)
+                self.timer.daemon = True
+                self.timer.start()
+
+        return future
+
+    def get(self, item_id):
+
+        future = self.load(item_id)
+
+        if getattr(self.local, 'held', 0):
+            # Waiting on our own held batch would never return.
+            self.dispatch()
+
+        return future.result()
+
+    @contextmanager
+    def batch(self):
+
+        ''' Hold every queued id until the block exits, then send them together.
+        '''
+        with self.lock:
+            self.held += 1
+
+        self.local.held = getattr(self.local, 'held', 0) + 1
+
+        try:
+            yield self
+        finally:
+            self.local.held -= 1
+
+            with self.lock:
+                self.held -= 1
+                release = not self.held
+
+            if release:
+                self.dispatch()
+
+    def dispatch(self):
+
+        with self.lock:
+            pending, self.pending = self.pending, OrderedDict()
+
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        try:
+            for chunk in self._chunks(list(pending)):
+                try:
+                    self._send(chunk, pending)
+                except Exception as error:
+                    self._resolve(chunk, pending, error)
+        finally:
+            # Never leave a caller waiting, whatever went wrong above.
+            self._resolve(list(pending), pending, HTTPException("BatchFailed", "Item batch was not sent"))
+
+    def _send(self, chunk, pending):
+
+        LOG.debug("Batching %s item requests", len(chunk))
+        self._deliver(chunk, pending, self.api.get_items(chunk))
+
+    def _deliver(self, chunk, pending, result):
+
+        if result is None:  # HTTP.request answers a 500 with None, the items are not known to be missing
+            raise HTTPException("BatchFailed", "The server returned no result for %s items" % len(chunk))
+
+        found = dict((normalize_id(item['Id']), item) for item in result.get('Items') or [])
+
+        for item_id in chunk:
+            item = found.get(normalize_id(str(item_id)))
+
+            for future in pending[item_id]:
+                if future.done():
+                    continue
+
+                if item is not None:
+                    future.set_result(item)
+                else:
+                    future.set_exception(HTTPException(404, "Item %s not found" % item_id))
+
+    @staticmethod
+    def _resolve(item_ids, pending, error):
+
+        for item_id in item_ids:
+            for future in pending[item_id]:
+                if not future.done():
+                    future.set_exception(error)
+
+    def _chunks(self, item_ids):
+
+        chunk = []
+        length = 0
+
+        for item_id in item_ids:
+            size = len(str(item_id)) + 3  # comma is sent as %2C
+
+            if chunk and length + size > self.max_ids_length:
+                yield chunk
+                chunk = []
+                length = 0
+
+            chunk.append(item_id)
+            length += size
+
+        if chunk:
+            yield chunk
+
+
+class AsyncItemLoader(ItemLoader):
+
+    ''' ItemLoader for AsyncAPI, used from the event loop: load() returns an asyncio future, get()
+        is awaited and the chunks of a batch are requested together with gather().
+
+        loader = api.enable_item_batching()
+        items = await asyncio.gather(*(api.get_item(item_id) for item_id in ids))
+    '''
+    def load(self, item_id):
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.setdefault(item_id, []).append(future)
+
+        if not self.held and self.timer is None:
+            self.timer = loop.call_later(self.window, self.dispatch)
+
+        return future
+
+    async def get(self, item_id):
+
+        future = self.load(item_id)
+
+        if self.held:
+            # Awaiting our own held batch would never return.
+            self.dispatch()
+
+        return await future
+
+    @contextmanager
+    def batch(self):
+
+        self.held += 1
+
+        try:
+            yield self
+        finally:
+            self.held -= 1
+
+            if not self.held:
+                self.dispatch()
+
+    def dispatch(self):
+
+        ''' Send the queued ids, returns the task resolving their futures.
+        '''
+        pending, self.pending = self.pending, OrderedDict()
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if not pending:
+            return None
+
+        return asyncio.ensure_future(self._send_all(pending))
+
+    async def _send_all(self, pending):
+
+        try:
+            chunks = list(self._chunks(list(pending)))
+            LOG.debug("Batching %s item requests in %s chunks", len(pending), len(chunks))
+            results = await asyncio.gather(*(self.api.get_items(chunk) for chunk in chunks), return_exceptions=True)
+
+            for chunk, result in zip(chunks, results):
+                if isinstance(result, BaseException):
+                    self._resolve(chunk, pending, result)
+                    continue
+
+                try:
+                    self._deliver(chunk, pending, result)
+                except Exception as error:
+                    self._resolve(chunk, pending, error)
+        finally:
+            self._resolve(list(pending), pending, HTTPException("BatchFailed", "Item batch was not sent"))
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Per server circuit breaker, shared by every client of the process talking to that server.
+'''
+
+#################################################################################################
+
+import logging
+import threading
+import time
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+CLOSED = "Closed"
+OPEN = "Open"
+HALF_OPEN = "HalfOpen"
+
+#################################################################################################
+
+
+class CircuitBreaker(object):
+
+    ''' Opens after `threshold` consecutive failures; requests then fail immediately.
+        Once `reset_timeout` has passed, a single caller is let through as a probe (HALF_OPEN):
+        its success closes the circuit, its failure opens it for another period. A probe that is
+        cancelled or interrupted counts as a failure, the next period lets another caller through.
+        Listeners are called with (breaker, old_state, new_state) on every transition.
+        A failure is a request that still failed once its retries were exhausted. The settings of
+        the first client asking for a server apply to all of them.
+    '''
+    lock = threading.Lock()
+    breakers = {}
+    ignored = set()
+
+    @classmethod
+    def get(cls, server, threshold, reset_timeout):
+
+        with cls.lock:
+            if server not in cls.breakers:
+                cls.breakers[server] = cls(server, threshold, reset_timeout)
+
+            breaker = cls.breakers[server]
+
+            if (threshold, reset_timeout) != (breaker.threshold, breaker.reset_timeout) and \
+                    (server, threshold, reset_timeout) not in cls.ignored:
+                cls.ignored.add((server, threshold, reset_timeout))
+                LOG.warning("Circuit for %s already opens after %s failures for %ss, ignoring %s and %ss",
+                            server, breaker.threshold, breaker.reset_timeout, threshold, reset_timeout)
+
+            return breaker
+
+    def __init__(self, server, threshold, reset_timeout):
+
+        self.server = server
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+        self.listeners = []
+        self.state_lock = threading.Lock()
+
+    def acquire(self):
+
+        ''' CLOSED: go ahead. HALF_OPEN: go ahead, the caller is the probe. OPEN: fail fast.
+        '''
+        transitions = []
+
+        with self.state_lock:
+            if self.state == CLOSED:
+                return CLOSED
+
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                transitions.append(self._transition(HALF_OPEN))
+
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                state = HALF_OPEN
+            else:
+                state = OPEN
+
+        self._notify(transitions)
+
+        return state
+
+    def success(self):
+
+        transitions = []
+
+        with self.state_lock:
+            self.failures = 0
+            self.probing = False
+
+            if self.state != CLOSED:
+                transitions.append(self._transition(CLOSED))
+
+        self._notify(transitions)
+
+    def failure(self):
+
+        transitions = []
+
+        with self.state_lock:
+            self.failures += 1
+            self.probing = False
+
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self.opened_at = time.time()
+                transitions.append(self._transition(OPEN))
+
+        self._notify(transitions)
+
+    def _transition(self, state):
+
+        old, self.state = self.state, state
+        LOG.info("Circuit for %s: %s -> %s", self.server, old, state)
+
+        return old, state
+
+    def _notify(self, transitions):
+
+        # Outside of the state lock, listeners may well issue requests themselves.
+        for old, state in transitions:
+            for listener in list(self.listeners):
+                try:
+                    listener(self, old, state)
+                except Exception:
+                    LOG.exception("Exception in circuit breaker listener.")
+
+    def subscribe(self, listener):
+
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+
+        if listener in self.listeners:
+            self.listeners.remove(listener)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Response cache for metadata GETs, bounded by memory and revalidated with ETag.
+    Bodies are kept as raw bytes, so the budget is exact and every hit decodes a private copy.
+'''
+
+#################################################################################################
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+ENTRY_OVERHEAD = 256  # rough bookkeeping cost of an entry beside its body
+ITEM_ID = re.compile(r'[0-9a-fA-F]{32}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+ITEM_REFERENCES = ('Id', 'ParentId', 'SeasonId', 'SeriesId', 'AlbumId')
+
+#################################################################################################
+
+
+def normalize_id(item_id):
+    return item_id.replace('-', "").lower()
+
+
+def referenced_ids(url, params, response):
+
+    ''' Item ids a cached response depends on: ids in the url and params, the item itself,
+        and the listed items with their parents.
+    '''
+    ids = set(normalize_id(x) for x in ITEM_ID.findall(url))
+
+    for value in (params or {}).values():
+        ids.update(normalize_id(x) for x in ITEM_ID.findall(str(value)))
+
+    if isinstance(response, dict):
+        items = [response] + [x for x in response.get('Items') or [] if isinstance(x, dict)]
+    elif isinstance(response, list):
+        items = [x for x in response if isinstance(x, dict)]
+    else:
+        items = []
+
+    for item in items:
+        for reference in ITEM_REFERENCES:
+            if item.get(reference):
+                ids.add(normalize_id(str(item[reference])))
+
+    return ids
+
+
+class CacheEntry(object):
+
+    def __init__(self, key, body, etag, item_ids):
+
+        self.key = key
+        self.body = body
+        self.etag = etag
+        self.item_ids = item_ids
+        self.stored = time.time()
+        self.size = len(body) + ENTRY_OVERHEAD
+
+
+class ResponseCache(object):
+
+    ''' LRU of response bodies keyed on the resolved url, params and user.
+        Disabled while http.cache_max_bytes is 0. Entries younger than http.cache_ttl are served
+        without a request, older ones are revalidated with If-None-Match when they carry an ETag.
+    '''
+    def __init__(self, config):
+
+        self.config = config
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.index = {}  # item id -> keys of the entries depending on it
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return bool(self.config.data.get('http.cache_max_bytes'))
+
+    def key(self, data):
+
+        params = tuple(sorted((k, str(v)) for k, v in (data.get('params') or {}).items() if v is not None))
+
+        return (data['url'], params, self.config.data.get('auth.user_id'))
+
+    def get(self, key):
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+
+            return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.stored < self.config.data['http.cache_ttl']
+
+    def hit(self, entry, revalidated=False):
+
+        with self.lock:
+            if revalidated:
+                entry.stored = time.time()
+                self.revalidations += 1
+            else:
+                self.hits += 1
+
+        return json.loads(entry.body.decode('utf-8'))
+
+    def store(self, key, body, etag, item_ids):
+
+        max_bytes = self.config.data.get('http.cache_max_bytes') or 0
+        entry = CacheEntry(key, body, etag, item_ids)
+
+        if entry.size > max_bytes:
+            return
+
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = entry
+            self.size += entry.size
+
+            for item_id in item_ids:
+                self.index.setdefault(item_id, set()).add(key)
+
+            while self.size > max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def references(self, item_id):
+
+        with self.lock:
+            return normalize_id(item_id) in self.index
+
+    def invalidate(self, item_ids):
+
+        ''' Drop every entry that depends on one of item_ids, returns the number of dropped entries.
+        '''
+        dropped = 0
+
+        with self.lock:
+            for item_id in item_ids:
+                for key in self.index.pop(normalize_id(item_id), ()):
+                    if self._remove(key):
+                        dropped += 1
+
+            self.invalidations += dropped
+
+        return dropped
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+            self.index.clear()
+            self.size = 0
+
+    def _remove(self, key):
+
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            return False
+
+        self.size -= entry.size
+
+        for item_id in entry.item_ids:
+            keys = self.index.get(item_id)
+
+            if keys is not None:
+                keys.discard(key)
+
+                if not keys:
+                    del self.index[item_id]
+
+        return True
+
+    def stats(self):
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+                'bytes': self.size
+            }
@@ -8,6 +8,8 @@ import logging
 from . import api
 from .configuration import Config
 from .http import HTTP
+from .invalidation import InvalidationBus
+from .metrics import MetricsRegistry
 from .ws_client import WSClient
 from .connection_manager import ConnectionManager, CONNECTION_STATE
 from .timesync_manager import TimeSyncManager
@@ -36,6 +38,7 @@ class JellyfinClient(object):
         LOG.debug("JellyfinClient initializing...")
 
         self.config = Config()
+        self.metrics = MetricsRegistry()
         self.http = HTTP(self)
         self.wsc = WSClient(self, allow_multiple_clients)
         self.auth = ConnectionManager(self)
@@ -43,6 +46,7 @@ class JellyfinClient(object):
         self.callback_ws = callback
         self.callback = callback
         self.timesync = TimeSyncManager(self)
+        self.invalidation = InvalidationBus(self)
 
     def set_credentials(self, credentials=None):
         self.auth.credentials.set_credentials(credentials or {})
@@ -65,7 +69,7 @@ class JellyfinClient(object):
 
         return state
 
-    def start(self, websocket=False, keep_alive=True):
+    def start(self, websocket=False, keep_alive=True, hub=None):
 
         if not self.logged_in:
             raise ValueError("User is not authenticated.")
@@ -76,12 +80,19 @@ class JellyfinClient(object):
             self.http.keep_alive = True
 
         if websocket:
-            self.start_wsc()
+            self.start_wsc(hub)
 
-    def start_wsc(self):
-        self.wsc.start()
+    def start_wsc(self, hub=None):
+
+        ''' hub: a ws_hub.WebSocketHub running the websocket instead of a thread of its own.
+        '''
+        if hub is not None:
+            hub.add(self.wsc)
+        else:
+            self.wsc.start()
 
     def stop(self):
         self.wsc.stop_client()
         self.http.stop_session()
         self.timesync.stop_ping()
+        self.invalidation.stop()
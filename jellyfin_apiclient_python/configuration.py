@@ -13,18 +13,90 @@ import logging
 
 DEFAULT_HTTP_MAX_RETRIES = 3
 DEFAULT_HTTP_TIMEOUT = 30
+DEFAULT_HTTP_POOL_CONNECTIONS = 10
+DEFAULT_HTTP_POOL_MAXSIZE = 10
+DEFAULT_HTTP_POOL_IDLE_TIMEOUT = 60
+DEFAULT_HTTP_CACHE_MAX_BYTES = 0
+DEFAULT_HTTP_CACHE_TTL = 60
+DEFAULT_HTTP_BREAKER_THRESHOLD = 0
+DEFAULT_HTTP_BREAKER_RESET_TIMEOUT = 30
+DEFAULT_HTTP_LOG_BODY_LIMIT = 4096
+DEFAULT_HTTP_LOG_SAMPLE_RATE = 1.0
+DEFAULT_HTTP_SESSION_MODE = "shared"
+DEFAULT_HTTP_STREAM_BUFFER_SIZE = 256 * 1024
+DEFAULT_HTTP_SINGLEFLIGHT = False
+DEFAULT_HTTP_MAX_IN_FLIGHT = 0
+DEFAULT_HTTP_RATE_LIMIT = 0
+DEFAULT_HTTP_SHARED_TRANSPORT = True
+DEFAULT_WEBSOCKET_RECONNECT_BASE = 1
+DEFAULT_WEBSOCKET_RECONNECT_CAP = 60
+DEFAULT_WEBSOCKET_DEDUP_SIZE = 4096
+DEFAULT_WEBSOCKET_DEDUP_WINDOW = 600
+DEFAULT_WEBSOCKET_DISPATCH_WORKERS = 2
+DEFAULT_WEBSOCKET_DISPATCH_QUEUE_SIZE = 1000
+DEFAULT_WEBSOCKET_DISPATCH_OVERFLOW = "drop_oldest"
+DEFAULT_WEBSOCKET_PREWARM_WORKERS = 2
+CONTEXT_KEYS = ('app.', 'auth.', 'http.user_agent')
 LOG = logging.getLogger('JELLYFIN.' + __name__)
 
 #################################################################################################
 
 
+class ConfigData(dict):
+
+    ''' Counts the changes to the settings requests are built from (CONTEXT_KEYS),
+        so HTTP can keep its headers and url substitutions until one of them changes.
+    '''
+    version = 0
+
+    def __setitem__(self, key, value):
+
+        if key.startswith(CONTEXT_KEYS):
+            self.version += 1
+
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+
+        self.version += 1
+        dict.__delitem__(self, key)
+
+    def setdefault(self, key, default=None):
+
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+    def update(self, *args, **kwargs):
+
+        self.version += 1
+        dict.update(self, *args, **kwargs)
+
+    def pop(self, *args):
+
+        self.version += 1
+        return dict.pop(self, *args)
+
+    def popitem(self):
+
+        self.version += 1
+        return dict.popitem(self)
+
+    def clear(self):
+
+        self.version += 1
+        dict.clear(self)
+
+
 class Config(object):
 
     def __init__(self):
 
         LOG.debug("Configuration initializing...")
-        self.data = {}
+        self.data = ConfigData()
         self.http()
+        self.websocket()
 
     def app(self, name, version, device_name, device_id, capabilities=None, device_pixel_ratio=None):
         
@@ -45,9 +117,64 @@ class Config(object):
         self.data['auth.token'] = token
         self.data['auth.ssl'] = ssl
 
-    def http(self, user_agent=None, max_retries=DEFAULT_HTTP_MAX_RETRIES, timeout=DEFAULT_HTTP_TIMEOUT):
+    def http(self, user_agent=None, max_retries=DEFAULT_HTTP_MAX_RETRIES, timeout=DEFAULT_HTTP_TIMEOUT,
+             pool_connections=DEFAULT_HTTP_POOL_CONNECTIONS, pool_maxsize=DEFAULT_HTTP_POOL_MAXSIZE,
+             pool_idle_timeout=DEFAULT_HTTP_POOL_IDLE_TIMEOUT, cache_max_bytes=DEFAULT_HTTP_CACHE_MAX_BYTES,
+             cache_ttl=DEFAULT_HTTP_CACHE_TTL, breaker_threshold=DEFAULT_HTTP_BREAKER_THRESHOLD,
+             breaker_reset_timeout=DEFAULT_HTTP_BREAKER_RESET_TIMEOUT, log_body_limit=DEFAULT_HTTP_LOG_BODY_LIMIT,
+             log_sample_rate=DEFAULT_HTTP_LOG_SAMPLE_RATE, session_mode=DEFAULT_HTTP_SESSION_MODE,
+             stream_buffer_size=DEFAULT_HTTP_STREAM_BUFFER_SIZE, singleflight=DEFAULT_HTTP_SINGLEFLIGHT,
+             max_in_flight=DEFAULT_HTTP_MAX_IN_FLIGHT, rate_limit=DEFAULT_HTTP_RATE_LIMIT, rate_burst=None,
+             shared_transport=DEFAULT_HTTP_SHARED_TRANSPORT):
         
         LOG.debug("Begin http constructor.")
         self.data['http.max_retries'] = max_retries
         self.data['http.timeout'] = timeout
         self.data['http.user_agent'] = user_agent
+        self.data['http.pool_connections'] = pool_connections
+        self.data['http.pool_maxsize'] = pool_maxsize
+        self.data['http.pool_idle_timeout'] = pool_idle_timeout
+        self.data['http.cache_max_bytes'] = cache_max_bytes
+        self.data['http.cache_ttl'] = cache_ttl
+        self.data['http.breaker_threshold'] = breaker_threshold
+        self.data['http.breaker_reset_timeout'] = breaker_reset_timeout
+        self.data['http.log_body_limit'] = log_body_limit
+        self.data['http.log_sample_rate'] = log_sample_rate
+        self.data['http.session_mode'] = session_mode
+        self.data['http.stream_buffer_size'] = stream_buffer_size
+        self.data['http.singleflight'] = singleflight
+        self.data['http.max_in_flight'] = max_in_flight
+        self.data['http.rate_limit'] = rate_limit
+        self.data['http.rate_burst'] = rate_burst
+        self.data['http.shared_transport'] = shared_transport
+
+    def websocket(self, reconnect=True, reconnect_base=DEFAULT_WEBSOCKET_RECONNECT_BASE,
+                  reconnect_cap=DEFAULT_WEBSOCKET_RECONNECT_CAP, reconnect_retries=None, catch_up=True,
+                  dedup_size=DEFAULT_WEBSOCKET_DEDUP_SIZE, dedup_window=DEFAULT_WEBSOCKET_DEDUP_WINDOW,
+                  dispatch_workers=DEFAULT_WEBSOCKET_DISPATCH_WORKERS,
+                  dispatch_queue_size=DEFAULT_WEBSOCKET_DISPATCH_QUEUE_SIZE,
+                  dispatch_overflow=DEFAULT_WEBSOCKET_DISPATCH_OVERFLOW, prewarm=False,
+                  prewarm_workers=DEFAULT_WEBSOCKET_PREWARM_WORKERS):
+
+        ''' reconnect_retries: consecutive failed attempts before giving up, None to never give up.
+            catch_up: after a reconnect, replay the items changed while the websocket was down.
+            dedup_size, dedup_window: repeated MessageIds are ignored among the last dedup_size
+            messages received within dedup_window seconds. Read whenever the websocket connects.
+            dispatch_*: worker pool, queue size and overflow policy (block, drop_newest, drop_oldest)
+            of the handlers registered with client.wsc.subscribe(). Read on the first subscribe.
+            prewarm: fetch again, on prewarm_workers threads, the cached items a LibraryChanged or
+            UserDataChanged message updates, so the next get_item is served from the cache.
+        '''
+        LOG.debug("Begin websocket constructor.")
+        self.data['websocket.reconnect'] = reconnect
+        self.data['websocket.reconnect_base'] = reconnect_base
+        self.data['websocket.reconnect_cap'] = reconnect_cap
+        self.data['websocket.reconnect_retries'] = reconnect_retries
+        self.data['websocket.catch_up'] = catch_up
+        self.data['websocket.dedup_size'] = dedup_size
+        self.data['websocket.dedup_window'] = dedup_window
+        self.data['websocket.dispatch_workers'] = dispatch_workers
+        self.data['websocket.dispatch_queue_size'] = dispatch_queue_size
+        self.data['websocket.dispatch_overflow'] = dispatch_overflow
+        self.data['websocket.prewarm'] = prewarm
+        self.data['websocket.prewarm_workers'] = prewarm_workers
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Breadth first library traversal over a worker pool or on the event loop. Requests to the server
+    are capped by the per server limiter of the HTTP layer (Config.http(max_in_flight=)).
+'''
+
+#################################################################################################
+
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .api import DEFAULT_PAGE_SIZE
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+DEFAULT_WORKERS = 8
+
+
+class CrawlProgress(object):
+
+    def __init__(self):
+
+        self.started = time.time()
+        self.items = 0
+        self.requests = 0
+        self.pending = 0
+        self.errors = 0
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def items_per_second(self):
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def requests_per_second(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return "<CrawlProgress items=%s requests=%s pending=%s errors=%s %.1f items/s>" % (
+            self.items, self.requests, self.pending, self.errors, self.items_per_second)
+
+
+class Crawler(object):
+
+    ''' Walk views -> folders -> series -> seasons -> episodes, yielding items as responses arrive.
+
+        for item in client.jellyfin.crawl(workers=16, max_concurrency=8, progress=print):
+            ...
+
+        workers sizes the thread pool; the in flight requests to the server, across every client and
+        crawler of the process, are capped with Config.http(max_in_flight=). Folders are listed
+        page_size items per request. progress, if given, is called with a CrawlProgress after every
+        folder. A failed folder is logged, counted in progress.errors and skipped.
+    '''
+    def __init__(self, api, workers=DEFAULT_WORKERS, progress=None, fields=None, page_size=DEFAULT_PAGE_SIZE):
+
+        self.api = api
+        self.workers = workers
+        self.fields = fields
+        self.page_size = page_size
+        self.progress = progress
+        self.stats = CrawlProgress()
+
+    def _children(self, item):
+
+        if item is None:
+            return (self.api.get_views() or {}).get('Items') or []
+
+        if item.get('Type') == "Series":
+            result = self.api.get_seasons(item['Id'])
+        elif item.get('Type') == "Season":
+            result = self.api.get_season(item.get('SeriesId') or item.get('ParentId'), item['Id'])
+        else:
+            return self._folder(item['Id'])
+
+        return (result or {}).get('Items') or []
+
+    def _folder(self, folder_id):
+        return list(self.api.iter_items({'ParentId': folder_id, 'Fields': self.fields}, self.page_size, strict=True))
+
+    def _expandable(self, item):
+        return item.get('IsFolder') or item.get('Type') in ("CollectionFolder", "UserView", "Series", "Season")
+
+    def crawl(self, roots=None):
+
+        ''' Generator of every item below roots (the user views by default).
+        '''
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = set(executor.submit(self._children, root) for root in (roots or [None]))
+
+        try:
+            while pending:
+                self.stats.pending = len(pending)
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    self.stats.requests += 1
+
+                    try:
+                        children = future.result()
+                    except Exception as error:
+                        LOG.error("Crawl request failed: %s", error)
+                        self.stats.errors += 1
+                        continue
+
+                    for child in children:
+                        self.stats.items += 1
+
+                        if self._expandable(child):
+                            pending.add(executor.submit(self._children, child))
+
+                        yield child
+
+                self.stats.pending = len(pending)
+
+                if self.progress is not None:
+                    self.progress(self.stats)
+        finally:
+            for future in pending:
+                future.cancel()
+
+            executor.shutdown(wait=False)
+
+
+class AsyncCrawler(Crawler):
+
+    ''' Crawler for AsyncAPI, an async generator listing up to `workers` folders at a time.
+
+        async for item in client.jellyfin.crawl(workers=16, progress=print):
+            ...
+    '''
+    async def _children(self, item):
+
+        if item is None:
+            return ((await self.api.get_views()) or {}).get('Items') or []
+
+        if item.get('Type') == "Series":
+            result = await self.api.get_seasons(item['Id'])
+        elif item.get('Type') == "Season":
+            result = await self.api.get_season(item.get('SeriesId') or item.get('ParentId'), item['Id'])
+        else:
+            return await self._folder(item['Id'])
+
+        return (result or {}).get('Items') or []
+
+    async def _folder(self, folder_id):
+        return [item async for item in self.api.iter_items({'ParentId': folder_id, 'Fields': self.fields},
+                                                           self.page_size, strict=True)]
+
+    async def crawl(self, roots=None):
+
+        ''' Async generator of every item below roots (the user views by default).
+        '''
+        queued = deque(roots or [None])
+        running = set()
+
+        try:
+            while queued or running:
+                while queued and len(running) < self.workers:
+                    running.add(asyncio.ensure_future(self._children(queued.popleft())))
+
+                self.stats.pending = len(running) + len(queued)
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    self.stats.requests += 1
+
+                    try:
+                        children = task.result()
+                    except Exception as error:
+                        LOG.error("Crawl request failed: %s", error)
+                        self.stats.errors += 1
+                        continue
+
+                    for child in children:
+                        self.stats.items += 1
+
+                        if self._expandable(child):
+                            queued.append(child)
+
+                        yield child
+
+                self.stats.pending = len(running) + len(queued)
+
+                if self.progress is not None:
+                    self.progress(self.stats)
+        finally:
+            for task in running:
+                task.cancel()
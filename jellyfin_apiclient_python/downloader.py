@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Resumable downloads of large files in parallel byte ranges, written in place into a preallocated file.
+'''
+
+#################################################################################################
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .exceptions import HTTPException
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_WORKERS = 4
+PROGRESS_INTERVAL = 0.25
+RANGE_RETRIES = 3
+RETRYABLE = ("ServerUnreachable", "ReadTimeout", 502, 503, 504)
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/')
+
+#################################################################################################
+
+
+def retryable(error):
+    return not isinstance(error, HTTPException) or error.status in RETRYABLE
+
+
+def range_headers(start, end):
+    return {'Range': "bytes=%s-%s" % (start, end), 'Accept-Encoding': "identity"}
+
+
+class Throttle(object):
+
+    ''' Bandwidth cap in bytes per second, shared by the workers of a download.
+    '''
+    def __init__(self, rate):
+
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.allowance = 0.0
+        self.last = time.time()
+
+    def reserve(self, size):
+
+        ''' Seconds to wait before size more bytes fit in the rate.
+        '''
+        with self.lock:
+            now = time.time()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate) - size
+            self.last = now
+
+            return -self.allowance / self.rate if self.allowance < 0 else 0
+
+    def consume(self, size):
+
+        wait = self.reserve(size)
+
+        if wait:
+            time.sleep(wait)
+
+
+class DownloadProgress(object):
+
+    def __init__(self, size, done):
+
+        self.started = time.time()
+        self.size = size
+        self.done = done
+        self.resumed = done
+        self.reported = 0
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def rate(self):
+        return (self.done - self.resumed) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def percent(self):
+        return 100.0 * self.done / self.size if self.size else None
+
+    def __repr__(self):
+        return "<DownloadProgress %s/%s bytes %.0f B/s>" % (self.done, self.size, self.rate)
+
+
+class RangeWriter(object):
+
+    ''' dest_file for HTTP.request writing one byte range in place. ranged: accept only a 206
+        whose Content-Range is exactly the requested range. begun tells a response whose body was
+        read from the None HTTP.request also returns for a 500.
+    '''
+    def __init__(self, download, handle, start, end, ranged=True):
+
+        self.download = download
+        self.handle = handle
+        self.position = start
+        self.end = end
+        self.ranged = ranged
+        self.begun = False
+        self.expected = None
+
+    def begin(self, status, headers):
+
+        self.begun = True
+
+        if not self.ranged:
+            encoding = headers.get('Content-Encoding', "identity").strip().lower()
+
+            if headers.get('Content-Length') and encoding in ("", "identity"):
+                self.expected = self.position + int(headers['Content-Length'])
+
+            return
+
+        match = CONTENT_RANGE.match(headers.get('Content-Range') or "")
+
+        if status != 206 or not match or (int(match.group(1)), int(match.group(2))) != (self.position, self.end):
+            raise HTTPException("RangeIgnored", "Asked for bytes %s-%s, got %s %s" % (
+                self.position, self.end, status, headers.get('Content-Range')))
+
+    def _put(self, chunk):
+
+        if self.download.cancelled.is_set():
+            raise HTTPException("Cancelled", "Download cancelled after another range failed")
+
+        if self.position + len(chunk) > self.end + 1:
+            raise HTTPException("RangeNotSatisfied", "Server sent more than the requested byte range")
+
+        self.handle.seek(self.position)
+        self.handle.write(chunk)
+        self.position += len(chunk)
+
+    def write(self, chunk):
+
+        self._put(chunk)
+        self.download.transferred(len(chunk))
+
+
+class AsyncRangeWriter(RangeWriter):
+
+    async def write(self, chunk):
+
+        self._put(chunk)
+        await self.download.transferred(len(chunk))
+
+
+class Download(object):
+
+    ''' One file: HEAD for the size, then chunk_size ranges fetched by `workers` threads into
+        path + ".part". Finished ranges are recorded in path + ".part.json", so a new Download of the
+        same file skips them. Servers without range support, or answering a range with anything but
+        a 206 of that exact range, get a single sequential request. The first range to fail for good
+        cancels the others. rate_limit caps the transfer in bytes per second, progress is called with
+        a DownloadProgress.
+    '''
+    def __init__(self, api, handler, path, params=None, workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 rate_limit=None, progress=None, retries=RANGE_RETRIES):
+
+        self.api = api
+        self.handler = handler
+        self.path = path
+        self.params = params
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.throttle = Throttle(rate_limit) if rate_limit else None
+        self.callback = progress
+        self.partial = path + ".part"
+        self.state_path = path + ".part.json"
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.state = None
+        self.progress = None
+
+    def _request(self, headers=None, action="GET", dest_file=None, retry=None):
+
+        request = {'type': action, 'handler': self.handler, 'params': dict(self.params or {})}
+
+        if headers:
+            request['headers'] = headers
+
+        if retry is not None:
+            request['retry'] = retry
+
+        return self.api.client.request(request, dest_file=dest_file)
+
+    def _transfer(self, writer, headers, retry=None):
+
+        writer.begun = False
+        self._request(headers, dest_file=writer, retry=retry)
+
+        if not writer.begun:
+            raise HTTPException("DownloadFailed", "The server returned no body for %s" % self.handler)
+
+    def _load_state(self, size, validator):
+
+        try:
+            with open(self.state_path) as state_file:
+                state = json.load(state_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if (state.get('size') != size or state.get('validator') != validator or
+                state.get('chunk_size') != self.chunk_size or not os.path.exists(self.partial)):
+            return None
+
+        return state
+
+    def _save_state(self):
+
+        temp = self.state_path + ".tmp"
+
+        with open(temp, 'w') as state_file:
+            json.dump(self.state, state_file)
+
+        os.replace(temp, self.state_path)
+
+    def _preallocate(self, size):
+
+        with open(self.partial, 'ab') as handle:
+            handle.truncate(size)
+
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(handle.fileno(), 0, size)
+                except OSError:
+                    pass
+
+    def transferred(self, size):
+
+        if self.throttle is not None:
+            self.throttle.consume(size)
+
+        self._advance(size)
+
+    def _advance(self, size):
+
+        with self.lock:
+            self.progress.done += size
+            report = self.callback is not None and time.time() - self.progress.reported >= PROGRESS_INTERVAL
+
+            if report:
+                self.progress.reported = time.time()
+
+        if report:
+            self.callback(self.progress)
+
+    def _range(self, index):
+
+        start = index * self.chunk_size
+
+        return start, min(start + self.chunk_size, self.state['size']) - 1
+
+    def _range_failed(self, attempt, error, start, end, writer):
+
+        if attempt == self.retries or not retryable(error):
+            raise error
+
+        LOG.warning("Range %s-%s interrupted at %s: %s", start, end, writer.position, error)
+
+    def _range_done(self, index, handle):
+
+        handle.flush()
+        os.fsync(handle.fileno())
+
+        with self.lock:
+            self.state['done'].append(index)
+            self._save_state()
+
+    def _fetch(self, index):
+
+        ''' A broken transfer resumes from the last byte written rather than from the range start.
+        '''
+        start, end = self._range(index)
+
+        with open(self.partial, 'r+b') as handle:
+            writer = RangeWriter(self, handle, start, end)
+
+            for attempt in range(self.retries + 1):
+                try:
+                    self._transfer(writer, range_headers(writer.position, end), retry=0)
+                except Exception as error:
+                    self._range_failed(attempt, error, start, end, writer)
+
+                if writer.position > end:
+                    break
+            else:
+                raise HTTPException("IncompleteRange", "Range %s-%s ended at %s" % (start, end, writer.position))
+
+            self._range_done(index, handle)
+
+    def _sequential(self):
+
+        ''' No size or no range support: one request, from zero, checked against its Content-Length.
+        '''
+        self.progress = DownloadProgress(None, 0)
+
+        with open(self.partial, 'wb') as handle:
+            writer = RangeWriter(self, handle, 0, float('inf'), ranged=False)
+            self._transfer(writer, {'Accept-Encoding': "identity"})
+
+        self._check_sequential(writer)
+
+    def _check_sequential(self, writer):
+
+        if writer.expected is not None and writer.position != writer.expected:
+            raise HTTPException("IncompleteDownload", "%s: %s of %s bytes" % (
+                self.handler, writer.position, writer.expected))
+
+    def _parallel(self, chunks):
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = [executor.submit(self._fetch, index) for index in chunks]
+
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # Queued ranges never start, running ones stop at their next write.
+            self.cancelled.set()
+
+            for future in futures:
+                future.cancel()
+
+            raise
+        finally:
+            executor.shutdown(wait=True)
+
+    def _plan(self, headers):
+
+        ''' The chunks left to fetch for the HEAD response headers, None to download sequentially.
+        '''
+        size = int(headers.get('Content-Length') or 0)
+        ranges = headers.get('Accept-Ranges', "").lower() == "bytes"
+
+        if not size or not ranges:
+            LOG.info("Downloading %s sequentially", self.handler)
+
+            return None
+
+        validator = headers.get('ETag') or headers.get('Last-Modified')
+        self.state = self._load_state(size, validator)
+
+        if self.state is None:
+            self.state = {'size': size, 'validator': validator, 'chunk_size': self.chunk_size, 'done': []}
+            self._preallocate(size)
+            self._save_state()
+
+        done = set(self.state['done'])
+        chunks = [index for index in range((size + self.chunk_size - 1) // self.chunk_size) if index not in done]
+        resumed = sum(min(self.chunk_size, size - index * self.chunk_size) for index in done)
+        self.progress = DownloadProgress(size, resumed)
+        LOG.info("Downloading %s: %s bytes, %s/%s chunks left", self.handler, size, len(chunks), len(chunks) + len(done))
+
+        return chunks
+
+    def _ranges_ignored(self, error):
+
+        if error.status != "RangeIgnored":
+            raise error
+
+        LOG.warning("Downloading %s sequentially: %s", self.handler, error)
+        self.cancelled.clear()
+
+    def _check_ranges(self):
+
+        missing = (self.state['size'] + self.chunk_size - 1) // self.chunk_size - len(set(self.state['done']))
+
+        if missing:
+            raise HTTPException("IncompleteDownload", "%s: %s chunks missing" % (self.handler, missing))
+
+    def _finish(self):
+
+        os.replace(self.partial, self.path)
+
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+        if self.callback is not None:
+            self.callback(self.progress)
+
+        return self.path
+
+    def run(self):
+
+        ''' Blocks until the file is complete at `path`, which is returned.
+        '''
+        chunks = self._plan(self._request(action="HEAD") or {})
+
+        if chunks is None:
+            self._sequential()
+        else:
+            try:
+                self._parallel(chunks)
+            except HTTPException as error:
+                self._ranges_ignored(error)
+                self._sequential()
+            else:
+                self._check_ranges()
+
+        return self._finish()
+
+
+class AsyncDownload(Download):
+
+    ''' Download for AsyncAPI: the ranges are requested concurrently from the event loop, at most
+        `workers` at a time, and written to the file as they arrive. The first range to fail for good
+        cancels the others.
+
+        path = await client.jellyfin.download(handler, path, workers=8)
+    '''
+    async def transferred(self, size):
+
+        if self.throttle is not None:
+            wait = self.throttle.reserve(size)
+
+            if wait:
+                await asyncio.sleep(wait)
+
+        self._advance(size)
+
+    async def _transfer(self, writer, headers, retry=None):
+
+        writer.begun = False
+        await self._request(headers, dest_file=writer, retry=retry)
+
+        if not writer.begun:
+            raise HTTPException("DownloadFailed", "The server returned no body for %s" % self.handler)
+
+    async def _fetch(self, index, slots):
+
+        start, end = self._range(index)
+
+        async with slots:
+            with open(self.partial, 'r+b') as handle:
+                writer = AsyncRangeWriter(self, handle, start, end)
+
+                for attempt in range(self.retries + 1):
+                    try:
+                        await self._transfer(writer, range_headers(writer.position, end), retry=0)
+                    except Exception as error:
+                        self._range_failed(attempt, error, start, end, writer)
+
+                    if writer.position > end:
+                        break
+                else:
+                    raise HTTPException("IncompleteRange", "Range %s-%s ended at %s" % (start, end, writer.position))
+
+                self._range_done(index, handle)
+
+    async def _sequential(self):
+
+        self.progress = DownloadProgress(None, 0)
+
+        with open(self.partial, 'wb') as handle:
+            writer = AsyncRangeWriter(self, handle, 0, float('inf'), ranged=False)
+            await self._transfer(writer, {'Accept-Encoding': "identity"})
+
+        self._check_sequential(writer)
+
+    async def _parallel(self, chunks):
+
+        slots = asyncio.Semaphore(self.workers)
+        tasks = [asyncio.ensure_future(self._fetch(index, slots)) for index in chunks]
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                await task
+        except BaseException:
+            self.cancelled.set()
+
+            for task in tasks:
+                task.cancel()
+
+            # Let the cancelled ranges close their file before the caller moves on.
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def run(self):
+
+        chunks = self._plan(await self._request(action="HEAD") or {})
+
+        if chunks is None:
+            await self._sequential()
+        else:
+            try:
+                await self._parallel(chunks)
+            except HTTPException as error:
+                self._ranges_ignored(error)
+                await self._sequential()
+            else:
+                self._check_ranges()
+
+        return self._finish()
@@ -3,70 +3,130 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 #################################################################################################
 
-import json
 import logging
 import time
+from contextlib import contextmanager
 
 import requests
 from six import string_types
 
+from .breaker import CLOSED, OPEN, CircuitBreaker
+from .cache import ResponseCache, referenced_ids
 from .exceptions import HTTPException
+from .json_stream import CHUNK_SIZE, ItemStream
+from .limiter import ServerLimiter
+from .request_log import log_request, log_response
+from .retry import RetryPolicies
+from .singleflight import SingleFlight
+from .streaming import WRITABLE_BUFFERS, iter_views, read_into
+from .transport import Transport
 
 #################################################################################################
 
 LOG = logging.getLogger('Jellyfin.' + __name__)
+GATEWAY_ERRORS = (502, 503, 504)
 
 #################################################################################################
 
 
+class RequestContext(object):
+
+    ''' Headers and url placeholder values, computed once per configuration version.
+    '''
+    def __init__(self, data):
+
+        self.data = data
+        self.version = getattr(data, 'version', None)
+        self.placeholders = (
+            ("{server}", data.get('auth.server')),
+            ("{UserId}", data.get('auth.user_id')),
+            ("{DeviceId}", data.get('app.device_id'))
+        )
+
+        auth = "MediaBrowser "
+        auth += "Client=%s, " % data.get('app.name', "Jellyfin for Kodi")
+        auth += "Device=%s, " % data.get('app.device_name', 'Unknown Device')
+        auth += "DeviceId=%s, " % data.get('app.device_id', 'Unknown Device id')
+        auth += "Version=%s" % data.get('app.version', '0.0.0')
+        self.authorization = {'x-emby-authorization': auth}
+
+        if data.get('auth.token') and data.get('auth.user_id'):
+
+            auth += ', UserId=%s' % data.get('auth.user_id')
+            self.authorization = {'x-emby-authorization': auth, 'X-MediaBrowser-Token': data.get('auth.token')}
+
+        self.headers = {
+            'Content-type': "application/json",
+            'Accept-Charset': "UTF-8,*",
+            'Accept-encoding': "gzip",
+            'User-Agent': data.get('http.user_agent') or "%s/%s" % (data.get('app.name', 'Jellyfin for Kodi'), data.get('app.version', "0.0.0"))
+        }
+        self.headers.update(self.authorization)
+
+
 class HTTP(object):
 
     session = None
     keep_alive = False
+    breaker = None
+    context = None
 
     def __init__(self, client):
 
         self.client = client
         self.config = client.config
+        self.transport = Transport(self.config)
+        self.cache = ResponseCache(self.config)
+        self.retry = RetryPolicies()
+        self.singleflight = SingleFlight()
 
     def start_session(self):
+        self.session = self.transport.open()
 
-        self.session = requests.Session()
+    def stop_session(self):
 
-        max_retries = self.config.data['http.max_retries']
-        self.session.mount("http://", requests.adapters.HTTPAdapter(max_retries=max_retries))
-        self.session.mount("https://", requests.adapters.HTTPAdapter(max_retries=max_retries))
+        self.transport.close()
+        self.session = None
 
-    def stop_session(self):
+        if self.breaker is not None:
+            self.breaker.unsubscribe(self._circuit_changed)
+            self.breaker = None
 
-        if self.session is None:
-            return
+    def get_session(self):
 
-        try:
-            LOG.info("--<[ session/%s ]", id(self.session))
-            self.session.close()
-        except Exception as error:
-            LOG.warning("The requests session could not be terminated: %s", error)
+        ''' The pooled session shared by request() and API.send_request, created on first use.
+            With http.session_mode "thread", the session of the calling thread.
+        '''
+        return self.transport.get_session()
 
-    def _replace_user_info(self, string):
+    def pool_stats(self):
+        return self.transport.pool_stats()
 
-        if '{server}' in string:
-            if self.config.data.get('auth.server', None):
-                string = string.replace("{server}", self.config.data['auth.server'])
-            else:
-                LOG.debug("Server address not set")
+    def _get_context(self):
 
-        if '{UserId}'in string:
-            if self.config.data.get('auth.user_id', None):
-                string = string.replace("{UserId}", self.config.data['auth.user_id'])
-            else:
-                LOG.debug("UserId is not set.")
+        ''' The request context is rebuilt only when Config.app, Config.auth or the token changed.
+            A plain dict assigned to Config.data has no version, its context is rebuilt every time.
+        '''
+        context = self.context
+        data = self.config.data
+        version = getattr(data, 'version', None)
 
-        if '{DeviceId}'in string:
-            if self.config.data.get('app.device_id', None):
-                string = string.replace("{DeviceId}", self.config.data['app.device_id'])
-            else:
-                LOG.debug("DeviceId is not set.")
+        if context is None or context.data is not data or version is None or context.version != version:
+            context = self.context = RequestContext(data)
+
+        return context
+
+    def _replace_user_info(self, string):
+
+        if '{' not in string:
+            return string
+
+        for placeholder, value in self._get_context().placeholders:
+            if placeholder in string:
+                if value:
+                    string = string.replace(placeholder, value)
+                else:
+                    LOG.debug("%s is not set.", placeholder)
 
         return string
 
@@ -81,54 +141,148 @@ class HTTP(object):
             json: request body (optional)
             headers: (optional),
             verify: ssl certificate, True (verify using device built-in library) or False
+            retry: number of retries, overriding the retry policy (optional)
+            stream_items: return an ItemStream decoding the Items array incrementally (optional)
+            stream_views: return a generator of memoryviews over one reused buffer (optional)
+            raw: return the requests response, body read, instead of the decoded json (optional)
+            cache: serve and store the GET response through the response cache (optional)
+            With http.singleflight, identical GETs running concurrently share one request and response.
+            HEAD requests return the response headers.
         '''
         if not data:
             raise AttributeError("Request cannot be empty")
 
+        sample = self.client.metrics.start(data)
+        key = self._flight_key(data, dest_file) if self.config.data.get('http.singleflight') else None
+
+        try:
+            if key is None:
+                response = self._leased_send(data, session, dest_file, sample)
+            else:
+                response, shared = self.singleflight.do(key, self._leased_send, data, session, dest_file, sample)
+
+                if shared:
+                    sample.status = "shared"
+        except Exception as error:
+            self.client.metrics.observe(sample, error)
+            raise
+
+        self.client.metrics.observe(sample)
+
+        return response
+
+    def _flight_key(self, data, dest_file):
+
+        ''' Plain GETs are merged on the resolved url, params, headers and user.
+        '''
+        if dest_file is not None or data.get('type', "GET") != "GET" or data.get('json') is not None:
+            return None
+
+        if data.get('stream_items') or data.get('stream_views') or data.get('raw'):
+            return None
+
+        url = self._replace_user_info(data.get('url') or "{server}/%s" % data.get('handler', ""))
+        params = tuple(sorted((str(k), self._replace_user_info(str(v))) for k, v in (data.get('params') or {}).items()))
+        headers = tuple(sorted((data.get('headers') or {}).items()))
+
+        return url, params, headers, self.config.data.get('auth.user_id')
+
+    def _leased_send(self, data, session, dest_file, sample):
+
+        with self.transport.lease() as leased:
+            return self._send(data, session or leased, dest_file, sample)
+
+    def _send(self, data, session, dest_file, sample):
+
         data = self._request(data)
-        LOG.debug("--->[ http ] %s", json.dumps(data, indent=4))
-        retry = data.pop('retry', 5)
-        stream = dest_file is not None
+        log_request(LOG, data, self.config)
+        retries = data.pop('retry', None)
+        action = data.pop('type', "GET")
+        policy = self.retry.policy_for(data['url'])
+        started = time.time()
+        attempt = 0
+        stream_items = data.pop('stream_items', False)
+        stream_views = data.pop('stream_views', False)
+        raw = data.pop('raw', False)
+        stream = dest_file is not None or stream_items or stream_views
+        cache_key = entry = None
+        breaker = self._get_breaker()
+        limiter = self._get_limiter()
+
+        if data.pop('cache', False) and self.cache.enabled and action == "GET":
+            cache_key = self.cache.key(data)
+            entry = self.cache.get(cache_key)
+
+            if entry is not None:
+                if self.cache.is_fresh(entry):
+                    sample.status = "cached"
+
+                    return self.cache.hit(entry)
+
+                if entry.etag:
+                    data['headers'] = dict(data['headers'])
+                    data['headers']['If-None-Match'] = entry.etag
 
         while True:
 
+            self._check_circuit(breaker, session, data)
+
             try:
-                r = self._requests(session or self.session or requests, data.pop('type', "GET"), **data, stream=stream)
-                if stream:
-                    for chunk in r.iter_content(chunk_size=8192): 
-                        if chunk: # filter out keep-alive new chunks
-                            dest_file.write(chunk)
-                else:
-                    r.content  # release the connection
+                with self._limit(limiter, sample):
+                    r = self._requests(session or self.get_session(), action, **data, stream=stream)
+                    sample.response(r)
+
+                    # Gateway errors are counted once the retries are exhausted, below.
+                    if breaker is not None and r.status_code not in GATEWAY_ERRORS:
+                        breaker.success()
+
+                    if dest_file is not None and r.ok:
+                        sample.bytes_in += self._read_body(r, dest_file)
+                    elif not (stream_items or stream_views) or not r.ok:
+                        sample.bytes_in += len(r.content)  # also releases the connection
+                    else:
+                        sample.bytes_in += int(r.headers.get('Content-Length') or 0)
 
-                if not self.keep_alive and self.session is not None:
-                    self.stop_session()
+                if not self.keep_alive:
+                    self.transport.reap_idle()
 
                 r.raise_for_status()
 
             except requests.exceptions.ConnectionError as error:
-                if retry:
+                delay = self._next_delay(policy, attempt, started, retries, "ConnectionError", sample=sample)
 
-                    retry -= 1
-                    time.sleep(1)
+                if delay is not None:
+
+                    attempt += 1
+                    time.sleep(delay)
 
                     continue
 
                 LOG.error(error)
-                self.client.callback("ServerUnreachable", {'ServerId': self.config.data['auth.server-id']})
+
+                if breaker is not None:
+                    breaker.failure()
+
+                if breaker is None:  # otherwise the callback fires when the circuit opens
+                    self.client.callback("ServerUnreachable", {'ServerId': self.config.data['auth.server-id']})
 
                 raise HTTPException("ServerUnreachable", error)
 
             except requests.exceptions.ReadTimeout as error:
-                if retry:
+                delay = self._next_delay(policy, attempt, started, retries, "ReadTimeout", sample=sample)
 
-                    retry -= 1
-                    time.sleep(1)
+                if delay is not None:
+
+                    attempt += 1
+                    time.sleep(delay)
 
                     continue
 
                 LOG.error(error)
 
+                if breaker is not None:
+                    breaker.failure()
+
                 raise HTTPException("ReadTimeout", error)
 
             except requests.exceptions.HTTPError as error:
@@ -151,14 +305,20 @@ class HTTP(object):
 
                     return
 
-                elif r.status_code == 502:
-                    if retry:
+                elif r.status_code in policy.statuses:
+                    delay = self._next_delay(policy, attempt, started, retries, r.status_code,
+                                             r.status_code, r.headers.get('Retry-After'), sample)
+
+                    if delay is not None:
 
-                        retry -= 1
-                        time.sleep(1)
+                        attempt += 1
+                        time.sleep(delay)
 
                         continue
 
+                if breaker is not None and r.status_code in GATEWAY_ERRORS:
+                    breaker.failure()
+
                 raise HTTPException(r.status_code, error)
 
             except requests.exceptions.MissingSchema as error:
@@ -170,18 +330,152 @@ class HTTP(object):
 
             else:
                 try:
-                    if stream:
+                    if dest_file is not None:
                         return
                     self.config.data['server-time'] = r.headers['Date']
+                    if action == "HEAD":
+                        return r.headers
+                    if raw:
+                        return r
+                    if stream_items:
+                        return ItemStream(r.iter_content(chunk_size=CHUNK_SIZE), on_close=r.close)
+                    if stream_views:
+                        return iter_views(r, self.config.data['http.stream_buffer_size'])
+                    if entry is not None and r.status_code == 304:
+                        return self.cache.hit(entry, revalidated=True)
                     elapsed = int(r.elapsed.total_seconds() * 1000)
                     response = r.json()
-                    LOG.debug("---<[ http ][%s ms]", elapsed)
-                    LOG.debug(json.dumps(response, indent=4))
+                    if cache_key is not None:
+                        item_ids = referenced_ids(data['url'], data.get('params'), response)
+                        self.cache.store(cache_key, r.content, r.headers.get('ETag'), item_ids)
+                    log_response(LOG, response, elapsed, self.config)
 
                     return response
                 except ValueError:
                     return
 
+    def _read_body(self, r, dest_file):
+
+        ''' dest_file is either a writable buffer (bytearray, mmap...) filled in place, or a file like
+            object whose write() gets views of a reused buffer and must consume them before returning.
+            A file like object may also have begin(status, headers), called before the body is read,
+            which refuses the response by raising.
+        '''
+        if isinstance(dest_file, WRITABLE_BUFFERS):
+            return read_into(r, dest_file)
+
+        begin = getattr(dest_file, 'begin', None)
+
+        if begin is not None:
+            try:
+                begin(r.status_code, r.headers)
+            except Exception:
+                r.close()
+                raise
+
+        size = 0
+
+        for view in iter_views(r, self.config.data['http.stream_buffer_size']):
+            dest_file.write(view)
+            size += len(view)
+
+        return size
+
+    def _get_limiter(self):
+
+        max_in_flight = self.config.data.get('http.max_in_flight')
+        rate = self.config.data.get('http.rate_limit')
+        server = self.config.data.get('auth.server')
+
+        if not (max_in_flight or rate) or not server:
+            return None
+
+        return ServerLimiter.get(server, max_in_flight, rate, self.config.data.get('http.rate_burst'))
+
+    @contextmanager
+    def _limit(self, limiter, sample):
+
+        ''' Hold a slot of the server limiter while the request and its body are transferred.
+        '''
+        if limiter is None:
+            yield
+            return
+
+        sample.queue_wait += limiter.acquire()
+
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def _get_breaker(self):
+
+        threshold = self.config.data.get('http.breaker_threshold')
+        server = self.config.data.get('auth.server')
+
+        if not threshold or not server:
+            return None
+
+        breaker = CircuitBreaker.get(server, threshold, self.config.data['http.breaker_reset_timeout'])
+
+        if breaker is not self.breaker:
+            if self.breaker is not None:
+                self.breaker.unsubscribe(self._circuit_changed)
+
+            breaker.subscribe(self._circuit_changed)
+            self.breaker = breaker
+
+        return breaker
+
+    def _circuit_changed(self, breaker, old, state):
+
+        if old == CLOSED and state == OPEN:
+            self.client.callback("ServerUnreachable", {'ServerId': self.config.data.get('auth.server-id')})
+        elif state == CLOSED:
+            self.client.callback("ServerOnline", {'Id': self.config.data.get('auth.server-id')})
+
+    def _check_circuit(self, breaker, session, data):
+
+        ''' Fail fast while the circuit is open. The caller picked for the half open probe first
+            checks System/Info/Public, which decides whether the circuit closes again.
+        '''
+        if breaker is None:
+            return
+
+        state = breaker.acquire()
+
+        if state == CLOSED:
+            return
+
+        if state == OPEN:
+            raise HTTPException("ServerUnreachable", "Circuit open for %s" % breaker.server)
+
+        try:
+            probe = (session or self.get_session()).get("%s/System/Info/Public" % breaker.server,
+                                                         timeout=data['timeout'], verify=data['verify'])
+            probe.raise_for_status()
+        except requests.exceptions.RequestException as error:
+            breaker.failure()
+            raise HTTPException("ServerUnreachable", error)
+        except BaseException:
+            breaker.failure()  # interrupted, release the probe so another caller can take it
+            raise
+
+        breaker.success()
+
+    def _next_delay(self, policy, attempt, started, retries, reason, status=None, retry_after=None, sample=None):
+
+        delay = policy.delay(attempt, started, retries, status, retry_after)
+        self.retry.record(reason, delay)
+
+        if delay is not None:
+            if sample is not None:
+                sample.retries += 1
+
+            LOG.debug("Retrying after %s (attempt %s) in %.2fs", reason, attempt + 1, delay)
+
+        return delay
+
     def _request(self, data):
 
         if 'url' not in data:
@@ -191,8 +485,12 @@ class HTTP(object):
         data['timeout'] = data.get('timeout') or self.config.data['http.timeout']
         data['verify'] = data.get('verify') or self.config.data.get('auth.ssl', False)
         data['url'] = self._replace_user_info(data['url'])
-        self._process_params(data.get('params') or {})
-        self._process_params(data.get('json') or {})
+
+        if data.get('params'):
+            self._process_params(data['params'])
+
+        if data.get('json'):
+            self._process_params(data['json'])
 
         return data
 
@@ -212,32 +510,15 @@ class HTTP(object):
         data['headers'] = data.setdefault('headers', {})
 
         if not data['headers']:
-            data['headers'].update({
-                'Content-type': "application/json",
-                'Accept-Charset': "UTF-8,*",
-                'Accept-encoding': "gzip",
-                'User-Agent': self.config.data['http.user_agent'] or "%s/%s" % (self.config.data.get('app.name', 'Jellyfin for Kodi'), self.config.data.get('app.version', "0.0.0"))
-            })
-
-        if 'x-emby-authorization' not in data['headers']:
+            data['headers'].update(self._get_context().headers)
+        elif 'x-emby-authorization' not in data['headers']:
             self._authorization(data)
 
         return data
 
     def _authorization(self, data):
 
-        auth = "MediaBrowser "
-        auth += "Client=%s, " % self.config.data.get('app.name', "Jellyfin for Kodi")
-        auth += "Device=%s, " % self.config.data.get('app.device_name', 'Unknown Device')
-        auth += "DeviceId=%s, " % self.config.data.get('app.device_id', 'Unknown Device id')
-        auth += "Version=%s" % self.config.data.get('app.version', '0.0.0')
-
-        data['headers'].update({'x-emby-authorization': auth})
-
-        if self.config.data.get('auth.token') and self.config.data.get('auth.user_id'):
-            
-            auth += ', UserId=%s' % self.config.data.get('auth.user_id')
-            data['headers'].update({'x-emby-authorization': auth, 'X-MediaBrowser-Token': self.config.data.get('auth.token')})
+        data['headers'].update(self._get_context().authorization)
 
         return data
 
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Turn LibraryChanged and UserDataChanged websocket messages into precise cache invalidations.
+'''
+
+#################################################################################################
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import API
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+LIBRARY_CHANGES = ('ItemsAdded', 'ItemsUpdated', 'ItemsRemoved', 'FoldersAddedTo', 'FoldersRemovedFrom')
+
+#################################################################################################
+
+
+def changed_ids(message_type, data):
+
+    ''' Returns (touched, updated): every item id the message affects, and the ones still existing
+        with new content that are worth fetching again.
+    '''
+    data = data or {}
+
+    if message_type == "LibraryChanged":
+        touched = set()
+
+        for change in LIBRARY_CHANGES:
+            touched.update(data.get(change) or [])
+
+        return touched, set(data.get('ItemsUpdated') or [])
+
+    if message_type == "UserDataChanged":
+        touched = set(x['ItemId'] for x in data.get('UserDataList') or [] if x.get('ItemId'))
+
+        return touched, touched
+
+    return set(), set()
+
+
+class InvalidationBus(object):
+
+    ''' Fed every websocket message by WSClient. Drops the cache entries that depend on the touched
+        items, then tells subscribers which ids changed:
+
+        client.invalidation.subscribe(lambda message_type, item_ids: ...)
+
+        With Config.websocket(prewarm=True), updated items that were cached are fetched again in
+        the background, so the next get_item is served from the cache.
+    '''
+    def __init__(self, client):
+
+        self.client = client
+        self.config = client.config
+        self.api = API(client.http)
+        self.executor = None
+        self.listeners = []
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def handle(self, message_type, data):
+
+        touched, updated = changed_ids(message_type, data)
+
+        if not touched:
+            return
+
+        cache = self.client.http.cache
+        warm = [x for x in updated if cache.references(x)] if self.config.data.get('websocket.prewarm') else []
+        dropped = cache.invalidate(touched)
+        LOG.debug("%s touched %s item(s), dropped %s cache entries", message_type, len(touched), dropped)
+
+        for listener in list(self.listeners):
+            try:
+                listener(message_type, touched)
+            except Exception:
+                LOG.exception("Exception in invalidation listener.")
+
+        if warm:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.config.data['websocket.prewarm_workers'])
+
+            for item_id in warm:
+                self.executor.submit(self._warm, item_id)
+
+    def _warm(self, item_id):
+
+        try:
+            self.api.get_item(item_id)
+        except Exception as error:
+            LOG.debug("Could not prewarm %s: %s", item_id, error)
+
+    def stop(self):
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
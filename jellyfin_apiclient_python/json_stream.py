@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Incremental decoding of Jellyfin query results ({"Items": [...], "TotalRecordCount": n}).
+    Only the element being decoded is held in memory, never the whole body.
+'''
+
+#################################################################################################
+
+import codecs
+import json
+import logging
+import re
+from collections import deque
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+CHUNK_SIZE = 65536
+
+TOKENS = re.compile(r'[{}\[\]"]')
+STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+SCALAR = re.compile(r'[^,\]}\s]+')
+WHITESPACE = re.compile(r'\s*')
+
+# Parser states: before the object, between members, after a key, before a value, at the start
+# of the streamed array, after one of its elements, before the next one, done.
+START, MEMBERS, COLON, VALUE, FIRST, SEPARATOR, ELEMENT, DONE = range(8)
+
+#################################################################################################
+
+
+class NeedMore(Exception):
+    pass
+
+
+class Feed(object):
+
+    ''' Chunks pushed by an asynchronous reader. Iterating an empty feed raises NeedMore, which
+        leaves the ItemStream reading it ready to resume once the next chunk is pushed.
+    '''
+    def __init__(self):
+
+        self.chunks = deque()
+        self.ended = False
+
+    def push(self, chunk):
+
+        ''' An empty chunk ends the feed.
+        '''
+        if chunk:
+            self.chunks.append(chunk)
+        else:
+            self.ended = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+
+        if self.chunks:
+            return self.chunks.popleft()
+
+        if self.ended:
+            raise StopIteration
+
+        raise NeedMore()
+
+    next = __next__
+
+
+class ItemStream(object):
+
+    ''' Iterate over the elements of the top level array `key` as they arrive.
+        Every other top level member is stored in metadata; members that follow the array,
+        such as TotalRecordCount, are only available once iteration is complete.
+
+        stream = api.stream_items({'ParentId': view_id, 'Fields': info()})
+        for item in stream:
+            ...
+        stream.metadata['TotalRecordCount']
+
+        The parser only moves past a token once it is complete, so a Feed running dry in the
+        middle of one (NeedMore) is resumed by calling _next_item() again.
+    '''
+    def __init__(self, chunks, key='Items', on_close=None):
+
+        self.chunks = iter(chunks)
+        self.key = key
+        self.on_close = on_close
+        self.metadata = {}
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.scan = None  # (position, depth) to resume an incomplete container scan
+        self.state = START
+        self.member = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+
+        try:
+            return self._next_item()
+        except StopIteration:
+            for _ in self.chunks:  # drain so the connection goes back to the pool
+                pass
+
+            self.close()
+            raise
+
+    next = __next__
+
+    @property
+    def total_record_count(self):
+        return self.metadata.get('TotalRecordCount')
+
+    def close(self):
+
+        self.state = DONE
+
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _fill(self):
+
+        ''' Append the next chunk to the buffer, dropping what was already consumed.
+        '''
+        if self.eof:
+            return False
+
+        try:
+            text = self.decoder.decode(next(self.chunks))
+        except StopIteration:
+            text = self.decoder.decode(b"", final=True)
+            self.eof = True
+
+        if self.scan is not None:
+            self.scan = (self.scan[0] - self.pos, self.scan[1])
+
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+
+        return True
+
+    def _peek(self):
+
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char):
+
+        if self._peek() != char:
+            raise ValueError("Expected %r at position %s of JSON stream" % (char, self.pos))
+
+        self.pos += 1
+
+    def _value_end(self):
+
+        ''' End index of the value starting at self.pos, or None if the buffer does not hold all of it yet.
+        '''
+        char = self.buf[self.pos]
+
+        if char == '"':
+            match = STRING_END.match(self.buf, self.pos + 1)
+            return match.end() if match else None
+
+        if char not in '{[':
+            match = SCALAR.match(self.buf, self.pos)
+
+            if match is None or (match.end() == len(self.buf) and not self.eof):
+                return None
+
+            return match.end()
+
+        position, depth = self.scan or (self.pos, 0)
+
+        while True:
+            match = TOKENS.search(self.buf, position)
+
+            if match is None:
+                self.scan = (len(self.buf), depth)
+                return None
+
+            token = match.group()
+            position = match.end()
+
+            if token == '"':
+                string = STRING_END.match(self.buf, position)
+
+                if string is None:
+                    self.scan = (match.start(), depth)
+                    return None
+
+                position = string.end()
+            elif token in '{[':
+                depth += 1
+            else:
+                depth -= 1
+
+                if depth == 0:
+                    self.scan = None
+                    return position
+
+    def _value(self):
+
+        self._peek()
+
+        while True:
+            end = self._value_end()
+
+            if end is not None:
+                value = json.loads(self.buf[self.pos:end])
+                self.pos = end
+
+                return value
+
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _next_item(self):
+
+        ''' The next element of the array, StopIteration once the object is complete.
+        '''
+        while True:
+            state = self.state
+
+            if state == DONE:
+                raise StopIteration
+
+            if state == START:
+                self._expect('{')
+                self.state = MEMBERS
+
+            elif state == MEMBERS:
+                char = self._peek()
+
+                if char == '}':
+                    self.pos += 1
+                    self.state = DONE
+                elif char == ',':
+                    self.pos += 1
+                else:
+                    self.member = self._value()
+                    self.state = COLON
+
+            elif state == COLON:
+                self._expect(':')
+                self.state = VALUE
+
+            elif state == VALUE:
+                if self.member == self.key and self._peek() == '[':
+                    self.pos += 1
+                    self.state = FIRST
+                else:
+                    self.metadata[self.member] = self._value()
+                    self.state = MEMBERS
+
+            elif state == SEPARATOR:
+                char = self._peek()
+
+                if char == ']':
+                    self.pos += 1
+                    self.state = MEMBERS
+                elif char == ',':
+                    self.pos += 1
+                    self.state = ELEMENT
+                else:
+                    raise ValueError("Expected ',' at position %s of JSON stream" % self.pos)
+
+            elif state == FIRST and self._peek() == ']':
+                self.pos += 1
+                self.state = MEMBERS
+
+            else:  # FIRST or ELEMENT
+                item = self._value()
+                self.state = SEPARATOR
+
+                return item
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Per server limits on in flight requests and request rate, shared by every client of the process.
+'''
+
+#################################################################################################
+
+import logging
+import threading
+import time
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+
+#################################################################################################
+
+
+class TokenBucket(object):
+
+    ''' rate requests per second, bursts of up to burst requests. Callers reserve their token
+        under the lock and sleep outside of it, so they are served in arrival order.
+    '''
+    def __init__(self, rate, burst=None):
+
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self.tokens = self.burst
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def take(self, blocking=True):
+
+        ''' Seconds slept for the token; not blocking, None when no token is available right now.
+        '''
+        with self.lock:
+            now = time.time()
+            tokens = min(self.burst, self.tokens + (now - self.last) * self.rate) - 1
+
+            if not blocking and tokens < 0:
+                return None
+
+            self.tokens = tokens
+            self.last = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+        return wait
+
+
+class ServerLimiter(object):
+
+    ''' At most max_in_flight concurrent requests and, with rate, a token bucket per server address.
+        The limits of the first client asking for a server apply to all of them.
+    '''
+    lock = threading.Lock()
+    limiters = {}
+
+    @classmethod
+    def get(cls, server, max_in_flight=0, rate=0, burst=None):
+
+        with cls.lock:
+            if server not in cls.limiters:
+                cls.limiters[server] = cls(server, max_in_flight, rate, burst)
+
+            return cls.limiters[server]
+
+    def __init__(self, server, max_in_flight=0, rate=0, burst=None):
+
+        self.server = server
+        self.slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.waited = 0.0
+
+    def acquire(self, blocking=True):
+
+        ''' Blocks until the request may go, returns the seconds spent waiting.
+            Not blocking, returns None instead of waiting and nothing is taken.
+        '''
+        started = time.time()
+
+        if not blocking:
+            if self.slots is not None and not self.slots.acquire(False):
+                return None
+
+            if self.bucket is not None and self.bucket.take(False) is None:
+                if self.slots is not None:
+                    self.slots.release()
+
+                return None
+        else:
+            with self.stats_lock:
+                self.waiting += 1
+
+            try:
+                if self.bucket is not None:
+                    self.bucket.take()
+
+                if self.slots is not None:
+                    self.slots.acquire()
+            finally:
+                with self.stats_lock:
+                    self.waiting -= 1
+
+        wait = time.time() - started
+
+        with self.stats_lock:
+            self.in_flight += 1
+            self.acquired += 1
+            self.waited += wait
+
+        return wait
+
+    def release(self):
+
+        with self.stats_lock:
+            self.in_flight -= 1
+
+        if self.slots is not None:
+            self.slots.release()
+
+    def stats(self):
+
+        with self.stats_lock:
+            return {
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'waited_seconds': self.waited
+            }
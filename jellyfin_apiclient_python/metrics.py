@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' In process metrics: per endpoint latency histograms, traffic, status codes, retries and errors,
+    websocket message rates. Exported as a dict snapshot or in the Prometheus text format.
+'''
+
+#################################################################################################
+
+import logging
+import re
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RATE_WINDOW = 60
+IDENTIFIER = re.compile(r'^(?:[0-9a-fA-F]{32}|[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}|\d+)$')
+
+#################################################################################################
+
+
+def endpoint(data):
+
+    ''' Templated handler of a request: Users/{UserId}/Items/{id}.
+    '''
+    if 'url' in data:
+        path = urlparse(data['url'].replace("{server}", "")).path
+    else:
+        path = data.get('handler', "").split('?', 1)[0]
+
+    return "/".join("{id}" if IDENTIFIER.match(part) else part for part in path.strip('/').split('/'))
+
+
+def error_name(error):
+    return str(getattr(error, 'status', None) or type(error).__name__)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+
+        ''' (upper bound, observations <= bound) pairs, ending with +Inf.
+        '''
+        total = 0
+        result = []
+
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+    def quantile(self, q):
+
+        ''' Upper bound of the bucket holding the q-th quantile.
+        '''
+        if not self.count:
+            return None
+
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return bound
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(("+Inf" if bound == float('inf') else bound, total) for bound, total in self.cumulative())
+        }
+
+
+class EndpointStats(object):
+
+    def __init__(self):
+
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.statuses = {}
+        self.errors = {}
+
+    def snapshot(self):
+        return {
+            'latency': self.latency.snapshot(),
+            'queue_wait': self.queue_wait.snapshot(),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'retries': self.retries,
+            'statuses': dict(self.statuses),
+            'errors': dict(self.errors)
+        }
+
+
+class DispatchStats(object):
+
+    def __init__(self):
+
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+        self.errors = 0
+        self.dropped = {}
+
+    def snapshot(self):
+        return {
+            'latency': self.latency.snapshot(),
+            'queue_wait': self.queue_wait.snapshot(),
+            'errors': self.errors,
+            'dropped': dict(self.dropped)
+        }
+
+
+class Meter(object):
+
+    ''' Message count, with the rate over the last complete window.
+    '''
+    def __init__(self):
+
+        self.count = 0
+        self.window_start = time.time()
+        self.window_count = 0
+        self.rate = 0.0
+
+    def mark(self, now):
+
+        if now - self.window_start >= RATE_WINDOW:
+            self.rate = self.window_count / (now - self.window_start)
+            self.window_start = now
+            self.window_count = 0
+
+        self.count += 1
+        self.window_count += 1
+
+    def snapshot(self):
+        return {'count': self.count, 'rate': self.rate}
+
+
+class RequestSample(object):
+
+    ''' Filled in by HTTP.request while the request runs.
+    '''
+    def __init__(self, data):
+
+        self.endpoint = endpoint(data)
+        self.method = data.get('type', "GET")
+        self.started = time.time()
+        self.status = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.queue_wait = 0.0
+
+    def response(self, r):
+
+        self.status = getattr(r, 'status_code', None) or getattr(r, 'status', None)
+        body = getattr(getattr(r, 'request', None), 'body', None)
+        self.bytes_out += len(body or b"")
+
+
+class MetricsRegistry(object):
+
+    ''' client.metrics.snapshot()['http']['GET Users/{UserId}/Items/{id}']['latency']['p95']
+        client.metrics.prometheus()
+    '''
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.endpoints = {}
+        self.messages = {}
+        self.events = {}
+        self.handlers = {}
+        self.depth = 0
+        self.peak_depth = 0
+
+    def start(self, data):
+        return RequestSample(data)
+
+    def observe(self, sample, error=None):
+
+        elapsed = time.time() - sample.started
+        status = str(sample.status or "none")
+
+        with self.lock:
+            key = (sample.method, sample.endpoint)
+
+            if key not in self.endpoints:
+                self.endpoints[key] = EndpointStats()
+
+            stats = self.endpoints[key]
+            stats.latency.observe(elapsed)
+            stats.queue_wait.observe(sample.queue_wait)
+            stats.bytes_in += sample.bytes_in
+            stats.bytes_out += sample.bytes_out
+            stats.retries += sample.retries
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+            if error is not None:
+                name = error_name(error)
+                stats.errors[name] = stats.errors.get(name, 0) + 1
+
+    def message(self, message_type):
+
+        with self.lock:
+            if message_type not in self.messages:
+                self.messages[message_type] = Meter()
+
+            self.messages[message_type].mark(time.time())
+
+    def event(self, name):
+
+        ''' Websocket connection events: connect, connect_failed, disconnect, reconnect, catch_up.
+        '''
+        with self.lock:
+            self.events[name] = self.events.get(name, 0) + 1
+
+    def _handler(self, message_type):
+
+        if message_type not in self.handlers:
+            self.handlers[message_type] = DispatchStats()
+
+        return self.handlers[message_type]
+
+    def dispatched(self, message_type, queue_wait, latency, error=None):
+
+        with self.lock:
+            stats = self._handler(message_type)
+            stats.queue_wait.observe(queue_wait)
+            stats.latency.observe(latency)
+
+            if error is not None:
+                stats.errors += 1
+
+    def dropped(self, message_type, reason):
+
+        ''' reason: unsubscribed or overflow.
+        '''
+        with self.lock:
+            stats = self._handler(message_type)
+            stats.dropped[reason] = stats.dropped.get(reason, 0) + 1
+
+    def queue_depth(self, depth):
+
+        with self.lock:
+            self.depth = depth
+            self.peak_depth = max(self.peak_depth, depth)
+
+    def reset(self):
+
+        with self.lock:
+            self.started = time.time()
+            self.endpoints = {}
+            self.messages = {}
+            self.events = {}
+            self.handlers = {}
+            self.depth = 0
+            self.peak_depth = 0
+
+    def snapshot(self):
+
+        with self.lock:
+            return {
+                'uptime': time.time() - self.started,
+                'http': dict(("%s %s" % key, stats.snapshot()) for key, stats in self.endpoints.items()),
+                'websocket': dict((key, meter.snapshot()) for key, meter in self.messages.items()),
+                'websocket_events': dict(self.events),
+                'websocket_dispatch': {
+                    'queue_depth': self.depth,
+                    'peak_queue_depth': self.peak_depth,
+                    'handlers': dict((key, stats.snapshot()) for key, stats in self.handlers.items())
+                }
+            }
+
+    def prometheus(self, prefix="jellyfin_client"):
+
+        ''' Text exposition format, for a /metrics handler of the application.
+        '''
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help_text))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+
+        def sample(name, labels, value):
+            text = ",".join('%s="%s"' % (key, escape(labels[key])) for key in sorted(labels))
+            lines.append("%s_%s{%s} %s" % (prefix, name, text, value))
+
+        def histogram(name, labels, histogram):
+            for bound, total in histogram.cumulative():
+                sample(name + "_bucket", dict(labels, le="+Inf" if bound == float('inf') else repr(float(bound))), total)
+
+            sample(name + "_sum", labels, histogram.sum)
+            sample(name + "_count", labels, histogram.count)
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            messages = sorted(self.messages.items())
+            events = sorted(self.events.items())
+            handlers = sorted(self.handlers.items())
+
+            for name, attribute, help_text in (
+                    ("request_duration_seconds", 'latency', "HTTP request latency, retries included."),
+                    ("request_queue_wait_seconds", 'queue_wait', "Time spent waiting for the server limiter.")):
+                family(name, "histogram", help_text)
+
+                for (method, handler), stats in endpoints:
+                    histogram(name, {'method': method, 'handler': handler}, getattr(stats, attribute))
+
+            family("requests_total", "counter", "HTTP requests by final status.")
+            for (method, handler), stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    sample("requests_total", {'method': method, 'handler': handler, 'status': status}, count)
+
+            family("request_errors_total", "counter", "HTTP requests ending in an exception.")
+            for (method, handler), stats in endpoints:
+                for name, count in sorted(stats.errors.items()):
+                    sample("request_errors_total", {'method': method, 'handler': handler, 'error': name}, count)
+
+            for name, attribute, help_text in (("retries_total", 'retries', "HTTP retries."),
+                                               ("received_bytes_total", 'bytes_in', "Response bytes."),
+                                               ("sent_bytes_total", 'bytes_out', "Request body bytes.")):
+                family(name, "counter", help_text)
+                for (method, handler), stats in endpoints:
+                    sample(name, {'method': method, 'handler': handler}, getattr(stats, attribute))
+
+            family("websocket_messages_total", "counter", "Websocket messages by MessageType.")
+            for message_type, meter in messages:
+                sample("websocket_messages_total", {'message_type': message_type}, meter.count)
+
+            family("websocket_events_total", "counter", "Websocket connects, disconnects and reconnects.")
+            for name, count in events:
+                sample("websocket_events_total", {'event': name}, count)
+
+            for name, attribute, help_text in (
+                    ("websocket_handler_duration_seconds", 'latency', "Websocket handler run time."),
+                    ("websocket_queue_wait_seconds", 'queue_wait', "Time websocket messages spent queued.")):
+                family(name, "histogram", help_text)
+
+                for message_type, stats in handlers:
+                    histogram(name, {'message_type': message_type}, getattr(stats, attribute))
+
+            family("websocket_handler_errors_total", "counter", "Websocket handlers ending in an exception.")
+            for message_type, stats in handlers:
+                sample("websocket_handler_errors_total", {'message_type': message_type}, stats.errors)
+
+            family("websocket_dropped_total", "counter", "Websocket messages not handled, by reason.")
+            for message_type, stats in handlers:
+                for reason, count in sorted(stats.dropped.items()):
+                    sample("websocket_dropped_total", {'message_type': message_type, 'reason': reason}, count)
+
+            family("websocket_queue_depth", "gauge", "Websocket messages waiting for a handler.")
+            lines.append("%s_websocket_queue_depth %s" % (prefix, self.depth))
+
+            family("websocket_peak_queue_depth", "gauge", "Most websocket messages ever waiting for a handler.")
+            lines.append("%s_websocket_peak_queue_depth %s" % (prefix, self.peak_depth))
+
+        return "\n".join(lines) + "\n"
+
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Local SQLite copy of a user's libraries, kept current with delta syncs and queried without HTTP.
+'''
+
+#################################################################################################
+
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from .api import info
+from .exceptions import HTTPException
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+FETCH_CHUNK = 100
+SYNC_MARGIN = 60  # seconds, for the clock difference with the server
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    type TEXT,
+    name TEXT,
+    name_key TEXT,
+    generation INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_parent ON items (parent_id, name_key);
+CREATE INDEX IF NOT EXISTS items_type ON items (type, name_key);
+CREATE INDEX IF NOT EXISTS items_name ON items (name_key);
+CREATE TABLE IF NOT EXISTS genres (
+    genre TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    PRIMARY KEY (genre, item_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS genres_item ON genres (item_id);
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, item_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+#################################################################################################
+
+
+class LibraryMirror(object):
+
+    ''' Mirror the libraries visible to the signed in user into an SQLite file.
+
+        mirror = LibraryMirror(client.jellyfin, "library.db")
+        mirror.sync()  # full download the first time, deltas afterwards
+        mirror.children(view_id)
+        mirror.by_genre("Drama", "Movie")
+
+        Deltas come from the KodiSyncQueue plugin when it is installed, which also reports removals.
+        Otherwise items saved since the last sync are queried with MinDateLastSaved and
+        MinDateLastSavedForUser; removals are then only picked up by sync(full=True).
+
+        A sync interrupted by a failed request raises HTTPException and leaves the last sync date
+        alone; a full sync only removes the items it did not see once every page came back.
+    '''
+    def __init__(self, api, path=":memory:", page_size=500):
+
+        self.api = api
+        self.page_size = page_size
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    @property
+    def user_id(self):
+        return self.api.config.data.get('auth.user_id')
+
+    def close(self):
+
+        with self.lock:
+            self.db.close()
+
+    #################################################################################################
+
+    # Sync
+
+    #################################################################################################
+
+    def get_state(self, key, default=None):
+
+        with self.lock:
+            row = self.db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def last_sync(self):
+        return self.get_state('last_sync:%s' % self.user_id)
+
+    def sync(self, full=False):
+
+        ''' Bring the mirror up to date, returns the number of items written or removed.
+        '''
+        started = (datetime.utcnow() - timedelta(seconds=SYNC_MARGIN)).strftime(DATE_FORMAT)
+        last_sync = None if full else self.last_sync
+
+        if last_sync is None:
+            count = self._full_sync()
+        elif self.api.check_companion_installed():
+            count = self._sync_queue(last_sync)
+        else:
+            count = self._date_modified_sync(last_sync)
+
+        self.set_state('last_sync:%s' % self.user_id, started)
+        LOG.info("Library mirror synced %s item(s) since %s", count, last_sync)
+
+        return count
+
+    def _views(self):
+
+        views = self.api.get_views()
+
+        if views is None:
+            raise HTTPException("IncompleteSync", "The user views could not be fetched")
+
+        return views.get('Items') or []
+
+    def _full_sync(self):
+
+        generation = int(self.get_state('generation', 0)) + 1
+        count = 0
+
+        for view in self._views():
+            count += self.upsert([view], generation)
+            count += self._upsert_pages({'ParentId': view['Id'], 'Recursive': True, 'Fields': info()}, generation)
+
+        with self.lock, self.db:
+            removed = self.db.execute("SELECT id FROM items WHERE generation < ?", (generation,)).fetchall()
+            self._delete([x[0] for x in removed])
+
+        self.set_state('generation', str(generation))
+
+        return count + len(removed)
+
+    def _date_modified_sync(self, last_sync):
+
+        count = 0
+
+        for view in self._views():
+            count += self._upsert_pages({
+                'ParentId': view['Id'],
+                'Recursive': True,
+                'IsMissing': False,
+                'MinDateLastSaved': last_sync,
+                'Fields': info()
+            })
+            count += self._upsert_pages({
+                'ParentId': view['Id'],
+                'Recursive': True,
+                'IsMissing': False,
+                'MinDateLastSavedForUser': last_sync,
+                'Fields': info()
+            })
+
+        return count
+
+    def _sync_queue(self, last_sync):
+
+        queue = self.api.get_sync_queue(last_sync)
+
+        if queue is None:
+            raise HTTPException("IncompleteSync", "The sync queue could not be fetched")
+
+        user_data = queue.get('UserDataChanged') or []
+        changed = list(queue.get('ItemsAdded') or []) + list(queue.get('ItemsUpdated') or [])
+        removed = list(queue.get('ItemsRemoved') or [])
+        count = 0
+
+        for index in range(0, len(changed), FETCH_CHUNK):
+            result = self.api.get_items(changed[index:index + FETCH_CHUNK])
+
+            if result is None:
+                raise HTTPException("IncompleteSync", "Changed items could not be fetched")
+
+            count += self.upsert(result.get('Items') or [])
+
+        with self.lock, self.db:
+            self._delete(removed)
+
+            for data in user_data:
+                if data.get('ItemId'):
+                    self._user_data(data['ItemId'], data)
+
+        return count + len(removed) + len(user_data)
+
+    def _upsert_pages(self, params, generation=None):
+
+        batch = []
+        count = 0
+
+        for item in self.api.iter_items(params, page_size=self.page_size, strict=True):
+            batch.append(item)
+
+            if len(batch) == self.page_size:
+                count += self.upsert(batch, generation)
+                batch = []
+
+        return count + self.upsert(batch, generation)
+
+    def upsert(self, items, generation=None):
+
+        ''' Write items and their user data, one transaction per call.
+        '''
+        if generation is None:
+            generation = int(self.get_state('generation', 0))
+
+        with self.lock, self.db:
+            for item in items:
+                name = item.get('SortName') or item.get('Name') or ""
+                self.db.execute(
+                    "INSERT OR REPLACE INTO items (id, parent_id, type, name, name_key, generation, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (item['Id'], item.get('ParentId'), item.get('Type'), item.get('Name'), name.lower(),
+                     generation, json.dumps(item))
+                )
+                self.db.execute("DELETE FROM genres WHERE item_id = ?", (item['Id'],))
+                self.db.executemany("INSERT OR IGNORE INTO genres (genre, item_id) VALUES (?, ?)",
+                                    [(genre, item['Id']) for genre in item.get('Genres') or []])
+
+                if item.get('UserData'):
+                    self._user_data(item['Id'], item['UserData'])
+
+        return len(items)
+
+    def remove(self, item_ids):
+
+        with self.lock, self.db:
+            self._delete(item_ids)
+
+    def _delete(self, item_ids):
+
+        for item_id in item_ids:
+            self.db.execute("DELETE FROM items WHERE id = ?", (item_id,))
+            self.db.execute("DELETE FROM genres WHERE item_id = ?", (item_id,))
+            self.db.execute("DELETE FROM user_data WHERE item_id = ?", (item_id,))
+
+    def _user_data(self, item_id, data):
+        self.db.execute("INSERT OR REPLACE INTO user_data (user_id, item_id, data) VALUES (?, ?, ?)",
+                        (self.user_id, item_id, json.dumps(data)))
+
+    #################################################################################################
+
+    # Queries
+
+    #################################################################################################
+
+    def _items(self, query, args):
+
+        with self.lock:
+            rows = self.db.execute(query, args).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, item_id):
+
+        items = self._items("SELECT data FROM items WHERE id = ?", (item_id,))
+
+        return items[0] if items else None
+
+    def children(self, parent_id, media=None):
+
+        if media is None:
+            return self._items("SELECT data FROM items WHERE parent_id = ? ORDER BY name_key", (parent_id,))
+
+        return self._items("SELECT data FROM items WHERE parent_id = ? AND type = ? ORDER BY name_key",
+                           (parent_id, media))
+
+    def by_type(self, media, limit=-1, offset=0):
+        return self._items("SELECT data FROM items WHERE type = ? ORDER BY name_key LIMIT ? OFFSET ?",
+                           (media, limit, offset))
+
+    def by_name_prefix(self, prefix, media=None, limit=-1):
+
+        # A range on the lowered sort name uses the index, unlike LIKE.
+        low = prefix.lower()
+        high = low + "\U0010ffff"
+
+        if media is None:
+            return self._items("SELECT data FROM items WHERE name_key >= ? AND name_key < ? "
+                               "ORDER BY name_key LIMIT ?", (low, high, limit))
+
+        return self._items("SELECT data FROM items WHERE type = ? AND name_key >= ? AND name_key < ? "
+                           "ORDER BY name_key LIMIT ?", (media, low, high, limit))
+
+    def by_genre(self, genre, media=None):
+
+        query = "SELECT items.data FROM genres JOIN items ON items.id = genres.item_id WHERE genres.genre = ?"
+        args = (genre,)
+
+        if media is not None:
+            query += " AND items.type = ?"
+            args += (media,)
+
+        return self._items(query + " ORDER BY items.name_key", args)
+
+    def user_data(self, item_id):
+
+        with self.lock:
+            row = self.db.execute("SELECT data FROM user_data WHERE user_id = ? AND item_id = ?",
+                                  (self.user_id, item_id)).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def count(self, media=None):
+
+        with self.lock:
+            if media is None:
+                return self.db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+            return self.db.execute("SELECT COUNT(*) FROM items WHERE type = ?", (media,)).fetchone()[0]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Debug logging of request and response payloads that costs nothing while debug is disabled.
+    Payloads are only serialized when a record is emitted, redacted on the way, and serializing
+    stops at the truncation limit.
+'''
+
+#################################################################################################
+
+import json
+import logging
+import random
+import re
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+REDACTED = "<redacted>"
+SECRET_KEYS = frozenset(('x-mediabrowser-token', 'accesstoken', 'api_key', 'pw', 'password', 'token'))
+API_KEY = re.compile(r'((?:api_key|ApiKey|X-MediaBrowser-Token)=)[^&\s,"]+', re.I)
+INDENT = "    "
+
+#################################################################################################
+
+
+def redact_url(url):
+    return API_KEY.sub(r'\1' + REDACTED, url) if url else url
+
+
+def redact(value):
+
+    ''' Copy of value with tokens and passwords masked.
+    '''
+    if isinstance(value, dict):
+        return dict((key, REDACTED if str(key).lower() in SECRET_KEYS and value[key] else redact(value[key]))
+                    for key in value)
+
+    if isinstance(value, (list, tuple)):
+        return [redact(x) for x in value]
+
+    if isinstance(value, str):
+        return redact_url(value)
+
+    return value
+
+
+def iter_redacted(value, level=0):
+
+    ''' Chunks of the indented JSON of redact(value), produced while walking value: nothing is
+        copied, and a consumer stopping early leaves the rest of the payload untouched.
+    '''
+    if isinstance(value, dict):
+        items = ((key, REDACTED if str(key).lower() in SECRET_KEYS and value[key] else value[key])
+                 for key in value)
+        opening, closing = "{", "}"
+    elif isinstance(value, (list, tuple)):
+        items = ((None, x) for x in value)
+        opening, closing = "[", "]"
+    else:
+        yield json.dumps(redact_url(value) if isinstance(value, str) else value, default=str)
+
+        return
+
+    separator = "\n" + INDENT * (level + 1)
+    empty = True
+
+    for key, item in items:
+        yield (opening if empty else ",") + separator
+
+        if opening == "{":
+            yield json.dumps(key if isinstance(key, str) else json.dumps(key, default=str)) + ": "
+
+        empty = False
+
+        for chunk in iter_redacted(item, level + 1):
+            yield chunk
+
+    yield opening + closing if empty else "\n" + INDENT * level + closing
+
+
+def sampled(rate):
+    return rate >= 1 or random.random() < rate
+
+
+class LazyJSON(object):
+
+    ''' Log argument rendering its payload as indented JSON on demand, cut after limit characters.
+
+        LOG.debug("---<[ http ] %s", LazyJSON(response, 4096))
+    '''
+    def __init__(self, payload, limit=None):
+
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+
+        chunks = []
+        length = 0
+
+        for chunk in iter_redacted(self.payload):
+            chunks.append(chunk)
+            length += len(chunk)
+
+            if self.limit and length > self.limit:
+                return "%s... (truncated at %s characters)" % ("".join(chunks)[:self.limit], self.limit)
+
+        return "".join(chunks)
+
+    __repr__ = __str__
+
+
+def log_request(logger, data, config):
+    logger.debug("--->[ http ] %s", LazyJSON(data, config.data.get('http.log_body_limit')))
+
+
+def log_response(logger, response, elapsed, config):
+
+    ''' Bodies are logged for a sample of the responses, set by http.log_sample_rate.
+    '''
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    if sampled(config.data.get('http.log_sample_rate', 1)):
+        logger.debug("---<[ http ][%s ms] %s", elapsed, LazyJSON(response, config.data.get('http.log_body_limit')))
+    else:
+        logger.debug("---<[ http ][%s ms]", elapsed)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Retry policies for HTTP requests: exponential backoff with full jitter, an overall deadline,
+    Retry-After on 429/503 and per endpoint overrides.
+'''
+
+#################################################################################################
+
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+DEFAULT_RETRIES = 5
+RETRY_AFTER_STATUSES = (429, 503)
+
+#################################################################################################
+
+
+def parse_retry_after(value):
+
+    ''' Seconds to wait from a Retry-After header, either delay-seconds or an HTTP date.
+    '''
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date is None:
+        return None
+
+    now = datetime.now(date.tzinfo) if date.tzinfo else datetime.utcnow()
+
+    return max(0.0, (date - now).total_seconds())
+
+
+class RetryPolicy(object):
+
+    ''' retries: attempts after the first one.
+        base, cap: the n-th retry waits a random time in [0, min(cap, base * 2 ** n)].
+        deadline: no retry is started if it would end more than deadline seconds after the first attempt.
+        statuses: response codes worth retrying; Retry-After is honoured for 429 and 503.
+    '''
+    def __init__(self, retries=DEFAULT_RETRIES, base=0.5, cap=30, deadline=60, statuses=(502, 503, 429), jitter=True):
+
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+        self.statuses = statuses
+        self.jitter = jitter
+
+    def backoff(self, attempt):
+
+        ceiling = min(self.cap, self.base * 2 ** attempt)
+
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+    def delay(self, attempt, started, retries=None, status=None, retry_after=None):
+
+        ''' Seconds to sleep before the next attempt, or None when giving up.
+        '''
+        if attempt >= (self.retries if retries is None else retries):
+            return None
+
+        if status is not None and status not in self.statuses:
+            return None
+
+        delay = self.backoff(attempt)
+
+        if status in RETRY_AFTER_STATUSES:
+            wait = parse_retry_after(retry_after)
+
+            if wait is not None:
+                delay = wait
+
+        if self.deadline is not None and time.time() + delay - started > self.deadline:
+            return None
+
+        return delay
+
+
+class RetryPolicies(object):
+
+    ''' Default policy plus overrides matched on the request url, with retry counters.
+
+        client.http.retry.override(r"/Videos/", RetryPolicy(retries=1))
+    '''
+    def __init__(self, default=None):
+
+        self.default = default or RetryPolicy()
+        self.overrides = []
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.retry_seconds = 0.0
+        self.exhausted = 0
+        self.reasons = {}
+
+    def override(self, pattern, policy):
+        self.overrides.insert(0, (re.compile(pattern), policy))
+
+    def policy_for(self, url):
+
+        for pattern, policy in self.overrides:
+            if pattern.search(url):
+                return policy
+
+        return self.default
+
+    def record(self, reason, delay):
+
+        with self.lock:
+            if delay is None:
+                self.exhausted += 1
+            else:
+                self.retries += 1
+                self.retry_seconds += delay
+                self.reasons[str(reason)] = self.reasons.get(str(reason), 0) + 1
+
+    def stats(self):
+
+        with self.lock:
+            return {
+                'retries': self.retries,
+                'retry_seconds': self.retry_seconds,
+                'exhausted': self.exhausted,
+                'reasons': dict(self.reasons)
+            }
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Identical calls made while one is already running wait for its result instead of repeating it.
+'''
+
+#################################################################################################
+
+import logging
+import threading
+from concurrent.futures import Future
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+
+#################################################################################################
+
+
+class SingleFlight(object):
+
+    ''' The first caller of a key runs the call, the callers arriving before it returns get
+        the same result (or exception) object.
+    '''
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.collapsed = 0
+
+    def do(self, key, call, *args):
+
+        ''' Returns (result, shared), shared being True for the callers that did not run the call.
+            Whatever way the call ends, the waiting callers are released and the key forgotten.
+        '''
+        with self.lock:
+            future = self.calls.get(key)
+
+            if future is None:
+                future = self.calls[key] = Future()
+                self.leaders += 1
+                leader = True
+            else:
+                self.collapsed += 1
+                leader = False
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = call(*args)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._done(key)
+
+        return result, False
+
+    def _done(self, key):
+
+        with self.lock:
+            self.calls.pop(key, None)
+
+    def stats(self):
+
+        with self.lock:
+            return {
+                'leaders': self.leaders,
+                'collapsed': self.collapsed,
+                'in_flight': len(self.calls)
+            }
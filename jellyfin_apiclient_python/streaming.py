@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Response bodies read with readinto() into one reusable buffer instead of a bytes object per chunk.
+'''
+
+#################################################################################################
+
+import logging
+import mmap
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+DEFAULT_BUFFER_SIZE = 256 * 1024
+WRITABLE_BUFFERS = (bytearray, memoryview, mmap.mmap)
+
+#################################################################################################
+
+
+def encoded(response):
+    return response.headers.get('Content-Encoding', "identity").strip().lower() not in ("", "identity")
+
+
+class DecodedReader(object):
+
+    ''' readinto over the chunks urllib3 decompresses, for content encoded bodies.
+        Costs one copy per chunk, like iter_content.
+    '''
+    def __init__(self, chunks):
+
+        self.chunks = chunks
+        self.pending = memoryview(b"")
+
+    def readinto(self, target):
+
+        while not len(self.pending):
+            chunk = next(self.chunks, None)
+
+            if chunk is None:
+                return 0
+
+            self.pending = memoryview(chunk)
+
+        size = min(len(target), len(self.pending))
+        target[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+
+        return size
+
+
+def raw_readinto(response, buffer_size=DEFAULT_BUFFER_SIZE):
+
+    ''' readinto delivering the decoded body. Without Content-Encoding it reads from the socket level
+        response, skipping the copy urllib3 makes. requests leaves decoding to the caller, so gzip or
+        deflate bodies go through urllib3's decoder (raw.stream with decode_content) instead.
+    '''
+    if encoded(response):
+        return DecodedReader(response.raw.stream(buffer_size, decode_content=True)).readinto
+
+    fp = getattr(response.raw, '_fp', None)
+
+    if fp is not None and hasattr(fp, 'readinto'):
+        return fp.readinto
+
+    return response.raw.readinto
+
+
+def release(response):
+
+    ''' Hand the connection back to the pool once the body was read to the end.
+    '''
+    response._content_consumed = True
+    response.raw.release_conn()
+
+
+def iter_views(response, buffer_size=DEFAULT_BUFFER_SIZE, buffer=None):
+
+    ''' Generator of memoryviews over one buffer, each valid until the next one is requested:
+        consume (write, send, parse) a view before asking for more.
+    '''
+    view = memoryview(buffer if buffer is not None else bytearray(buffer_size))
+    readinto = raw_readinto(response, len(view))
+
+    try:
+        while True:
+            size = readinto(view)
+
+            if not size:
+                break
+
+            yield view[:size]
+
+        release(response)
+    finally:
+        response.close()
+
+
+def read_into(response, target):
+
+    ''' Read the body straight into a writable buffer (bytearray, memoryview, mmap).
+        Returns the number of bytes read; raises ValueError if the body does not fit.
+    '''
+    view = memoryview(target)
+    readinto = raw_readinto(response)
+    position = 0
+
+    try:
+        while True:
+            if position == len(view):
+                if readinto(bytearray(1)):
+                    raise ValueError("Response body is larger than the %s byte buffer" % len(view))
+
+                break
+
+            size = readinto(view[position:])
+
+            if not size:
+                break
+
+            position += size
+
+        release(response)
+    finally:
+        response.close()
+
+    return position
+
+
+def map_file(path, size):
+
+    ''' Writable mmap of a new file of size bytes, a zero copy destination for read_into.
+    '''
+    with open(path, 'wb+') as handle:
+        handle.truncate(size)
+
+        return mmap.mmap(handle.fileno(), size)
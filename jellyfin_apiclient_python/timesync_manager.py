@@ -40,7 +40,7 @@ class _TimeSyncThread(threading.Thread):
     def run(self):
         while not self.halt.wait(self.manager.polling_interval):
             try:
-                measurement = self.manager.client.jellyfin.utc_time()
+                measurement = (self.manager.api or self.manager.client.jellyfin).utc_time()
                 measurement = Measurement(measurement["request_sent"], measurement["request_received"],
                                           measurement["response_sent"], measurement["response_received"])
 
@@ -61,7 +61,7 @@ class _TimeSyncThread(threading.Thread):
 
 
 class TimeSyncManager:
-    def __init__(self, client):
+    def __init__(self, client, api=None):
         self.ping_stop = True
         self.polling_interval = polling_interval_greedy
         self.poller = None
@@ -69,6 +69,7 @@ class TimeSyncManager:
         self.measurement = None  # current time sync
         self.measurements = []
         self.client = client
+        self.api = api  # blocking API to poll, defaults to client.jellyfin
         self.timesync_thread = None
         self.subscribers = set()
 
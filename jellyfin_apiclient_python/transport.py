@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Connection pooling shared by every request path of a client.
+    The session and its sockets outlive individual calls; idle host pools are reaped instead.
+'''
+
+#################################################################################################
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+import urllib3
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+
+#################################################################################################
+
+
+class PoolStats(object):
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.opened = 0
+        self.reaped = 0
+
+    def snapshot(self):
+
+        with self.lock:
+            return {
+                'hits': self.checkouts - self.opened,
+                'misses': self.opened,
+                'reaped': self.reaped
+            }
+
+
+class _CountingMixin(object):
+
+    ''' Counts every connection checkout and every new socket, the difference being pool hits.
+    '''
+    stats = None
+    last_used = 0
+
+    def _get_conn(self, timeout=None):
+
+        self.last_used = time.time()
+
+        if self.stats is not None:
+            with self.stats.lock:
+                self.stats.checkouts += 1
+
+        return super(_CountingMixin, self)._get_conn(timeout)
+
+    def _new_conn(self):
+
+        if self.stats is not None:
+            with self.stats.lock:
+                self.stats.opened += 1
+
+        return super(_CountingMixin, self)._new_conn()
+
+
+class CountingHTTPConnectionPool(_CountingMixin, urllib3.HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingMixin, urllib3.HTTPSConnectionPool):
+    pass
+
+
+class CountingPoolManager(urllib3.PoolManager):
+
+    def __init__(self, *args, **kwargs):
+
+        self.stats = kwargs.pop('stats', None) or PoolStats()
+        super(CountingPoolManager, self).__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+
+        pool = super(CountingPoolManager, self)._new_pool(scheme, host, port, request_context)
+        pool.stats = self.stats
+        pool.last_used = time.time()
+
+        return pool
+
+    def reap(self, idle_timeout):
+
+        ''' Close the host pools that have not handed out a connection for idle_timeout seconds.
+        '''
+        now = time.time()
+        reaped = 0
+
+        for key in list(self.pools.keys()):
+            pool = self.pools.get(key)
+
+            if pool is not None and now - pool.last_used > idle_timeout and not self._busy(pool):
+                self.pools.pop(key, None)  # disposing the pool closes its sockets
+                reaped += 1
+
+        if reaped:
+            with self.stats.lock:
+                self.stats.reaped += reaped
+
+        return reaped
+
+    def _busy(self, pool):
+
+        # Connections checked out of a pool leave a hole in its queue.
+        queue = getattr(pool, 'pool', None)
+
+        return queue is not None and queue.qsize() < queue.maxsize
+
+
+class PooledAdapter(requests.adapters.HTTPAdapter):
+
+    def __init__(self, stats=None, **kwargs):
+
+        self.stats = stats
+        super(PooledAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = CountingPoolManager(num_pools=connections, maxsize=maxsize, block=block,
+                                               stats=self.stats, **pool_kwargs)
+
+
+class SharedAdapters(object):
+
+    ''' Process wide pooled adapters per server base url and TLS setting, reference counted,
+        so thousands of clients of a few servers hold a few connection pools.
+    '''
+    lock = threading.Lock()
+    entries = {}
+
+    @classmethod
+    def acquire(cls, key, factory):
+
+        with cls.lock:
+            if key not in cls.entries:
+                cls.entries[key] = [factory(), 0]
+                LOG.info("-->[ shared pools/%s ]", key[0])
+
+            cls.entries[key][1] += 1
+
+            return cls.entries[key][0]
+
+    @classmethod
+    def release(cls, key):
+
+        ''' The adapters once their last user is gone, None otherwise.
+        '''
+        with cls.lock:
+            entry = cls.entries[key]
+            entry[1] -= 1
+
+            if entry[1]:
+                return None
+
+            del cls.entries[key]
+            LOG.info("--<[ shared pools/%s ]", key[0])
+
+            return entry[0]
+
+
+class Generation(object):
+
+    ''' One set of pooled adapters, with the number of requests currently running on it.
+        key is set when the adapters come from SharedAdapters.
+    '''
+    def __init__(self, adapters, stats, key=None):
+
+        self.adapters = adapters
+        self.stats = stats
+        self.key = key
+        self.session = None
+        self.leases = 0
+        self.retired = False
+
+    def close(self):
+
+        adapters = self.adapters if self.key is None else SharedAdapters.release(self.key)
+
+        for adapter in (adapters or {}).values():
+            try:
+                adapter.close()
+            except Exception as error:
+                LOG.warning("The connection pool could not be terminated: %s", error)
+
+
+class Transport(object):
+
+    ''' Owns the requests session(s) and their pooled adapters.
+        The session is created on first use and kept until close(), so every call reuses warm sockets.
+
+        Thread safety: any number of threads may call get_session(), lease(), close(), open(),
+        reap_idle() and pool_stats() concurrently. Creation and teardown happen under a lock, and
+        close() never cuts a request running under lease(): the retired connection pools are only
+        closed once their last lease is returned, later requests get a new generation.
+        http.session_mode picks between one requests.Session shared by all threads ("shared") and
+        one session per thread ("thread"), the latter sharing a single set of connection pools.
+        With http.shared_transport the connection pools are shared by every Transport of the process
+        talking to the same server with the same TLS and pool settings. Sessions, and the
+        authorization headers set on each request, stay per client.
+    '''
+    def __init__(self, config):
+
+        self.config = config
+        self.stats = PoolStats()
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.generation = None
+        self.last_reap = time.time()
+
+    @property
+    def session(self):
+        return self.generation.session if self.generation is not None else None
+
+    def open(self):
+
+        ''' Replace the current session with a fresh one.
+        '''
+        with self.lock:
+            self.close()
+
+            return self.get_session()
+
+    def get_session(self):
+
+        with self.lock:
+            generation = self._get_generation()
+
+        return self._session_for(generation)
+
+    def _session_for(self, generation):
+
+        if self.config.data.get('http.session_mode') != "thread":
+            return generation.session
+
+        if getattr(self.local, 'generation', None) is not generation:
+            self.local.session = self._new_session(generation.adapters)
+            self.local.generation = generation
+
+        return self.local.session
+
+    @contextmanager
+    def lease(self):
+
+        ''' Session for the duration of one request, guarded against a concurrent close().
+        '''
+        with self.lock:
+            generation = self._get_generation()
+            generation.leases += 1
+
+        try:
+            yield self._session_for(generation)
+        finally:
+            with self.lock:
+                generation.leases -= 1
+                retired = generation.retired and not generation.leases
+
+            if retired:
+                generation.close()
+
+    def _shared_key(self):
+
+        if not self.config.data.get('http.shared_transport'):
+            return None
+
+        return (
+            (self.config.data.get('auth.server') or "").rstrip('/'),
+            self.config.data.get('auth.ssl'),
+            self.config.data['http.pool_connections'],
+            self.config.data['http.pool_maxsize'],
+            self.config.data['http.max_retries']
+        )
+
+    def _get_generation(self):
+
+        key = self._shared_key()
+
+        if self.generation is not None and self.generation.key != key:
+            self.close()  # the server or the pool settings changed
+
+        if self.generation is None:
+            if key is None:
+                adapters = self._new_adapters(self.stats)
+                self.generation = Generation(adapters, self.stats)
+            else:
+                adapters = SharedAdapters.acquire(key, lambda: self._new_adapters(PoolStats()))
+                self.generation = Generation(adapters, adapters['http://'].stats, key)
+
+            self.generation.session = self._new_session(adapters)
+            LOG.info("-->[ session/%s ]", id(self.generation.session))
+
+        return self.generation
+
+    def _new_adapters(self, stats):
+        return dict((prefix, self._new_adapter(stats)) for prefix in ("http://", "https://"))
+
+    def _new_adapter(self, stats):
+        return PooledAdapter(
+            stats=stats,
+            pool_connections=self.config.data['http.pool_connections'],
+            pool_maxsize=self.config.data['http.pool_maxsize'],
+            max_retries=self.config.data['http.max_retries']
+        )
+
+    def _new_session(self, adapters=None):
+
+        session = requests.Session()
+
+        for prefix, adapter in (adapters or {}).items():
+            session.mount(prefix, adapter)
+
+        return session
+
+    def close(self):
+
+        with self.lock:
+            generation, self.generation = self.generation, None
+
+            if generation is None:
+                return
+
+            LOG.info("--<[ session/%s ]", id(generation.session))
+            generation.retired = True
+
+            if generation.leases:
+                LOG.debug("Closing the connection pools after %s running request(s)", generation.leases)
+
+                return
+
+        generation.close()
+
+    def reap_idle(self):
+
+        ''' Close host pools idle for longer than http.pool_idle_timeout. Cheap to call after every request.
+        '''
+        idle_timeout = self.config.data['http.pool_idle_timeout']
+        now = time.time()
+
+        with self.lock:
+            if self.generation is None or not idle_timeout or now - self.last_reap < idle_timeout / 2:
+                return 0
+
+            self.last_reap = now
+            adapters = list(self.generation.adapters.values())
+
+        reaped = 0
+
+        for adapter in adapters:
+            reaped += adapter.poolmanager.reap(idle_timeout)
+
+        if reaped:
+            LOG.debug("Reaped %s idle connection pool(s)", reaped)
+
+        return reaped
+
+    def pool_stats(self):
+
+        with self.lock:
+            generation = self.generation
+
+        # Shared pools report the counters of every client of the server.
+        stats = (generation.stats if generation is not None else self.stats).snapshot()
+        stats['pools'] = 0
+        adapters = list(generation.adapters.values()) if generation is not None else []
+
+        for adapter in adapters:
+            stats['pools'] += len(adapter.poolmanager.pools)
+
+        return stats
@@ -3,22 +3,140 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 #################################################################################################
 
+import asyncio
 import json
 import logging
 import threading
 import ssl
+import time
+from collections import OrderedDict
+from datetime import datetime
 
 import websocket
 
 from .keepalive import KeepAlive
+from .request_log import redact_url
+from .retry import RetryPolicy
+from .ws_dispatch import Dispatcher, peek_type
 
 ##################################################################################################
 
 LOG = logging.getLogger('JELLYFIN.' + __name__)
+PING_INTERVAL = 10
+PING_TIMEOUT = 5
+STABLE_CONNECTION = 30
+CATCH_UP_MARGIN = 60
+ALWAYS_DECODED = ("ForceKeepAlive", "KeepAlive", "LibraryChanged", "UserDataChanged")
 
 ##################################################################################################
 
 
+class RecentIds(object):
+
+    ''' The message ids seen in the last `window` seconds, at most `capacity` of them:
+        an insertion ordered dict trimmed from the oldest end, O(1) per message and bounded memory.
+    '''
+    def __init__(self, capacity, window=None):
+
+        self.capacity = capacity
+        self.window = window
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, message_id):
+
+        with self.lock:
+            added = self.ids.get(message_id)
+
+            return added is not None and not self._expired(added, time.time())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _expired(self, added, now):
+        return self.window is not None and now - added > self.window
+
+    def add(self, message_id):
+        self.seen(message_id)
+
+    def seen(self, message_id):
+
+        ''' True if message_id is a repeat, otherwise remember it.
+        '''
+        now = time.time()
+
+        with self.lock:
+            added = self.ids.get(message_id)
+
+            if added is not None and not self._expired(added, now):
+                return True
+
+            self.ids.pop(message_id, None)
+            self.ids[message_id] = now
+
+            while len(self.ids) > self.capacity:
+                self.ids.popitem(last=False)
+
+            while self.ids and self._expired(next(iter(self.ids.values())), now):
+                self.ids.popitem(last=False)
+
+            return False
+
+
+class Reconnect(object):
+
+    ''' Connection state of a websocket: connecting, connected, waiting (for the next attempt) or stopped.
+        Attempts are spaced by an exponential backoff with full jitter. The backoff starts over once
+        a connection held for STABLE_CONNECTION seconds, so a server dropping every new socket
+        is not hammered.
+    '''
+    def __init__(self, config):
+
+        self.config = config
+        self.state = "connecting"
+        self.attempt = 0
+        self.connected_at = None
+        self.disconnected_at = None
+
+    def connected(self):
+
+        ''' Time of the previous disconnection when this connection is a reconnect, None otherwise.
+        '''
+        since, self.disconnected_at = self.disconnected_at, None
+        self.state = "connected"
+        self.connected_at = time.time()
+
+        return since
+
+    def failed(self):
+
+        ''' Seconds to wait before the next attempt, None to give up.
+        '''
+        if self.state == "connected":
+            self.disconnected_at = time.time()
+
+            if time.time() - self.connected_at > STABLE_CONNECTION:
+                self.attempt = 0
+
+        retries = self.config.data.get('websocket.reconnect_retries')
+
+        if not self.config.data.get('websocket.reconnect') or retries is not None and self.attempt >= retries:
+            self.state = "stopped"
+
+            return None
+
+        policy = RetryPolicy(base=self.config.data['websocket.reconnect_base'],
+                             cap=self.config.data['websocket.reconnect_cap'], deadline=None)
+        delay = policy.backoff(self.attempt)
+        self.attempt += 1
+        self.state = "waiting"
+
+        return delay
+
+    def stopped(self):
+        self.state = "stopped"
+
+
 class WSClient(threading.Thread):
     multi_client = False
     global_wsc = None
@@ -31,55 +149,87 @@ class WSClient(threading.Thread):
         self.client = client
         self.keepalive = None
         self.wsc = None
+        self.hub = None
         self.stop = False
-        self.message_ids = set()
+        self.halt = threading.Event()
+        self.reconnect = Reconnect(client.config)
+        self.message_ids = RecentIds(client.config.data['websocket.dedup_size'],
+                                     client.config.data['websocket.dedup_window'])
+        self.dispatcher = None
 
         if self.multi_client or allow_multiple_clients:
             self.multi_client = True
 
         threading.Thread.__init__(self)
 
+    def subscribe(self, message_type, handler):
+
+        ''' Switch to asynchronous dispatch: handler(message_type, data) runs on a worker pool instead
+            of client.callback on the socket thread, and the message types nobody subscribed to are
+            dropped before being decoded. Subscribe client.callback to "*" to keep receiving everything.
+        '''
+        if self.dispatcher is None:
+            self.dispatcher = Dispatcher(self.client.metrics,
+                                         self.client.config.data['websocket.dispatch_workers'],
+                                         self.client.config.data['websocket.dispatch_queue_size'],
+                                         self.client.config.data['websocket.dispatch_overflow'])
+
+        self.dispatcher.subscribe(message_type, handler)
+
+    def unsubscribe(self, message_type, handler):
+
+        if self.dispatcher is not None:
+            self.dispatcher.unsubscribe(message_type, handler)
+
     def send(self, message, data=""):
         if self.wsc is None:
             raise ValueError("The websocket client is not started.")
 
         self.wsc.send(json.dumps({'MessageType': message, "Data": data}))
 
-    def run(self):
+    def get_url(self):
 
         token = self.client.config.data['auth.token']
         device_id = self.client.config.data['app.device_id']
         server = self.client.config.data['auth.server']
         server = server.replace('https', "wss") if server.startswith('https') else server.replace('http', "ws")
         wsc_url = "%s/socket?api_key=%s&device_id=%s" % (server, token, device_id)
-        verify = self.client.config.data.get('auth.ssl', False)
 
-        LOG.info("Websocket url: %s", wsc_url)
+        LOG.info("Websocket url: %s", redact_url(wsc_url))
 
-        self.wsc = websocket.WebSocketApp(wsc_url,
-                                          on_message=lambda ws, message: self.on_message(ws, message),
-                                          on_error=lambda ws, error: self.on_error(ws, error))
-        self.wsc.on_open = lambda ws: self.on_open(ws)
-        
-        if not self.multi_client:
-            if self.global_wsc is not None:
-                self.global_wsc.close()
-            self.global_wsc = self.wsc
+        return wsc_url
+
+    def get_sslopt(self):
+
+        if not self.client.config.data.get('auth.ssl', False):
+            # https://stackoverflow.com/questions/48740053/
+            return {"cert_reqs": ssl.CERT_NONE}
+
+        return None
+
+    def run(self):
 
         while not self.stop and not self.global_stop:
-            if not verify:
-                # https://stackoverflow.com/questions/48740053/
-                self.wsc.run_forever(
-                    ping_interval=10, sslopt={"cert_reqs": ssl.CERT_NONE}
-                )
-            else:
-                self.wsc.run_forever(ping_interval=10)
 
-            if not self.stop:
+            # A new url for every attempt, authenticated with the current token.
+            self.wsc = websocket.WebSocketApp(self.get_url(),
+                                              on_message=lambda ws, message: self.on_message(ws, message),
+                                              on_error=lambda ws, error: self.on_error(ws, error))
+            self.wsc.on_open = lambda ws: self.on_open(ws)
+
+            if not self.multi_client:
+                if self.global_wsc is not None:
+                    self.global_wsc.close()
+                self.global_wsc = self.wsc
+
+            # ping_timeout also bounds the select, so a close() from another thread is noticed.
+            self.wsc.run_forever(ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT, sslopt=self.get_sslopt())
+            delay = self.on_disconnect()
+
+            if delay is None or self.halt.wait(delay):
                 break
 
-        LOG.info("---<[ websocket ]")
-        self.client.callback('WebSocketDisconnect', None)
+        self.reconnect.stopped()
 
     def on_error(self, ws, error):
         LOG.error(error)
@@ -87,33 +237,131 @@ class WSClient(threading.Thread):
 
     def on_open(self, ws):
         LOG.info("--->[ websocket ]")
+
+        # Settings changed since the client was created apply from the next message on.
+        self.message_ids.capacity = self.client.config.data['websocket.dedup_size']
+        self.message_ids.window = self.client.config.data['websocket.dedup_window']
+
+        since = self.reconnect.connected()
+        self.client.metrics.event("connect")
         self.client.callback('WebSocketConnect', None)
 
+        if since is not None:
+            self.client.metrics.event("reconnect")
+            self.client.callback('WebSocketReconnect', {'DisconnectedAt': since})
+
+            if self.client.config.data.get('websocket.catch_up'):
+                catch_up = threading.Thread(target=self.catch_up, args=(since,))
+                catch_up.daemon = True
+                catch_up.start()
+
+    def on_disconnect(self, final=False):
+
+        ''' Called whenever the socket closes or fails to open.
+            Returns the seconds to wait before reconnecting, None when done.
+        '''
+        self.client.metrics.event("disconnect" if self.reconnect.state == "connected" else "connect_failed")
+        LOG.info("---<[ websocket ]")
+        self.client.callback('WebSocketDisconnect', None)
+
+        if final or self.stop or self.global_stop:
+            return None
+
+        delay = self.reconnect.failed()
+
+        if delay is not None:
+            LOG.info("Reconnecting the websocket in %.1fs (attempt %s)", delay, self.reconnect.attempt)
+
+        return delay
+
+    def catch_up(self, since):
+
+        ''' Replay what changed while the websocket was down as LibraryChanged and UserDataChanged
+            messages. Removed items are not reported by the server and can't be replayed.
+        '''
+        date = datetime.utcfromtimestamp(since - CATCH_UP_MARGIN).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        try:
+            items = self._call(self.client.jellyfin.get_recursive_date_modified, date) or {}
+            userdata = self._call(self.client.jellyfin.get_userdata_date_modified, date, None) or {}
+        except Exception as error:
+            LOG.warning("Websocket catch up since %s failed: %s", date, error)
+
+            return
+
+        self.client.metrics.event("catch_up")
+        updated = [item['Id'] for item in items.get('Items') or []]
+        changed = [dict(item.get('UserData') or {}, ItemId=item['Id']) for item in userdata.get('Items') or []]
+        LOG.info("Websocket catch up since %s: %s item(s), %s userdata", date, len(updated), len(changed))
+
+        if updated:
+            self.dispatch("LibraryChanged", {'ItemsAdded': [], 'ItemsUpdated': updated, 'ItemsRemoved': [],
+                                             'CatchUp': True})
+
+        if changed:
+            self.dispatch("UserDataChanged", {'UserId': self.client.config.data['auth.user_id'],
+                                              'UserDataList': changed, 'CatchUp': True})
+
+    def _call(self, method, *args):
+
+        ''' Blocking API call from a websocket thread. With AsyncJellyfinClient the coroutine runs on
+            the loop the client was started from.
+        '''
+        result = method(*args)
+
+        if not asyncio.iscoroutine(result):
+            return result
+
+        loop = getattr(self.client, 'loop', None)
+
+        if loop is None or not loop.is_running():
+            result.close()
+
+            raise RuntimeError("The event loop of the client is not running")
+
+        return asyncio.run_coroutine_threadsafe(result, loop).result()
+
     def on_message(self, ws, message):
 
+        if self.dispatcher is not None:
+            message_type = peek_type(message)
+
+            if message_type is not None and message_type not in ALWAYS_DECODED \
+                    and not self.dispatcher.wants(message_type):
+                self.client.metrics.message(message_type)
+                self.client.metrics.dropped(message_type, "unsubscribed")
+
+                return
+
         message = json.loads(message)
 
         # If a message is received multiple times, ignore repeats.
         message_id = message.get("MessageId")
-        if message_id is not None:
-            if message_id in self.message_ids:
-                return
-            self.message_ids.add(message_id)
+        if message_id is not None and self.message_ids.seen(message_id):
+            return
 
         data = message.get('Data', {})
+        self.client.metrics.message(message['MessageType'])
 
         if message['MessageType'] == "ForceKeepAlive":
             self.send("KeepAlive")
-            if self.keepalive is not None:
-                self.keepalive.stop()
-            self.keepalive = KeepAlive(data, self)
-            self.keepalive.start()
+            if self.hub is not None:
+                self.hub.keep_alive(self, data)
+            else:
+                if self.keepalive is not None:
+                    self.keepalive.stop()
+                self.keepalive = KeepAlive(data, self)
+                self.keepalive.start()
             LOG.debug("ForceKeepAlive received from server.")
             return
         elif message['MessageType'] == "KeepAlive":
             LOG.debug("KeepAlive received from server.")
             return
 
+        self.dispatch(message['MessageType'], data)
+
+    def dispatch(self, message_type, data):
+
         if data is None:
             data = {}
         elif type(data) is not dict:
@@ -122,11 +370,28 @@ class WSClient(threading.Thread):
         if not self.client.config.data['app.default']:
             data['ServerId'] = self.client.auth.server_id
 
-        self.client.callback(message['MessageType'], data)
+        try:
+            self.client.invalidation.handle(message_type, data)
+        except Exception:
+            LOG.exception("Cache invalidation failed.")
+
+        if self.dispatcher is not None:
+            self.dispatcher.put(message_type, data)
+        else:
+            self.client.callback(message_type, data)
 
     def stop_client(self):
 
         self.stop = True
+        self.halt.set()
+
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+
+        if self.hub is not None:
+            self.hub.remove(self)
+
+            return
 
         if self.keepalive is not None:
             self.keepalive.stop()
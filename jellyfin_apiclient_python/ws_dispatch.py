@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' Websocket messages handed to subscribed handlers on a worker pool, off the socket thread.
+'''
+
+#################################################################################################
+
+import logging
+import queue
+import re
+import threading
+import time
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+MESSAGE_TYPE = re.compile(r'"MessageType"\s*:\s*"([^"\\]*)"')
+MESSAGE_TYPE_BYTES = re.compile(br'"MessageType"\s*:\s*"([^"\\]*)"')
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 1000
+ANY = "*"
+
+#################################################################################################
+
+
+def peek_type(message):
+
+    ''' MessageType of a raw frame without decoding the json, None if it can't be found.
+    '''
+    if isinstance(message, bytes):
+        match = MESSAGE_TYPE_BYTES.search(message)
+
+        return match.group(1).decode('utf-8') if match else None
+
+    match = MESSAGE_TYPE.search(message)
+
+    return match.group(1) if match else None
+
+
+class Dispatcher(object):
+
+    ''' Bounded queues of decoded messages drained by `workers` threads, each message going to the
+        handlers subscribed to its MessageType (or to "*"). Messages of types nobody subscribed to
+        are never queued. Every MessageType is bound to one worker and its queue, so the messages of
+        a type are handled in the order they arrived; queue_size is split between the workers.
+
+        overflow, when the queue of the message type is full:
+            block: the socket thread waits for room, slowing down frame reads.
+            drop_newest: the incoming message is dropped.
+            drop_oldest: the oldest queued message is dropped to make room.
+    '''
+    def __init__(self, metrics, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, overflow="drop_oldest"):
+
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %s, expected one of %s" % (overflow, OVERFLOW_POLICIES))
+
+        self.metrics = metrics
+        self.workers = workers
+        self.overflow = overflow
+        self.queues = [queue.Queue(max(1, queue_size // workers)) for _ in range(workers)]
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.threads = []
+        self.stopped = False
+
+    def subscribe(self, message_type, handler):
+
+        ''' handler(message_type, data), called on a worker thread. message_type "*" receives everything.
+        '''
+        with self.lock:
+            subscriptions = dict(self.subscriptions)
+            subscriptions[message_type] = subscriptions.get(message_type, []) + [handler]
+            self.subscriptions = subscriptions
+
+    def unsubscribe(self, message_type, handler):
+
+        with self.lock:
+            subscriptions = dict(self.subscriptions)
+            handlers = [x for x in subscriptions.get(message_type, []) if x != handler]
+
+            if handlers:
+                subscriptions[message_type] = handlers
+            else:
+                subscriptions.pop(message_type, None)
+
+            self.subscriptions = subscriptions
+
+    def wants(self, message_type):
+
+        subscriptions = self.subscriptions
+
+        return message_type in subscriptions or ANY in subscriptions
+
+    def put(self, message_type, data):
+
+        ''' Queue a message for its handlers. Returns False if it was dropped.
+        '''
+        if self.stopped:
+            return False
+
+        if not self.wants(message_type):
+            self.metrics.dropped(message_type, "unsubscribed")
+
+            return False
+
+        self._start()
+        item = (message_type, data, time.time())
+        pending = self.queues[hash(message_type) % len(self.queues)]
+
+        if self.overflow == "block":
+            pending.put(item)
+        else:
+            try:
+                pending.put_nowait(item)
+            except queue.Full:
+                if self.overflow == "drop_newest":
+                    self.metrics.dropped(message_type, "overflow")
+
+                    return False
+
+                try:
+                    dropped = pending.get_nowait()
+                    self.metrics.dropped(dropped[0], "overflow")
+                except queue.Empty:
+                    pass
+
+                try:
+                    pending.put_nowait(item)
+                except queue.Full:
+                    self.metrics.dropped(message_type, "overflow")
+
+                    return False
+
+        self.metrics.queue_depth(self.depth())
+
+        return True
+
+    def depth(self):
+        return sum(pending.qsize() for pending in self.queues)
+
+    def _start(self):
+
+        if len(self.threads) >= self.workers:
+            return
+
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._work, args=(self.queues[len(self.threads)],),
+                                          name="JellyfinDispatch-%s" % len(self.threads))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def _work(self, pending):
+
+        while True:
+            item = pending.get()
+
+            if item is None:
+                break
+
+            message_type, data, queued = item
+            started = time.time()
+            self.metrics.queue_depth(self.depth())
+            subscriptions = self.subscriptions
+
+            for handler in subscriptions.get(message_type, []) + subscriptions.get(ANY, []):
+                handler_started = time.time()
+                error = None
+
+                try:
+                    handler(message_type, data)
+                except Exception as exception:
+                    error = exception
+                    LOG.exception("Exception in %s handler.", message_type)
+
+                self.metrics.dispatched(message_type, started - queued, time.time() - handler_started, error)
+
+    def stop(self):
+
+        ''' Let the workers finish the message they are handling, drop the queued ones.
+        '''
+        self.stopped = True
+
+        for pending in self.queues:
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    break
+
+        for index in range(len(self.threads)):
+            self.queues[index].put(None)
+
+        self.threads = []
+
+    def stats(self):
+        return {
+            'queued': self.depth(),
+            'workers': len(self.threads),
+            'subscriptions': dict((key, len(handlers)) for key, handlers in self.subscriptions.items())
+        }
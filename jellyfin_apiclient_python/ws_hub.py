@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+''' The websockets of any number of clients served by one thread: a selector for the sockets,
+    a timer queue for pings and KeepAlive messages.
+'''
+
+#################################################################################################
+
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket
+
+#################################################################################################
+
+LOG = logging.getLogger('JELLYFIN.' + __name__)
+PING_INTERVAL = 10
+CONNECT_TIMEOUT = 10
+CONNECT_WORKERS = 4
+
+#################################################################################################
+
+
+class TimerQueue(object):
+
+    ''' Timers ordered by deadline in a heap. Cancelled timers stay in the heap and are skipped
+        when they come up, so cancelling is O(1).
+    '''
+    def __init__(self):
+
+        self.heap = []
+        self.counter = itertools.count()
+
+    def call_later(self, delay, call, *args):
+
+        timer = [time.time() + delay, next(self.counter), call, args]
+        heapq.heappush(self.heap, timer)
+
+        return timer
+
+    @staticmethod
+    def cancel(timer):
+
+        if timer is not None:
+            timer[2] = None
+
+    def timeout(self):
+
+        ''' Seconds until the next timer, None without timers.
+        '''
+        while self.heap and self.heap[0][2] is None:
+            heapq.heappop(self.heap)
+
+        if not self.heap:
+            return None
+
+        return max(0, self.heap[0][0] - time.time())
+
+    def run_due(self):
+
+        now = time.time()
+
+        while self.heap and self.heap[0][0] <= now:
+            timer = heapq.heappop(self.heap)
+            call, args = timer[2], timer[3]
+
+            if call is None:
+                continue
+
+            timer[2] = None
+
+            try:
+                call(*args)
+            except Exception:
+                LOG.exception("Websocket hub timer failed.")
+
+    def __len__(self):
+        return sum(1 for timer in self.heap if timer[2] is not None)
+
+
+class HubConnection(object):
+
+    ''' The socket and the timers of one WSClient.
+    '''
+    def __init__(self, wsclient):
+
+        self.wsclient = wsclient
+        self.ws = None
+        self.fileno = None
+        self.pinged = None
+        self.ping = None
+        self.keepalive = None
+
+
+class WebSocketHub(threading.Thread):
+
+    ''' Runs the websockets of many clients in a single thread instead of a WSClient thread
+        (plus a KeepAlive thread) per client. Messages are handed to WSClient.on_message, and so
+        to each client's callback, on the hub thread: keep the callbacks short. Dropped sockets
+        are reopened on a timer, following the client's Reconnect backoff.
+
+        hub = WebSocketHub.get()
+        for client in clients:
+            client.start(websocket=True, hub=hub)
+
+        Every interaction with the open sockets happens on the hub thread, the other threads queue
+        calls through call_soon(). Connecting (DNS, TCP, TLS and the upgrade) blocks, so it runs on
+        CONNECT_WORKERS helper threads which hand the socket back to the hub thread; closing sends
+        the close frame without waiting for the peer's. Sockets are read a frame at a time with a
+        CONNECT_TIMEOUT socket timeout, a peer stalling in the middle of a frame delays the others
+        by that much.
+    '''
+    lock = threading.Lock()
+    default = None
+
+    @classmethod
+    def get(cls):
+
+        ''' The process wide hub.
+        '''
+        with cls.lock:
+            if cls.default is None:
+                cls.default = cls()
+
+            return cls.default
+
+    def __init__(self, ping_interval=PING_INTERVAL, timeout=CONNECT_TIMEOUT):
+
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.selector = selectors.DefaultSelector()
+        self.timers = TimerQueue()
+        self.connections = {}
+        self.connecting = set()
+        self.connector = ThreadPoolExecutor(max_workers=CONNECT_WORKERS, thread_name_prefix="JellyfinWebSocketConnect")
+        self.pending = deque()
+        self.stop = False
+        self.start_lock = threading.Lock()
+        self.waker, self.wakeup = socket.socketpair()
+        self.waker.setblocking(False)
+        self.wakeup.setblocking(False)
+        self.selector.register(self.waker, selectors.EVENT_READ)
+
+        threading.Thread.__init__(self, name="JellyfinWebSocketHub")
+        self.daemon = True
+
+    def call_soon(self, call, *args):
+
+        ''' Run call(*args) on the hub thread. Safe from any thread.
+        '''
+        self.pending.append((call, args))
+
+        try:
+            self.wakeup.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # the hub is already awake
+
+    def add(self, wsclient):
+
+        wsclient.hub = self
+
+        with self.start_lock:
+            if not self.is_alive() and not self.stop:
+                self.start()
+
+        self.call_soon(self._open, wsclient)
+
+    def remove(self, wsclient):
+        self.call_soon(self._remove, wsclient)
+
+    def keep_alive(self, wsclient, timeout):
+
+        ''' Send KeepAlive every timeout / 2 seconds, replacing the previous schedule.
+        '''
+        self.call_soon(self._schedule_keepalive, wsclient, timeout)
+
+    def close(self):
+
+        self.stop = True
+        self.call_soon(lambda: None)
+
+    def stats(self):
+        return {'connections': len(self.connections), 'timers': len(self.timers), 'pending': len(self.pending)}
+
+    def run(self):
+
+        LOG.info("--->[ websocket hub ]")
+
+        while not self.stop:
+            for key, events in self.selector.select(self.timers.timeout()):
+                if key.fileobj is self.waker:
+                    self._drain()
+                else:
+                    self._read(key.data)
+
+            self._run_pending()
+            self.timers.run_due()
+
+        for connection in list(self.connections.values()):
+            self._close(connection)
+
+        self.connector.shutdown(wait=False)
+        self.selector.close()
+        self.waker.close()
+        self.wakeup.close()
+        LOG.info("---<[ websocket hub ]")
+
+    def _drain(self):
+
+        try:
+            while self.waker.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_pending(self):
+
+        while self.pending:
+            call, args = self.pending.popleft()
+
+            try:
+                call(*args)
+            except Exception:
+                LOG.exception("Websocket hub call failed.")
+
+    def _open(self, wsclient):
+
+        if wsclient.stop or wsclient in self.connections or wsclient in self.connecting:
+            return
+
+        self.connecting.add(wsclient)
+
+        try:
+            self.connector.submit(self._connect, wsclient, wsclient.get_url(), wsclient.get_sslopt())
+        except RuntimeError:  # the hub is stopping
+            self.connecting.discard(wsclient)
+
+    def _connect(self, wsclient, url, sslopt):
+
+        ''' On a connector thread.
+        '''
+        try:
+            ws = websocket.create_connection(url, timeout=self.timeout, sslopt=sslopt, enable_multithread=True)
+        except Exception as error:
+            self.call_soon(self._connect_failed, wsclient, error)
+        else:
+            if self.stop:
+                ws.close(timeout=0)
+            else:
+                self.call_soon(self._connected, wsclient, ws)
+
+    def _connect_failed(self, wsclient, error):
+
+        self.connecting.discard(wsclient)
+        wsclient.on_error(None, error)
+        self._reconnect(wsclient)
+
+    def _connected(self, wsclient, ws):
+
+        self.connecting.discard(wsclient)
+
+        if wsclient.stop:  # removed while connecting
+            ws.close(timeout=0)
+            wsclient.reconnect.stopped()
+
+            return
+
+        connection = HubConnection(wsclient)
+        connection.ws = ws
+        self.connections[wsclient] = connection
+        wsclient.wsc = connection.ws
+        connection.fileno = connection.ws.sock.fileno()
+        self.selector.register(connection.fileno, selectors.EVENT_READ, connection)
+        connection.ping = self.timers.call_later(self.ping_interval, self._ping, connection)
+        wsclient.on_open(None)
+
+    def _ping(self, connection):
+
+        if connection.pinged is not None:
+            self._close(connection, websocket.WebSocketTimeoutException("No pong received"))
+
+            return
+
+        try:
+            connection.ws.ping()
+            connection.pinged = time.time()
+        except Exception as error:
+            self._close(connection, error)
+        else:
+            connection.ping = self.timers.call_later(self.ping_interval, self._ping, connection)
+
+    def _schedule_keepalive(self, wsclient, timeout):
+
+        connection = self.connections.get(wsclient)
+
+        if connection is None:
+            return
+
+        self.timers.cancel(connection.keepalive)
+        connection.keepalive = self.timers.call_later(timeout / 2, self._send_keepalive, connection, timeout)
+
+    def _send_keepalive(self, connection, timeout):
+
+        try:
+            connection.wsclient.send("KeepAlive")
+        except Exception as error:
+            self._close(connection, error)
+        else:
+            connection.keepalive = self.timers.call_later(timeout / 2, self._send_keepalive, connection, timeout)
+
+    def _read(self, connection):
+
+        ws = connection.ws
+
+        while True:
+            try:
+                opcode, data = ws.recv_data(control_frame=True)
+            except Exception as error:
+                self._close(connection, error)
+
+                return
+
+            if opcode == websocket.ABNF.OPCODE_CLOSE:
+                self._close(connection)
+
+                return
+
+            if opcode == websocket.ABNF.OPCODE_PONG:
+                connection.pinged = None
+
+            if opcode in (websocket.ABNF.OPCODE_TEXT, websocket.ABNF.OPCODE_BINARY):
+                try:
+                    connection.wsclient.on_message(None, data)
+                except Exception as error:
+                    LOG.exception("Websocket message handling failed.")
+                    connection.wsclient.on_error(None, error)
+
+            # Decrypted bytes waiting in the TLS layer never wake the selector up.
+            pending = getattr(ws.sock, 'pending', None)
+
+            if ws.sock is None or pending is None or not pending():
+                return
+
+    def _remove(self, wsclient):
+
+        connection = self.connections.get(wsclient)
+
+        if connection is not None:
+            self._close(connection)
+
+    def _close(self, connection, error=None):
+
+        wsclient = connection.wsclient
+
+        if self.connections.pop(wsclient, None) is None:
+            return
+
+        self.timers.cancel(connection.ping)
+        self.timers.cancel(connection.keepalive)
+
+        try:
+            self.selector.unregister(connection.fileno)
+        except (KeyError, ValueError):
+            pass
+
+        try:
+            connection.ws.close(timeout=0)
+        except Exception:
+            pass
+
+        if error is not None and not wsclient.stop:
+            wsclient.on_error(None, error)
+
+        self._reconnect(wsclient)
+
+    def _reconnect(self, wsclient):
+
+        delay = wsclient.on_disconnect(final=self.stop)
+
+        if delay is None:
+            wsclient.reconnect.stopped()
+        else:
+            self.timers.call_later(delay, self._open, wsclient)
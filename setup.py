@@ -20,5 +20,6 @@ setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.6',
-    install_requires=['requests', 'urllib3', 'websocket_client', 'six']
+    install_requires=['requests', 'urllib3', 'websocket_client', 'six'],
+    extras_require={'async': ['aiohttp']}
 )
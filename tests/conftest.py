@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from jellyfin_apiclient_python import JellyfinClient
+
+from .server import StandIn
+
+
+def make_client(url):
+
+    client = JellyfinClient(allow_multiple_clients=True)
+    client.config.app('tests', '1.0', 'pytest', 'pytest-device')
+    client.config.auth(url, 'u1', 't1', False)
+    client.config.data['auth.server-id'] = 's1'
+    client.config.data['http.max_retries'] = 0
+
+    return client
+
+
+@pytest.fixture
+def server():
+
+    stand_in = StandIn()
+    yield stand_in
+    stand_in.stop()
+
+
+@pytest.fixture
+def client(server):
+
+    client = make_client(server.url)
+    yield client
+    client.http.stop_session()
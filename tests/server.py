@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+''' Stand-in Jellyfin server for the tests: a threading http.server answering the few routes
+    the client code uses, with switches to misbehave.
+'''
+
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FILE = (b'0123456789abcdef' * 65536)[:1000003]
+GZIP_BODY = b''.join(b'line %06d of a compressible body\n' % i for i in range(20000))
+TRICKLE = b'0123456789' * 2
+
+
+def make_items(count):
+    return [{'Id': '%032x' % i, 'Name': 'Item %d' % i, 'Type': 'Movie', 'ParentId': 'p1', 'Etag': 'e%d' % i}
+            for i in range(count)]
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, code, obj=None, headers=None, raw=None):
+
+        body = raw if raw is not None else (json.dumps(obj).encode() if obj is not None else b'')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send(204)
+
+    def do_GET(self):
+
+        state = self.server
+
+        with state.lock:
+            state.active += 1
+            state.peak = max(state.peak, state.active)
+
+        try:
+            self.get()
+        finally:
+            with state.lock:
+                state.active -= 1
+
+    def get(self):
+
+        state = self.server
+        url = urlparse(self.path)
+        query = dict((key, value[0]) for key, value in parse_qs(url.query).items())
+        path = url.path
+
+        with state.lock:
+            state.requests.append((self.command, path, query, dict(self.headers)))
+
+        for pattern, delay in list(state.slow.items()):
+            if re.search(pattern, path):
+                time.sleep(delay)
+
+        for pattern in state.fail:
+            if re.search(pattern, path):
+                return self.send(state.fail_status, {})
+
+        match = re.match(r'^/Users/\w+/Items/(\w+)$', path)
+
+        if match:
+            item = state.by_id.get(match.group(1))
+
+            if item is None:
+                return self.send(404, {})
+
+            return self.send(200, item, {'ETag': '"%s"' % item['Etag']})
+
+        if re.match(r'^/Users/\w+/Items$', path):
+            items = state.items
+
+            if 'Ids' in query:
+                items = [state.by_id[x] for x in query['Ids'].replace('-', '').lower().split(',') if x in state.by_id]
+            elif 'ParentId' in query:
+                items = state.children.get(query['ParentId'], [])
+
+            start = int(query.get('StartIndex', 0))
+            limit = min(int(query.get('Limit', len(items))), state.page_cap or len(items))
+
+            return self.send(200, {'Items': items[start:start + limit], 'TotalRecordCount': len(items),
+                                   'StartIndex': start})
+
+        if re.match(r'^/Users/\w+/Views$', path):
+            return self.send(200, {'Items': state.views, 'TotalRecordCount': len(state.views)})
+
+        if path == '/file':
+            return self.send_file()
+
+        if path == '/trickle':
+            return self.send_trickle()
+
+        if path == '/gzip' or path.startswith('/Audio/'):
+            return self.send(200, raw=gzip.compress(GZIP_BODY), headers={'Content-Encoding': 'gzip'})
+
+        match = re.match(r'^/Items/(\w+)/Images/(\w+)$', path)
+
+        if match:
+            if match.group(1) == 'missing':
+                return self.send(404, {})
+
+            body = (match.group(1) * 100).encode()
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+
+            if self.headers.get('If-None-Match') == etag:
+                return self.send(304, headers={'ETag': etag})
+
+            return self.send(200, raw=body, headers={'ETag': etag})
+
+        self.send(200, {'ok': True, 'path': path})
+
+    def send_trickle(self):
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(TRICKLE)))
+        self.end_headers()
+
+        for index in range(len(TRICKLE)):
+            self.wfile.write(TRICKLE[index:index + 1])
+            self.wfile.flush()
+            time.sleep(0.1)
+
+    def send_file(self):
+
+        state = self.server
+        ranged = self.headers.get('Range')
+
+        if not ranged or state.ignore_range:
+            return self.send(200, raw=FILE, headers={'Accept-Ranges': 'bytes'})
+
+        start, end = ranged.split('=')[1].split('-')
+        start = int(start)
+        end = min(int(end) if end else len(FILE) - 1, len(FILE) - 1)
+
+        return self.send(206, raw=FILE[start:end + 1], headers={
+            'Content-Range': 'bytes %d-%d/%d' % (start, end, len(FILE)),
+            'Accept-Ranges': 'bytes'
+        })
+
+
+class StandIn(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, items=1000):
+
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.fail = set()
+        self.fail_status = 500
+        self.slow = {}
+        self.active = 0
+        self.peak = 0
+        self.ignore_range = False
+        self.page_cap = None
+        self.items = make_items(items)
+        self.by_id = dict((item['Id'], item) for item in self.items)
+        self.views = [{'Id': 'p1', 'Name': 'Movies', 'CollectionType': 'movies', 'IsFolder': True}]
+        self.children = {'p1': self.items}
+        self.url = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def paths(self, prefix=""):
+
+        with self.lock:
+            return [path for method, path, query, headers in self.requests if path.startswith(prefix)]
+
+    def stop(self):
+
+        self.shutdown()
+        self.server_close()
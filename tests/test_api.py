@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+
+def test_iter_items_follows_short_pages(client, server):
+
+    server.page_cap = 70
+    items = list(client.jellyfin.iter_items({'ParentId': 'p1'}, page_size=100))
+
+    assert [item['Id'] for item in items] == [item['Id'] for item in server.items]
+    assert len(server.paths('/Users/u1/Items')) == 15
+
+
+def test_iter_items_limit_with_short_pages(client, server):
+
+    server.page_cap = 70
+    items = list(client.jellyfin.iter_items({'ParentId': 'p1', 'StartIndex': 10, 'Limit': 150}, page_size=100))
+
+    assert [item['Id'] for item in items] == [item['Id'] for item in server.items[10:160]]
+    assert [query['Limit'] for method, path, query, headers in server.requests] == ['100', '80', '10']
+
+
+def test_iter_items_stops_on_empty_page(client, server, monkeypatch):
+
+    pages = [{'Items': server.items[:10], 'TotalRecordCount': 1000}, {'Items': [], 'TotalRecordCount': 1000}]
+    monkeypatch.setattr(client.jellyfin, 'user_items', lambda handler, params: pages.pop(0))
+
+    assert len(list(client.jellyfin.iter_items(page_size=100))) == 10
+    assert pages == []
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+from jellyfin_apiclient_python.artwork import ArtworkCache
+
+
+def image_requests(server):
+    return [headers for method, path, query, headers in server.requests if '/Images/' in path]
+
+
+def test_revalidated_blob_is_refetched_when_gone(client, server, tmp_path):
+
+    cache = client.jellyfin.enable_artwork_cache(str(tmp_path))
+    path = client.jellyfin.get_artwork('abc', 'Primary', 400)
+
+    assert client.jellyfin.get_artwork('abc', 'Primary', 400) == path
+    assert cache.stats()['revalidations'] == 1
+
+    os.remove(path)
+
+    assert client.jellyfin.get_artwork('abc', 'Primary', 400) == path
+    assert open(path, 'rb').read() == b'abc' * 100
+    assert [headers.get('If-None-Match') is not None for headers in image_requests(server)] == \
+        [False, True, True, False]
+
+    cache.close()
+
+
+def test_unchanged_image_keeps_its_blob(client, server, tmp_path):
+
+    cache = client.jellyfin.enable_artwork_cache(str(tmp_path))
+    path = client.jellyfin.get_artwork('abc', 'Primary', 400)
+    cache._store('Items/abc', b'abc' * 100, None)
+    cache._store('Items/abc', b'abc' * 100, None)
+
+    assert os.path.exists(path)
+    cache.close()
+
+
+def test_index_writes_are_batched(client, server, tmp_path, monkeypatch):
+
+    saves = []
+    save = ArtworkCache._save
+    monkeypatch.setattr(ArtworkCache, '_save', lambda self, entries: saves.append(1) or save(self, entries))
+    cache = client.jellyfin.enable_artwork_cache(str(tmp_path))
+
+    for future in client.jellyfin.prefetch_artwork(['i%d' % x for x in range(50)]):
+        future.result()
+
+    cache.close()
+
+    assert len(saves) <= 2
+    with open(str(tmp_path / 'index.json')) as index:
+        assert len(json.load(index)) == 50
+
+    assert ArtworkCache(client.jellyfin, str(tmp_path)).stats()['entries'] == 50
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+import pytest
+
+from jellyfin_apiclient_python.async_client import AsyncJellyfinClient
+from jellyfin_apiclient_python.downloader import AsyncDownload
+from jellyfin_apiclient_python.exceptions import HTTPException
+from jellyfin_apiclient_python.limiter import ServerLimiter
+from jellyfin_apiclient_python.retry import RetryPolicy
+from jellyfin_apiclient_python.ws_client import WSClient
+
+from .server import FILE, GZIP_BODY, TRICKLE
+
+
+def run(server, test, **http):
+
+    async def main():
+        client = AsyncJellyfinClient(allow_multiple_clients=True)
+        client.config.app('tests', '1.0', 'pytest', 'pytest-device')
+        client.config.auth(server.url, 'u1', 't1', False)
+        client.config.data['auth.server-id'] = 's1'
+        client.config.data['http.max_retries'] = 0
+        client.config.data.update(('http.' + key, value) for key, value in http.items())
+        client.async_http.retry.default = RetryPolicy(retries=0)
+
+        try:
+            return await test(client.jellyfin)
+        finally:
+            await client.async_http.stop_session()
+            client.http.stop_session()
+
+    return asyncio.run(main())
+
+
+def test_get_item(server):
+
+    async def test(api):
+        return await api.get_item(server.items[2]['Id'])
+
+    assert run(server, test)['Name'] == 'Item 2'
+
+
+def test_cache_is_served_and_revalidated(server):
+
+    item_id = server.items[2]['Id']
+
+    async def test(api):
+        first = await api.get_item(item_id)
+        second = await api.get_item(item_id)
+        api.client.cache.entries[next(iter(api.client.cache.entries))].stored = 0
+        third = await api.get_item(item_id)
+
+        return first, second, third
+
+    first, second, third = run(server, test, cache_max_bytes=1 << 20)
+
+    assert first == second == third
+    requests = [headers for method, path, query, headers in server.requests if path.endswith(item_id)]
+    assert len(requests) == 2
+    assert requests[1].get('If-None-Match') == '"e2"'
+
+
+def test_singleflight(server):
+
+    async def test(api):
+        return await asyncio.gather(*(api.get_item(server.items[5]['Id']) for _ in range(5)))
+
+    results = run(server, test, singleflight=True)
+
+    assert [item['Name'] for item in results] == ['Item 5'] * 5
+    assert len(server.paths('/Users/u1/Items/')) == 1
+
+
+def test_raw(server):
+
+    async def test(api):
+        response = await api._http("GET", "Users/{UserId}/Views", {'raw': True})
+
+        return response.status, await response.json(content_type=None)
+
+    status, body = run(server, test)
+
+    assert status == 200
+    assert body['Items'][0]['Id'] == 'p1'
+
+
+def test_breaker_opens(server):
+
+    server.fail.add('/Views$')
+    server.fail_status = 503
+
+    async def test(api):
+        api.client.retry.default = RetryPolicy(retries=2, base=0.01)
+
+        for _ in range(2):
+            with pytest.raises(HTTPException) as error:
+                await api.get_views()
+
+            assert error.value.status == 503
+
+        with pytest.raises(HTTPException) as error:
+            await api.get_views()
+
+        return error.value.status
+
+    assert run(server, test, breaker_threshold=2, breaker_reset_timeout=60) == "ServerUnreachable"
+    assert len(server.paths('/Users/u1/Views')) == 6
+
+
+def test_download_mapped(server, tmp_path):
+
+    async def test(api):
+        for handler in ("file", "gzip"):
+            await api.download_mapped(handler, str(tmp_path / handler))
+
+    run(server, test)
+
+    for handler, body in (("file", FILE), ("gzip", GZIP_BODY)):
+        with open(str(tmp_path / handler), 'rb') as result:
+            assert result.read() == body
+
+
+def test_timeout_bounds_each_read(server):
+
+    received = []
+
+    class Sink(object):
+        def write(self, chunk):
+            received.append(bytes(chunk))
+
+    async def test(api):
+        api.client.retry.default = RetryPolicy(retries=2, base=0.01)
+        await api._get_stream('trickle', Sink())
+
+    run(server, test, timeout=0.5)
+
+    assert b''.join(received) == TRICKLE
+    assert len(server.paths('/trickle')) == 1
+
+
+def test_partial_body_is_not_sent_again(server):
+
+    received = []
+
+    class Sink(object):
+        def write(self, chunk):
+            received.append(bytes(chunk))
+
+    async def test(api):
+        api.client.retry.default = RetryPolicy(retries=2, base=0.01)
+
+        with pytest.raises(HTTPException) as error:
+            await api._get_stream('trickle', Sink())
+
+        return error.value.status
+
+    assert run(server, test, timeout=0.05) == "ReadTimeout"
+    assert TRICKLE.startswith(b''.join(received))
+    assert len(server.paths('/trickle')) == 1
+
+
+def test_websocket_catch_up(server):
+
+    got = []
+
+    async def test(api):
+        client = api.client.client
+        client.callback = lambda message_type, data: got.append((message_type, data))
+        client.config.data['app.default'] = True
+        client.logged_in = True
+        await client.start()
+
+        wsclient = WSClient(client, True)
+        await asyncio.get_event_loop().run_in_executor(None, wsclient.catch_up, time.time() - 100)
+
+    run(server, test)
+
+    assert [message_type for message_type, data in got] == ["LibraryChanged", "UserDataChanged"]
+    assert len(got[0][1]['ItemsUpdated']) == len(server.items)
+
+
+def test_iter_items(server):
+
+    async def test(api):
+        return [item['Id'] async for item in api.iter_items({'ParentId': 'p1'}, page_size=300)]
+
+    assert run(server, test) == [item['Id'] for item in server.items]
+
+
+def test_iter_items_follows_short_pages(server):
+
+    async def test(api):
+        return [item['Id'] async for item in api.iter_items({'ParentId': 'p1'}, page_size=100)]
+
+    server.page_cap = 70
+
+    assert run(server, test) == [item['Id'] for item in server.items]
+    assert len(server.paths('/Users/u1/Items')) == 15
+
+
+def test_stream_items_and_views(server):
+
+    async def test(api):
+        stream = await api.stream_items({'ParentId': 'p1'})
+        items = [item['Id'] async for item in stream]
+        views = [bytes(view) async for view in await api.iter_stream("file")]
+
+        return items, stream.total_record_count, b''.join(views)
+
+    items, total, body = run(server, test, stream_buffer_size=4096)
+
+    assert items == [item['Id'] for item in server.items]
+    assert total == len(server.items)
+    assert body == FILE
+
+
+def test_item_batching(server):
+
+    async def test(api):
+        api.enable_item_batching()
+
+        return await asyncio.gather(*(api.get_item(item['Id']) for item in server.items[:5]))
+
+    assert [item['Name'] for item in run(server, test)] == ['Item %d' % x for x in range(5)]
+    assert len(server.paths('/Users/u1/Items')) == 1
+
+
+def test_crawl(server):
+
+    async def test(api):
+        return [item async for item in api.crawl(workers=4, page_size=300)]
+
+    assert len(run(server, test)) == len(server.items) + 1
+    assert len(server.paths('/Users/u1/Items')) == 4
+
+
+def test_download(server, tmp_path):
+
+    path = str(tmp_path / 'file')
+
+    async def test(api):
+        return await api.download('file', path, workers=4, chunk_size=100000)
+
+    assert run(server, test) == path
+    assert open(path, 'rb').read() == FILE
+    assert len(server.paths('/file')) == 12
+
+
+def test_download_ignored_range(server, tmp_path):
+
+    server.ignore_range = True
+    path = str(tmp_path / 'file')
+
+    async def test(api):
+        return await api.download('file', path, workers=4, chunk_size=100000)
+
+    run(server, test)
+
+    assert open(path, 'rb').read() == FILE
+    assert 'Range' not in server.requests[-1][3]
+
+
+def test_artwork_cache(server, tmp_path):
+
+    async def test(api):
+        cache = api.enable_artwork_cache(str(tmp_path))
+        paths = await asyncio.gather(*api.prefetch_artwork(['a1', 'a1', 'b2']))
+        missing = await api.get_artwork('missing', "Primary", 100)
+        cache.close()
+
+        return paths, missing, cache.stats()
+
+    paths, missing, stats = run(server, test)
+
+    assert open(paths[0], 'rb').read() == b'a1' * 100
+    assert paths[0] == paths[1] != paths[2]
+    assert missing is None
+    assert (stats['entries'], stats['deduped']) == (2, 1)
+    assert len(server.paths('/Items/a1/Images')) == 1
+
+
+def test_server_limiter(server):
+
+    server.slow['/Items/'] = 0.05
+
+    async def test(api):
+        return await asyncio.gather(*(api.get_item(item['Id']) for item in server.items[:10]))
+
+    results = run(server, test, max_in_flight=2)
+    stats = ServerLimiter.get(server.url).stats()
+
+    assert len(results) == 10
+    assert server.peak <= 2
+    assert (stats['acquired'], stats['in_flight']) == (10, 0)
+    assert stats['waited_seconds'] > 0
+
+
+def test_failed_range_cancels_the_others(server, tmp_path, monkeypatch):
+
+    fetch = AsyncDownload._fetch
+
+    async def failing(self, index, slots):
+        if index == 0:
+            raise HTTPException(404, "gone")
+
+        return await fetch(self, index, slots)
+
+    monkeypatch.setattr(AsyncDownload, '_fetch', failing)
+
+    async def test(api):
+        with pytest.raises(HTTPException):
+            await api.download('file', str(tmp_path / 'file'), workers=2, chunk_size=1000)
+
+    run(server, test)
+
+    assert len(server.paths('/file')) < 100
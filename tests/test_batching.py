@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import uuid
+
+import pytest
+
+from jellyfin_apiclient_python.exceptions import HTTPException
+
+
+def test_batched_get_item(client, server):
+
+    loader = client.jellyfin.enable_item_batching()
+    dashed = str(uuid.UUID(server.items[3]['Id'])).upper()
+
+    with loader.batch():
+        futures = [loader.load(x) for x in (server.items[1]['Id'], dashed, 'f' * 32)]
+
+    assert futures[0].result(5)['Name'] == 'Item 1'
+    assert futures[1].result(5)['Name'] == 'Item 3'
+
+    with pytest.raises(HTTPException):
+        futures[2].result(5)
+
+    assert len(server.paths('/Users/u1/Items')) == 1
+
+
+def test_malformed_result_resolves_every_future(client, monkeypatch):
+
+    loader = client.jellyfin.enable_item_batching()
+    monkeypatch.setattr(client.jellyfin, 'get_items', lambda chunk: ['not', 'a', 'dict'])
+
+    with loader.batch():
+        futures = [loader.load('%032x' % x) for x in range(3)]
+
+    for future in futures:
+        with pytest.raises(AttributeError):
+            future.result(5)
+
+
+def test_failed_batch_is_not_a_missing_item(client, server):
+
+    loader = client.jellyfin.enable_item_batching()
+    server.fail.add('/Items$')
+
+    with pytest.raises(HTTPException) as error:
+        client.jellyfin.get_item(server.items[1]['Id'])
+
+    assert error.value.status == "BatchFailed"
+    assert len(server.paths('/Users/u1/Items')) == 1
+    loader.dispatch()
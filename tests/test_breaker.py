@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from jellyfin_apiclient_python.breaker import CircuitBreaker
+from jellyfin_apiclient_python.exceptions import HTTPException
+from jellyfin_apiclient_python.retry import RetryPolicy
+
+
+def test_retried_request_counts_once(client, server):
+
+    server.fail.add('/Views$')
+    server.fail_status = 503
+    client.config.data['http.breaker_threshold'] = 2
+    client.http.retry.default = RetryPolicy(retries=2, base=0.01)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            client.jellyfin.get_views()
+
+        assert error.value.status == 503
+
+    with pytest.raises(HTTPException) as error:
+        client.jellyfin.get_views()
+
+    assert error.value.status == "ServerUnreachable"
+    assert len(server.paths('/Users/u1/Views')) == 6
+
+
+def test_recovered_request_counts_as_success(client, server):
+
+    client.config.data['http.breaker_threshold'] = 1
+    client.jellyfin.get_views()
+    breaker = CircuitBreaker.get(server.url, 1, client.config.data['http.breaker_reset_timeout'])
+
+    assert breaker.failures == 0 and breaker.state == "Closed"
+
+
+def test_first_settings_win(server):
+
+    first = CircuitBreaker.get(server.url + '/first', 3, 30)
+
+    assert CircuitBreaker.get(server.url + '/first', 10, 5) is first
+    assert (first.threshold, first.reset_timeout) == (3, 30)
+
+
+def opened(server, reset_timeout):
+
+    breaker = CircuitBreaker.get(server.url, 1, reset_timeout)
+    breaker.failure()
+    breaker.opened_at = 0
+
+    return breaker
+
+
+def test_failed_probe_reopens(client, server):
+
+    client.config.data['http.breaker_threshold'] = 1
+    client.config.data['http.breaker_reset_timeout'] = 60
+    breaker = opened(server, 60)
+    server.fail.add('/System/Info/Public$')
+    server.fail_status = 503
+
+    with pytest.raises(HTTPException) as error:
+        client.jellyfin.get_views()
+
+    assert error.value.status == "ServerUnreachable"
+    assert (breaker.state, breaker.probing) == ("Open", False)
+    assert not server.paths('/Users/u1/Views')
+
+
+def test_cancelled_probe_is_released(server):
+
+    from .test_async import run
+
+    breaker = opened(server, 0.2)
+    server.slow['/System/Info/Public$'] = 1
+
+    async def test(api):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(api.get_views(), 0.2)
+
+        assert (breaker.state, breaker.probing) == ("Open", False)
+        await asyncio.sleep(0.3)
+        server.slow.clear()
+
+        return await api.get_views()
+
+    assert run(server, test, breaker_threshold=1, breaker_reset_timeout=0.2)['Items'][0]['Id'] == 'p1'
+    assert breaker.state == "Closed"
+
+
+def test_off_by_default(client, server):
+
+    server.fail.add('/Views$')
+    server.fail_status = 503
+    client.http.retry.default = RetryPolicy(retries=0)
+
+    for _ in range(6):
+        with pytest.raises(HTTPException) as error:
+            client.jellyfin.get_views()
+
+        assert error.value.status == 503
+
+    assert len(server.paths('/Users/u1/Views')) == 6
+    assert client.http.breaker is None
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from jellyfin_apiclient_python.limiter import ServerLimiter
+
+
+def test_crawl_pages_folders(client, server):
+
+    items = list(client.jellyfin.crawl(workers=4, page_size=300))
+
+    assert len(items) == len(server.items) + 1
+    starts = [query.get('StartIndex') for method, path, query, headers in server.requests
+              if query.get('ParentId') == 'p1']
+    assert starts == ['0', '300', '600', '900']
+
+
+def test_failed_folder_is_counted(client, server):
+
+    server.fail.add('/Items$')
+    progress = []
+    items = list(client.jellyfin.crawl(progress=progress.append))
+
+    assert [item['Id'] for item in items] == ['p1']
+    assert progress[-1].errors == 1
+
+
+def test_crawl_goes_through_the_server_limiter(client, server):
+
+    client.config.data['http.max_in_flight'] = 2
+    items = list(client.jellyfin.crawl(workers=4, page_size=100))
+    stats = ServerLimiter.get(server.url).stats()
+
+    assert len(items) == len(server.items) + 1
+    assert stats['acquired'] == 11  # views and 10 pages
+    assert stats['in_flight'] == 0
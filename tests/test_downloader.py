@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+import pytest
+
+from jellyfin_apiclient_python.downloader import Download
+from jellyfin_apiclient_python.exceptions import HTTPException
+
+from .server import FILE
+
+
+def test_parallel_ranges(client, server, tmp_path):
+
+    path = str(tmp_path / 'file')
+    client.jellyfin.download('file', path, workers=4, chunk_size=100000)
+
+    assert open(path, 'rb').read() == FILE
+    assert len(server.paths('/file')) == 12  # HEAD and 11 ranges
+    assert not os.path.exists(path + '.part.json')
+
+
+def test_ignored_range_falls_back_to_sequential(client, server, tmp_path):
+
+    server.ignore_range = True
+    path = str(tmp_path / 'file')
+    client.jellyfin.download('file', path, workers=4, chunk_size=100000)
+
+    assert open(path, 'rb').read() == FILE
+    assert 'Range' not in server.requests[-1][3]
+
+
+def test_failed_range_cancels_the_others(client, server, tmp_path, monkeypatch):
+
+    fetch = Download._fetch
+    fetched = []
+    lock = threading.Lock()
+
+    def failing(self, index):
+        with lock:
+            fetched.append(index)
+
+        if index == 0:
+            raise HTTPException(404, "gone")
+
+        return fetch(self, index)
+
+    monkeypatch.setattr(Download, '_fetch', failing)
+
+    with pytest.raises(HTTPException):
+        client.jellyfin.download('file', str(tmp_path / 'file'), workers=2, chunk_size=1000)
+
+    assert len(fetched) < 100
+
+
+def test_server_error_is_not_a_download(client, server, tmp_path):
+
+    server.fail.add('/file$')
+    path = str(tmp_path / 'file')
+
+    with pytest.raises(HTTPException) as error:
+        client.jellyfin.download('file', path)
+
+    assert error.value.status == "DownloadFailed"
+    assert not os.path.exists(path)
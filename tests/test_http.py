@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+
+def test_context_follows_config_changes(client, server):
+
+    client.jellyfin.get_views()
+    client.config.data['auth.token'] = 't2'
+    client.jellyfin.get_views()
+
+    tokens = [headers.get('X-MediaBrowser-Token') for method, path, query, headers in server.requests]
+    assert tokens == ['t1', 't2']
+
+
+def test_context_of_a_plain_dict_is_rebuilt(client, server):
+
+    client.config.data = dict(client.config.data)
+    client.jellyfin.get_views()
+    client.config.data['auth.token'] = 't2'
+    client.config.data['auth.user_id'] = 'u2'
+    client.jellyfin.get_views()
+
+    assert [(path, headers.get('X-MediaBrowser-Token')) for method, path, query, headers in server.requests] == [
+        ('/Users/u1/Views', 't1'), ('/Users/u2/Views', 't2')]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+
+def send(client, message_type, data):
+    client.wsc.on_message(None, json.dumps({'MessageType': message_type, 'Data': data}))
+
+
+def test_messages_drop_dependent_entries(client, server):
+
+    client.config.data['http.cache_max_bytes'] = 1 << 20
+    client.callback = lambda message_type, data: None
+    first, second, third = (server.items[x]['Id'] for x in range(3))
+
+    for item_id in (first, second, third):
+        client.jellyfin.get_item(item_id)
+
+    send(client, 'LibraryChanged', {'ItemsUpdated': [first], 'ItemsRemoved': []})
+    send(client, 'UserDataChanged', {'UserDataList': [{'ItemId': second, 'Played': True}]})
+
+    for item_id in (first, second, third):
+        client.jellyfin.get_item(item_id)
+
+    assert server.paths('/Users/u1/Items/') == ['/Users/u1/Items/' + x for x in (first, second, third, first, second)]
+    assert client.http.cache.stats()['invalidations'] == 2
+
+
+def test_prewarm_fetches_updated_entries(client, server):
+
+    client.config.data['http.cache_max_bytes'] = 1 << 20
+    client.config.data['websocket.prewarm'] = True
+    client.callback = lambda message_type, data: None
+    first, second = (server.items[x]['Id'] for x in range(2))
+    client.jellyfin.get_item(first)
+
+    send(client, 'LibraryChanged', {'ItemsUpdated': [first, second]})
+    deadline = time.time() + 5
+
+    while not client.http.cache.references(first) and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert client.http.cache.references(first)
+    assert not client.http.cache.references(second)
+
+    client.jellyfin.get_item(first)
+    client.invalidation.stop()
+
+    assert server.paths('/Users/u1/Items/') == ['/Users/u1/Items/' + first] * 2
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+
+from jellyfin_apiclient_python.exceptions import HTTPException
+from jellyfin_apiclient_python.metrics import Histogram, MetricsRegistry
+
+ITEM = {'type': "GET", 'url': "{server}/Users/0123456789abcdef0123456789abcdef/Items/fedcba9876543210fedcba9876543210"}
+
+
+def observe(registry, data, seconds, status=200, error=None):
+
+    sample = registry.start(data)
+    sample.started = time.time() - seconds
+    sample.status = status
+    registry.observe(sample, error)
+
+
+def test_histogram_quantiles():
+
+    histogram = Histogram((0.1, 1, 10))
+
+    assert histogram.quantile(0.5) is None
+
+    for value in [0.05] * 50 + [0.5] * 45 + [5] * 4 + [60]:
+        histogram.observe(value)
+
+    assert (histogram.quantile(0.5), histogram.quantile(0.95), histogram.quantile(0.99)) == (0.1, 1, 10)
+    assert histogram.quantile(1) == float('inf')
+    assert histogram.cumulative() == [(0.1, 50), (1, 95), (10, 99), (float('inf'), 100)]
+
+
+def test_snapshot():
+
+    registry = MetricsRegistry()
+
+    for seconds in (0.001, 0.002, 0.2):
+        observe(registry, ITEM, seconds)
+
+    observe(registry, ITEM, 0.001, 404, HTTPException(404, "missing"))
+    registry.message("UserDataChanged")
+    registry.dropped("Play", "overflow")
+    registry.queue_depth(7)
+    registry.queue_depth(2)
+    snapshot = registry.snapshot()
+
+    assert sorted(snapshot) == ['http', 'uptime', 'websocket', 'websocket_dispatch', 'websocket_events']
+    assert list(snapshot['http']) == ['GET Users/{id}/Items/{id}']
+
+    stats = snapshot['http']['GET Users/{id}/Items/{id}']
+    assert sorted(stats) == ['bytes_in', 'bytes_out', 'errors', 'latency', 'queue_wait', 'retries', 'statuses']
+    assert stats['statuses'] == {'200': 3, '404': 1}
+    assert stats['errors'] == {'404': 1}
+    assert stats['latency']['count'] == 4
+    assert (stats['latency']['p50'], stats['latency']['p95']) == (0.005, 0.25)
+    assert stats['latency']['buckets']['+Inf'] == 4
+
+    assert snapshot['websocket']['UserDataChanged']['count'] == 1
+    assert snapshot['websocket_dispatch']['queue_depth'] == 2
+    assert snapshot['websocket_dispatch']['peak_queue_depth'] == 7
+    assert snapshot['websocket_dispatch']['handlers']['Play']['dropped'] == {'overflow': 1}
+
+
+def test_prometheus():
+
+    registry = MetricsRegistry()
+
+    for seconds in (0.001, 0.03, 0.3, 3, 40):
+        observe(registry, ITEM, seconds)
+
+    observe(registry, {'type': "GET", 'handler': 'Odd"Path\\with\nnewline'}, 0.01)
+    registry.queue_depth(3)
+    registry.queue_depth(1)
+    text = registry.prometheus()
+    lines = text.splitlines()
+
+    assert text.endswith("\n")
+    assert all(line.startswith(("# HELP jellyfin_client_", "# TYPE jellyfin_client_", "jellyfin_client_"))
+               for line in lines)
+
+    prefix = 'jellyfin_client_request_duration_seconds_bucket{handler="Users'
+    buckets = [line for line in lines if line.startswith(prefix)]
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    bounds = [re.search(r'le="([^"]+)"', line).group(1) for line in buckets]
+
+    assert counts == sorted(counts) and counts[-1] == 5
+    assert bounds[-1] == "+Inf" and bounds.count("+Inf") == 1
+    assert [float(bound) for bound in bounds[:-1]] == sorted(float(bound) for bound in bounds[:-1])
+    assert 'jellyfin_client_request_duration_seconds_count{handler="Users/{id}/Items/{id}",method="GET"} 5' in lines
+
+    assert 'handler="Odd\\"Path\\\\with\\nnewline"' in text
+    assert 'jellyfin_client_websocket_queue_depth 1' in lines
+    assert 'jellyfin_client_websocket_peak_queue_depth 3' in lines
+    assert '# TYPE jellyfin_client_websocket_peak_queue_depth gauge' in lines
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from jellyfin_apiclient_python.exceptions import HTTPException
+from jellyfin_apiclient_python.mirror import DATE_FORMAT, SYNC_MARGIN, LibraryMirror
+
+
+def test_full_sync(client):
+
+    mirror = LibraryMirror(client.jellyfin, page_size=300)
+
+    assert mirror.sync() == 1001
+    assert mirror.count() == 1001
+    assert mirror.last_sync is not None
+
+
+@pytest.mark.parametrize('failing', [r'/Views$', r'/Items$'])
+def test_failed_sync_keeps_the_mirror(client, server, failing):
+
+    mirror = LibraryMirror(client.jellyfin, page_size=300)
+    mirror.sync()
+    last_sync = mirror.last_sync
+    server.fail.add(failing)
+
+    with pytest.raises(HTTPException):
+        mirror.sync(full=True)
+
+    assert mirror.count() == 1001
+    assert mirror.last_sync == last_sync
+
+    server.fail.clear()
+    server.items.pop()
+
+    assert mirror.sync(full=True) == 1000 + 1  # 999 items and the view written, one removed
+    assert mirror.count() == 1000
+
+
+def test_last_sync_has_a_margin(client):
+
+    mirror = LibraryMirror(client.jellyfin)
+    mirror.sync()
+    synced = datetime.strptime(mirror.last_sync, DATE_FORMAT)
+
+    assert datetime.utcnow() - synced >= timedelta(seconds=SYNC_MARGIN)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+
+from jellyfin_apiclient_python.request_log import LazyJSON, iter_redacted, redact
+
+
+def test_matches_redacted_json():
+
+    payload = {'Items': [{'Id': 'a', 'UserData': {}}, []], 'AccessToken': 'secret', 'Pw': '', 3: None,
+               'Url': 'http://server/Videos/1/stream?api_key=secret&Static=true', 'Empty': ()}
+
+    assert "".join(iter_redacted(payload)) == json.dumps(redact(payload), indent=4, default=str)
+    assert 'secret' not in str(LazyJSON(payload))
+
+
+def test_truncation_stops_serializing():
+
+    rendered = []
+
+    class Value(object):
+        def __str__(self):
+            rendered.append(self)
+            return "value"
+
+    text = str(LazyJSON({'Items': [Value() for _ in range(10000)]}, 100))
+
+    assert text.endswith("(truncated at 100 characters)")
+    assert len(rendered) < 10
+
+
+def test_async_requests_log_redacted_headers(server, caplog):
+
+    from .test_async import run
+
+    async def test(api):
+        info = await api.validate_authentication_token({'address': server.url, 'AccessToken': 'secret-token'})
+        await api.login(server.url, 'user', 'secret-password')
+
+        return info
+
+    with caplog.at_level(logging.DEBUG, logger='JELLYFIN'):
+        run(server, test)
+
+    assert 'X-MediaBrowser-Token' in caplog.text
+    assert 'secret-token' not in caplog.text
+    assert 'secret-password' not in caplog.text
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from jellyfin_apiclient_python import retry
+from jellyfin_apiclient_python.retry import RetryPolicy, parse_retry_after
+
+NOW = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+class Clock(object):
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class FrozenDatetime(datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        return NOW.astimezone(tz) if tz else NOW.replace(tzinfo=None)
+
+    @classmethod
+    def utcnow(cls):
+        return NOW.replace(tzinfo=None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    clock = Clock()
+    monkeypatch.setattr(retry, 'time', clock)
+    monkeypatch.setattr(retry, 'random', random.Random(7))
+    monkeypatch.setattr(retry, 'datetime', FrozenDatetime)
+
+    return clock
+
+
+def test_full_jitter_bounds(clock):
+
+    policy = RetryPolicy(retries=10, base=0.5, cap=4, deadline=None)
+
+    for attempt in range(10):
+        ceiling = min(4, 0.5 * 2 ** attempt)
+        delays = [policy.delay(attempt, clock.now) for _ in range(200)]
+
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling * 0.9 and min(delays) < ceiling * 0.1
+
+    assert policy.delay(10, clock.now) is None
+
+
+def test_without_jitter_the_ceiling_is_used(clock):
+
+    policy = RetryPolicy(retries=4, base=1, cap=5, jitter=False)
+
+    assert [policy.delay(attempt, clock.now) for attempt in range(5)] == [1, 2, 4, 5, None]
+
+
+def test_deadline_cuts_retries(clock):
+
+    policy = RetryPolicy(retries=10, base=2, cap=2, deadline=10, jitter=False)
+    started = clock.now
+    clock.now += 7
+
+    assert policy.delay(0, started) == 2
+
+    clock.now += 1.5
+
+    assert policy.delay(1, started) is None
+    assert RetryPolicy(retries=10, base=2, cap=2, deadline=None, jitter=False).delay(1, started) == 2
+
+
+def test_retry_after_seconds(clock):
+
+    policy = RetryPolicy(deadline=60)
+
+    assert policy.delay(0, clock.now, status=503, retry_after="12") == 12
+    assert policy.delay(0, clock.now, status=429, retry_after="0") == 0
+    assert policy.delay(0, clock.now, status=503, retry_after="120") is None  # past the deadline
+    assert 0 <= policy.delay(0, clock.now, status=502, retry_after="12") <= 0.5  # ignored for 502
+    assert 0 <= policy.delay(0, clock.now, status=503, retry_after="soon") <= 0.5
+
+
+def test_retry_after_http_date(clock):
+
+    policy = RetryPolicy(deadline=60)
+    later = format_datetime(NOW + timedelta(seconds=30), usegmt=True)
+    earlier = format_datetime(NOW - timedelta(seconds=30), usegmt=True)
+
+    assert later.endswith("GMT")
+    assert policy.delay(0, clock.now, status=503, retry_after=later) == 30
+    assert policy.delay(0, clock.now, status=429, retry_after=earlier) == 0
+    assert parse_retry_after(format_datetime(NOW + timedelta(seconds=90))) == 90
+    assert parse_retry_after("Wed, 01 May 2024 12:00:45 -0000") == 45
+
+
+def test_status_not_retried(clock):
+    assert RetryPolicy().delay(0, clock.now, status=404) is None
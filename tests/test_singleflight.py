@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from jellyfin_apiclient_python.singleflight import SingleFlight
+
+
+def run_together(flight, call, release, callers=5):
+
+    ''' Runs callers concurrent flight.do('key', call), the leader blocked in call until every
+        follower is waiting on it. Returns the futures of the callers, leader first.
+    '''
+    executor = ThreadPoolExecutor(max_workers=callers)
+    futures = [executor.submit(flight.do, 'key', call)]
+
+    while not flight.calls:
+        threading.Event().wait(0.001)
+
+    futures += [executor.submit(flight.do, 'key', call) for _ in range(callers - 1)]
+
+    while flight.stats()['collapsed'] < callers - 1:
+        threading.Event().wait(0.001)
+
+    release.set()
+    executor.shutdown(wait=False)
+
+    return futures
+
+
+def test_concurrent_calls_collapse():
+
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return {'Items': []}
+
+    futures = run_together(flight, call, release)
+    results = [future.result(5) for future in futures]
+
+    assert len(calls) == 1
+    assert results[0] == ({'Items': []}, False)
+    assert all(result is results[0][0] and shared for result, shared in results[1:])
+    assert flight.stats() == {'leaders': 1, 'collapsed': 4, 'in_flight': 0}
+
+
+def test_error_reaches_every_caller():
+
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def call():
+        release.wait(5)
+        raise ValueError("boom")
+
+    futures = run_together(flight, call, release)
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(5)
+
+    assert flight.stats()['in_flight'] == 0
+    assert flight.do('key', lambda: 1) == (1, False)
+
+
+def test_base_exception_releases_callers():
+
+    flight = SingleFlight()
+    release = threading.Event()
+
+    class Stop(BaseException):
+        pass
+
+    def call():
+        release.wait(5)
+        raise Stop()
+
+    futures = run_together(flight, call, release, 2)
+
+    for future in futures:
+        with pytest.raises(Stop):
+            future.result(5)
+
+    assert flight.stats()['in_flight'] == 0
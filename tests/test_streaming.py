@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+from .server import FILE, GZIP_BODY
+
+
+def test_iter_stream_identity(client):
+    assert b''.join(bytes(view) for view in client.jellyfin.iter_stream("file")) == FILE
+
+
+def test_iter_stream_decodes_gzip(client):
+    assert b''.join(bytes(view) for view in client.jellyfin.iter_stream("gzip")) == GZIP_BODY
+
+
+def test_dest_file_decodes_gzip(client):
+
+    dest_file = io.BytesIO()
+    client.jellyfin.get_audio_stream(dest_file, "a1", "play", "mp3")
+
+    assert dest_file.getvalue() == GZIP_BODY
+
+
+def test_dest_buffer_decodes_gzip(client):
+
+    target = bytearray(len(GZIP_BODY))
+    client.jellyfin._get_stream("gzip", target)
+
+    assert bytes(target) == GZIP_BODY
+
+
+def test_download_mapped(client, tmp_path):
+
+    for handler, body in (("file", FILE), ("gzip", GZIP_BODY)):
+        path = str(tmp_path / handler)
+        client.jellyfin.download_mapped(handler, path)
+
+        with open(path, 'rb') as result:
+            assert result.read() == body
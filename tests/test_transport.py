@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import pytest
+
+from jellyfin_apiclient_python.transport import SharedAdapters
+
+from .conftest import make_client
+
+
+@pytest.fixture
+def clients(server):
+
+    pair = [make_client(server.url), make_client(server.url)]
+    yield pair
+
+    for client in pair:
+        client.http.stop_session()
+
+
+def host_pools(client):
+    return client.http.transport.generation.adapters['http://'].poolmanager.pools
+
+
+def test_clients_share_one_pool(clients):
+
+    first, second = clients
+
+    for client in (first, second, first, second):
+        client.jellyfin.get_views()
+
+    assert first.http.transport.generation.adapters is second.http.transport.generation.adapters
+    assert first.http.transport.session is not second.http.transport.session
+    assert SharedAdapters.entries[first.http.transport.generation.key][1] == 2
+    assert first.http.pool_stats() == dict(second.http.pool_stats(), misses=1, pools=1)
+
+
+def test_stop_leaves_the_other_pool(clients):
+
+    first, second = clients
+
+    for client in (first, second):
+        client.jellyfin.get_views()
+
+    key = second.http.transport.generation.key
+    pool, = [host_pools(second).get(key) for key in host_pools(second).keys()]
+    first.http.stop_session()
+
+    assert first.http.transport.generation is None
+    assert SharedAdapters.entries[key][1] == 1
+    assert [host_pools(second).get(key) for key in host_pools(second).keys()] == [pool]
+
+    second.jellyfin.get_views()
+
+    assert second.http.pool_stats()['misses'] == 1
+
+    second.http.stop_session()
+
+    assert key not in SharedAdapters.entries
+
+
+def test_reap_leaves_a_pool_in_use(clients):
+
+    first, second = clients
+    first.config.data['http.pool_idle_timeout'] = 0.2
+
+    for client in (first, second):
+        client.jellyfin.get_views()
+
+    time.sleep(0.3)
+    second.jellyfin.get_views()
+    first.http.transport.last_reap = 0
+
+    assert first.http.transport.reap_idle() == 0
+    assert len(host_pools(second)) == 1
+
+    second.jellyfin.get_views()
+
+    assert second.http.pool_stats()['misses'] == 1
+
+    time.sleep(0.3)
+    first.http.transport.last_reap = 0
+
+    assert first.http.transport.reap_idle() == 1  # idle for both clients
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+
+def test_messages_before_open_are_deduplicated(client):
+
+    got = []
+    client.callback = lambda message_type, data: got.append(message_type)
+    client.config.data['app.default'] = True
+    message = json.dumps({'MessageType': 'Play', 'MessageId': 'm1', 'Data': {}})
+
+    client.wsc.on_message(None, message)
+    client.wsc.on_message(None, message)
+
+    assert got == ['Play']
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+
+import pytest
+
+from jellyfin_apiclient_python.metrics import MetricsRegistry
+from jellyfin_apiclient_python.ws_dispatch import Dispatcher
+
+
+def wait_for(condition, timeout=5):
+
+    deadline = time.time() + timeout
+
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+
+    return condition()
+
+
+class Stalled(object):
+
+    ''' One worker, its handler held on the first message so the next ones stay queued.
+    '''
+    def __init__(self, overflow, queue_size=2):
+
+        self.metrics = MetricsRegistry()
+        self.dispatcher = Dispatcher(self.metrics, workers=1, queue_size=queue_size, overflow=overflow)
+        self.release = threading.Event()
+        self.handled = []
+        self.dispatcher.subscribe("UserDataChanged", self.handler)
+        self.dispatcher.put("UserDataChanged", 0)
+
+        assert wait_for(lambda: self.handled == [0])
+
+    def handler(self, message_type, data):
+
+        self.handled.append(data)
+        self.release.wait(5)
+
+    def dropped(self):
+        return self.metrics.snapshot()['websocket_dispatch']['handlers']['UserDataChanged']['dropped']
+
+    def finish(self, count):
+
+        self.release.set()
+        assert wait_for(lambda: len(self.handled) == count)
+        self.dispatcher.stop()
+
+
+def test_drop_oldest():
+
+    stalled = Stalled("drop_oldest")
+
+    assert [stalled.dispatcher.put("UserDataChanged", x) for x in (1, 2, 3, 4)] == [True] * 4
+    assert stalled.dispatcher.stats()['queued'] == 2
+
+    stalled.finish(3)
+
+    assert stalled.handled == [0, 3, 4]
+    assert stalled.dropped() == {'overflow': 2}
+
+
+def test_drop_newest():
+
+    stalled = Stalled("drop_newest")
+
+    assert [stalled.dispatcher.put("UserDataChanged", x) for x in (1, 2, 3, 4)] == [True, True, False, False]
+
+    stalled.finish(3)
+
+    assert stalled.handled == [0, 1, 2]
+    assert stalled.dropped() == {'overflow': 2}
+
+
+def test_block():
+
+    stalled = Stalled("block")
+    stalled.dispatcher.put("UserDataChanged", 1)
+    stalled.dispatcher.put("UserDataChanged", 2)
+    producer = threading.Thread(target=stalled.dispatcher.put, args=("UserDataChanged", 3))
+    producer.start()
+    producer.join(0.2)
+
+    assert producer.is_alive()
+
+    stalled.finish(4)
+    producer.join(5)
+
+    assert stalled.handled == [0, 1, 2, 3]
+    assert stalled.dropped() == {}
+    assert stalled.metrics.snapshot()['websocket_dispatch']['peak_queue_depth'] == 2
+
+
+def test_unsubscribed_types_are_not_queued():
+
+    stalled = Stalled("drop_oldest")
+
+    assert stalled.dispatcher.put("Play", {}) is False
+    assert stalled.dispatcher.stats()['queued'] == 0
+    assert stalled.metrics.snapshot()['websocket_dispatch']['handlers']['Play']['dropped'] == {'unsubscribed': 1}
+
+    stalled.finish(1)
+
+
+def test_messages_of_a_type_stay_in_order():
+
+    dispatcher = Dispatcher(MetricsRegistry(), workers=4, queue_size=4000, overflow="block")
+    handled = {}
+    lock = threading.Lock()
+    types = ["LibraryChanged", "UserDataChanged", "Play", "Playstate", "GeneralCommand", "RefreshProgress"]
+    jitter = random.Random(3)
+
+    def handler(message_type, data):
+        time.sleep(jitter.random() / 2000)
+
+        with lock:
+            handled.setdefault(message_type, []).append(data)
+
+    dispatcher.subscribe("*", handler)
+
+    for index in range(1200):
+        dispatcher.put(types[index % len(types)], index)
+
+    assert wait_for(lambda: sum(len(x) for x in handled.values()) == 1200)
+    dispatcher.stop()
+
+    for offset, message_type in enumerate(types):
+        assert handled[message_type] == list(range(offset, 1200, len(types)))
+
+
+def test_unknown_overflow_policy():
+
+    with pytest.raises(ValueError):
+        Dispatcher(MetricsRegistry(), overflow="drop_all")
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+
+from jellyfin_apiclient_python.ws_hub import WebSocketHub
+
+
+class StalledClient(object):
+
+    ''' A WSClient whose server accepts the connection and never answers the upgrade.
+    '''
+    def __init__(self, port):
+
+        self.stop = False
+        self.port = port
+        self.errors = []
+        self.disconnected = threading.Event()
+        self.reconnect = self
+
+    def get_url(self):
+        return "ws://127.0.0.1:%d/socket" % self.port
+
+    def get_sslopt(self):
+        return None
+
+    def on_error(self, ws, error):
+        self.errors.append(error)
+
+    def on_disconnect(self, final=False):
+
+        self.disconnected.set()
+
+        return None
+
+    def stopped(self):
+        pass
+
+
+def test_connect_does_not_block_the_hub():
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    hub = WebSocketHub(timeout=2)
+    wsclient = StalledClient(listener.getsockname()[1])
+    ran = threading.Event()
+
+    try:
+        hub.add(wsclient)
+        hub.call_soon(ran.set)
+
+        assert ran.wait(0.5)
+        assert wsclient.disconnected.wait(5)
+        assert wsclient.errors
+    finally:
+        hub.close()
+        hub.join(5)
+        listener.close()